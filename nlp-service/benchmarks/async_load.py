@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Concurrent /search throughput of one worker with the asyncio Elasticsearch
+client vs the blocking one.
+
+Starts a stub Elasticsearch with --latency per search, serves nlp.main2:app
+from one uvicorn worker with an extra /search-blocking route (the old
+handler: blocking SimpleElasticsearch call inside ``async def``) and fires
+--concurrency parallel requests at each route.
+
+Run from nlp-service/:
+
+    python -m benchmarks.async_load --requests 2000 --concurrency 50 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.pipeline_profiles import percentile
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(port):
+    """Child process: the API plus the blocking route, on one worker."""
+    import uvicorn
+    from fastapi import Query
+
+    from nlp.es_query import search_products
+    from nlp.main2 import app, parse_query, to_search_kwargs
+
+    @app.get("/search-blocking")
+    async def search_blocking(q: str = Query(..., min_length=1)):
+        results = search_products(**to_search_kwargs(parse_query(q)))
+        return {"total": len(results), "results": results}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def load(url, route, total, concurrency):
+    import httpx
+
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(REPRESENTATIVE_QUERIES[i % len(REPRESENTATIVE_QUERIES)])
+    samples = []
+
+    async def worker(client):
+        while not queue.empty():
+            q = queue.get_nowait()
+            t0 = time.perf_counter()
+            response = await client.get(f"{url}{route}", params={"q": q})
+            response.raise_for_status()
+            samples.append((time.perf_counter() - t0) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed, percentile(samples, 50), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub Elasticsearch search latency (s)")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve)
+
+    import requests
+
+    # Stub, API and load generator each get their own process (and GIL)
+    es_port, port = free_port(), free_port()
+    stub = subprocess.Popen([sys.executable, "-m", "benchmarks.stub_es", "--port", str(es_port),
+                             "--latency", str(args.latency)], stdout=subprocess.DEVNULL)
+    time.sleep(1)
+    env = dict(os.environ, ELASTICSEARCH_HOST=f"http://127.0.0.1:{es_port}", SYNONYM_RELOAD_INTERVAL="0",
+               ES_ASYNC_MAX_KEEPALIVE=str(max(args.concurrency, 20)))
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.async_load", "--serve", str(port)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(120):
+            try:
+                if requests.get(f"{url}/lists", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                time.sleep(0.5)
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, "
+              f"stub search latency {args.latency * 1000:.0f} ms, 1 worker")
+        print(f"{'handler':16} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for label, route in (("blocking", "/search-blocking"), ("asyncio", "/search")):
+            asyncio.run(load(url, route, min(200, args.requests), args.concurrency))  # warm-up
+            qps, p50, p99 = asyncio.run(load(url, route, args.requests, args.concurrency))
+            print(f"{label:16} {qps:8.1f} {p50:8.1f} {p99:8.1f}")
+    finally:
+        proc.terminate()
+        stub.terminate()
+        proc.wait()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Throughput of parse_queries (nlp.pipe) against parse_query in a loop.
+
+Run from nlp-service/:
+
+    python -m benchmarks.batch_parsing --count 20000 --batch-size 256
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+from nlp.query_parser import parse_query, parse_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=20000, help="number of queries to parse")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-process", type=int, default=1)
+    args = parser.parse_args()
+
+    queries = list(itertools.islice(itertools.cycle(REPRESENTATIVE_QUERIES), args.count))
+
+    start = time.perf_counter()
+    for q in queries:
+        parse_query(q)
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in parse_queries(queries, batch_size=args.batch_size, n_process=args.n_process):
+        pass
+    batch_s = time.perf_counter() - start
+
+    print(f"{args.count} queries, batch_size={args.batch_size}, n_process={args.n_process}")
+    print(f"parse_query loop : {args.count / loop_s:>9.0f} queries/s ({loop_s:.2f}s)")
+    print(f"parse_queries    : {args.count / batch_s:>9.0f} queries/s ({batch_s:.2f}s)")
+    print(f"speedup          : {loop_s / batch_s:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
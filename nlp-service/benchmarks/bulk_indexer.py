@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Bulk indexing throughput: one _bulk request for the whole catalog (the old
+data_loader path) against the streaming BulkIndexer, sequential and with
+several chunks in flight.
+
+Generates --docs synthetic MongoDB products (with ObjectIds), turns them
+into actions with MongoDBLoader.product_actions and indexes them into a
+local stub Elasticsearch that spends --bulk-latency seconds per 1000
+documents and rejects --item-reject-rate of the bulk items with 429
+(--memory adds each run's peak memory). The streaming run is then repeated
+with the same products to show that the _ids make a rerun overwrite
+instead of duplicate.
+
+Run from nlp-service/:
+
+    python -m benchmarks.bulk_indexer --docs 20000 --item-reject-rate 0.02
+"""
+
+import argparse
+import os
+import random
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from nlp import es_query
+from nlp.data_loader import MongoDBLoader
+
+LOADER = MongoDBLoader("mongodb://localhost:27017")
+
+
+def mongo_products(count, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "_id": ObjectId(f"{i:024x}"),
+            "name": f"Running Shoe {i}",
+            "description": "Breathable mesh upper, cushioned midsole and a durable rubber outsole.",
+            "category": rng.choice(["Shoe", "Shirt", "Jeans", "Jacket"]),
+            "brand": rng.choice(["Nike", "Adidas", "Puma", "Zara"]),
+            "color": rng.choice(["Black", "White", "Red", "Blue"]),
+            "gender": rng.choice(["Men", "Women", "Unisex"]),
+            "price": str(rng.randrange(500, 10000)),
+            "rating": round(rng.uniform(1, 5), 1),
+            "discount": rng.randrange(0, 60),
+            "count": rng.randrange(0, 100),
+        }
+
+
+def single_request(docs):
+    """The old loader: fetch everything, transform everything, one _bulk."""
+    start = time.perf_counter()
+    actions = [{"_index": es_query.INDEX_NAME, "_source": LOADER.transform_product(product)}
+               for product in list(mongo_products(docs))]
+    result = es_query.bulk_index(es_query.es, actions)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for item in result["items"] if item["index"]["status"] >= 300)
+    return {"indexed": docs - failed, "failed": failed, "retried": 0, "chunks": 1, "elapsed": elapsed}
+
+
+def streaming(docs, **options):
+    report = es_query.bulk_index_stream(LOADER.product_actions(mongo_products(docs)), verbose=False, **options)
+    return report.as_dict()
+
+
+def measure(label, memory, fn, *args, **kwargs):
+    handler = STUB.RequestHandlerClass
+    handler.documents.clear()
+    result = fn(*args, **kwargs)
+    distinct = len(handler.documents)
+    line = (f"{label:<30} {result['indexed'] / result['elapsed']:>6.0f} docs/s  {result['elapsed']:>6.2f}s  "
+            f"chunks {result['chunks']:>3}  retried {result['retried']:>4}  failed {result['failed']:>4}  "
+            f"distinct docs {distinct}")
+    if memory:
+        # A second run, traced: tracemalloc slows everything down too much to time
+        tracemalloc.start()
+        fn(*args, **kwargs)
+        line += f"  peak {tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB"
+        tracemalloc.stop()
+    print(line)
+    return distinct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--bulk-latency", type=float, default=0.2, help="stub seconds per 1000 documents")
+    parser.add_argument("--item-reject-rate", type=float, default=0.02)
+    parser.add_argument("--chunk-docs", type=int, default=500)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--memory", action="store_true", help="also report peak traced memory (reruns each case)")
+    args = parser.parse_args()
+
+    handler = STUB.RequestHandlerClass
+    handler.bulk_latency = args.bulk_latency
+    handler.item_reject_rate = args.item_reject_rate
+    print(f"{args.docs} products, stub {args.bulk_latency}s per 1000 docs, "
+          f"{args.item_reject_rate:.0%} of items rejected with 429\n")
+
+    measure("single _bulk request", args.memory, single_request, args.docs)
+    options = dict(chunk_docs=args.chunk_docs, retry_backoff=0.05)
+    measure("stream, 1 chunk in flight", args.memory, streaming, args.docs, max_in_flight=1, **options)
+    before = measure(f"stream, {args.in_flight} chunks in flight", args.memory, streaming, args.docs,
+                     max_in_flight=args.in_flight, **options)
+
+    # Same products again, without clearing the stub: the _ids overwrite
+    streaming(args.docs, max_in_flight=args.in_flight, **options)
+    print(f"\nrerun with the same _ids: {before} -> {len(handler.documents)} distinct documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Synthetic /search query corpus built from synonym.json and the parser's
+seed attribute lists.
+
+Queries mix categories, brands, colors and genders (canonical or synonym,
+single or multi-word), price phrases, typos and filler words, so the
+parser's every stage gets exercised. The same seed always gives the same
+corpus.
+"""
+
+import json
+import random
+
+from nlp.config import PARSER_CONFIG
+from nlp.query_parser import DEFAULT_BRANDS, DEFAULT_CATEGORIES, DEFAULT_COLORS, DEFAULT_GENDERS
+
+FILLER_WORDS = [
+    "comfortable", "durable", "cheap", "best", "new", "latest", "stylish", "wireless", "waterproof",
+    "casual", "formal", "lightweight", "premium", "original", "sale", "offer", "combo", "pack",
+]
+
+GENDER_PHRASES = ["for {}", "{}", "{}'s"]
+
+
+def _terms(section, canonical):
+    """Canonical terms plus every synonym listed for them in a synonym.json section."""
+    terms = list(canonical)
+    for key, synonyms in section.items():
+        terms.append(key)
+        terms.extend(s.lower() for s in synonyms)
+    return list(dict.fromkeys(t.lower() for t in terms))
+
+
+def price_phrase(rng):
+    low = rng.choice([299, 499, 999, 1500, 2000, 5000, 10000])
+    form = rng.randrange(6)
+    if form == 0:
+        return f"between {low} and {low * rng.choice([2, 3, 5])}"
+    return [f"under {low}", f"below {low}", f"less than {low}", f"above {low}", f"upto {low}"][form - 1]
+
+
+def typo(word, rng):
+    """One random delete / swap / replace / insert, for words long enough to survive it."""
+    if len(word) < 4 or " " in word:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    op = rng.randrange(4)
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    if op == 0:
+        return word[:i] + word[i + 1:]
+    if op == 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if op == 2:
+        return word[:i] + letter + word[i + 1:]
+    return word[:i] + letter + word[i:]
+
+
+class CorpusBuilder:
+    def __init__(self, synonym_path=None, seed=42):
+        with open(synonym_path or PARSER_CONFIG["synonym_path"], "r") as f:
+            synonyms = json.load(f)
+        self.rng = random.Random(seed)
+        self.categories = _terms(synonyms.get("categories", {}), DEFAULT_CATEGORIES)
+        self.brands = _terms(synonyms.get("brands", {}), DEFAULT_BRANDS)
+        self.colors = _terms(synonyms.get("colors", {}), DEFAULT_COLORS)
+        self.genders = _terms(synonyms.get("genders", {}), DEFAULT_GENDERS)
+        self.phrases = _terms(synonyms.get("phrases", {}), [])
+        self.multi_word = [t for t in self.categories + self.brands + self.colors + self.phrases if " " in t]
+
+    def query(self):
+        rng = self.rng
+        parts = []
+        if rng.random() < 0.5:
+            parts.append(rng.choice(self.colors))
+        if rng.random() < 0.6:
+            parts.append(rng.choice(self.brands))
+        if rng.random() < 0.2:
+            parts.append(rng.choice(self.multi_word))
+        parts.append(rng.choice(self.categories + self.phrases))
+        if rng.random() < 0.2:
+            parts.insert(0, rng.choice(FILLER_WORDS))
+        if rng.random() < 0.4:
+            parts.append(rng.choice(GENDER_PHRASES).format(rng.choice(self.genders)))
+        if rng.random() < 0.4:
+            parts.append(price_phrase(rng))
+        if rng.random() < 0.25:
+            i = rng.randrange(len(parts))
+            parts[i] = typo(parts[i], rng)
+        return " ".join(parts)
+
+    def build(self, count):
+        return [self.query() for _ in range(count)]
+
+
+def synthetic_corpus(count, seed=42, synonym_path=None):
+    return CorpusBuilder(synonym_path, seed).build(count)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+/search tail latency against a faulty Elasticsearch: request deadlines,
+hedged searches and the circuit breaker.
+
+Runs --requests /search calls, --concurrency at a time, through the ASGI app
+against a local stub Elasticsearch whose searches take --latency, except
+--slow-rate of them which take --slow-latency:
+
+- no deadline: the slow searches set p99
+- a --deadline: p99 is bounded, the slow searches become 504s
+- the deadline plus hedging after the --hedge-percentile latency: the
+  slow searches are answered by their hedge
+
+Then the stub stalls every search (an outage) after the cache was warmed
+and invalidated by a write, with the breaker off and on: without it each
+request waits out its deadline before falling back to the stale cached
+page; with it the breaker opens and requests fail over at once.
+
+Run from nlp-service/:
+
+    python -m benchmarks.deadlines --requests 1000 --slow-rate 0.03 --slow-latency 3
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+import httpx
+
+from benchmarks.pipeline_profiles import percentile
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+from nlp import main2
+from nlp.es_async import ASYNC_SEARCH_FLIGHT, async_es
+from nlp.es_query import ES_BREAKER, INDEX_NAME, RESULT_CACHE, SEARCH_FLIGHT
+from nlp.resilience import LatencyWindow
+
+# Distinct searches, so neither single-flight nor the cache hides the stub
+for flight in (main2.SEARCH_HANDLER_FLIGHT, ASYNC_SEARCH_FLIGHT, SEARCH_FLIGHT):
+    flight.enabled = False
+
+
+def requests(count):
+    return [{"q": REPRESENTATIVE_QUERIES[i % len(REPRESENTATIVE_QUERIES)], "size": 10 + i // len(REPRESENTATIVE_QUERIES)}
+            for i in range(count)]
+
+
+async def load(params_list, concurrency):
+    queue = asyncio.Queue()
+    for params in params_list:
+        queue.put_nowait(params)
+    samples, outcomes = [], {}
+
+    async def worker(client):
+        while not queue.empty():
+            params = queue.get_nowait()
+            t0 = time.perf_counter()
+            response = await client.get("/search", params=params)
+            samples.append((time.perf_counter() - t0) * 1000)
+            outcome = str(response.status_code)
+            if response.status_code == 200 and response.json().get("stale"):
+                outcome = "stale"
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            # In-process calls answered without I/O (breaker open) never
+            # yield; a real client's socket would
+            await asyncio.sleep(0)
+
+    transport = httpx.ASGITransport(app=main2.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return samples, outcomes
+
+
+async def run(label, params_list, concurrency):
+    counts = STUB.RequestHandlerClass.counts
+    counts.clear()
+    hedges = async_es.hedges
+    samples, outcomes = await load(params_list, concurrency)
+    print(f"{label:<28} p50 {percentile(samples, 50):>7.1f}  p99 {percentile(samples, 99):>7.1f}  "
+          f"max {max(samples):>7.1f} ms   ES searches {counts.get('search', 0):>5}  "
+          f"hedges {async_es.hedges - hedges:>4}   "
+          + "  ".join(f"{k}: {v}" for k, v in sorted(outcomes.items())))
+
+
+async def scenarios(args):
+    handler = STUB.RequestHandlerClass
+    handler.latency, handler.slow_rate, handler.slow_latency = args.latency, args.slow_rate, args.slow_latency
+    load_requests = requests(args.requests)
+    print(f"{args.requests} searches, {args.concurrency} concurrent; stub {args.latency * 1000:.0f} ms, "
+          f"{args.slow_rate:.0%} take {args.slow_latency:.1f} s\n")
+
+    RESULT_CACHE.max_bytes = 0
+    ES_BREAKER.enabled = False
+    main2.SEARCH_DEADLINE = 0
+    await run("no deadline", load_requests, args.concurrency)
+    main2.SEARCH_DEADLINE = args.deadline
+    await run(f"deadline {args.deadline}s", load_requests, args.concurrency)
+    async_es.hedge_percentile = args.hedge_percentile
+    async_es.search_latency = LatencyWindow()
+    await run(f"deadline + hedge p{args.hedge_percentile:g}", load_requests, args.concurrency)
+    async_es.hedge_percentile = 0
+
+    print("\noutage: every search stalls; cache warmed, then invalidated by a write")
+    for enabled in (False, True):
+        RESULT_CACHE.max_bytes = 64 * 1024 * 1024
+        RESULT_CACHE.clear()
+        handler.slow_rate = 0.0
+        ES_BREAKER.enabled = False
+        await run("  warm cache", load_requests, args.concurrency)
+        RESULT_CACHE.bump(INDEX_NAME)
+        handler.slow_rate = 1.0
+        ES_BREAKER.enabled = enabled
+        await run(f"  breaker {'on' if enabled else 'off'}", load_requests, args.concurrency)
+    print(f"\nbreaker: {ES_BREAKER.stats()}")
+    await async_es.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub search latency (s)")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="fraction of slow searches")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="seconds a slow search takes")
+    parser.add_argument("--deadline", type=float, default=0.5)
+    parser.add_argument("--hedge-percentile", type=float, default=90)
+    asyncio.run(scenarios(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
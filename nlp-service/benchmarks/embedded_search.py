@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+The embedded search backend (SEARCH_BACKEND=embedded): load time, result
+parity and /search latency with no Elasticsearch at all.
+
+Generates --docs synthetic MongoDB products, turns them into documents
+with MongoDBLoader.transform_product and loads them into the embedded
+index. Then:
+
+- parity: every representative query, parsed, is searched through
+  es_query.search_page and by a brute-force reference that filters the
+  raw products and scores each one in plain Python; the top --size hits
+  must be the same products in the same order, and walking the results
+  by cursor must give the same list as one deep page
+- engine: search_page latency with the result cache off
+- API: /search through the ASGI app, --concurrency at a time, with the
+  result cache off (every request searches) and on
+- writes: products indexed with read_your_writes, each then found by
+  /search, and the segments this leaves behind
+
+Run from nlp-service/:
+
+    python -m benchmarks.embedded_search --docs 50000 --requests 2000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import os
+import random
+import time
+
+os.environ["SEARCH_BACKEND"] = "embedded"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+import httpx
+import numpy as np
+from bson import ObjectId
+
+from benchmarks.pipeline_profiles import percentile
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+from nlp import main2
+from nlp.data_loader import MongoDBLoader
+from nlp.embedded_search import BM25_K1, BM25_B, analyze, fuzzy_distance
+from nlp.es_async import ASYNC_SEARCH_FLIGHT
+from nlp.es_query import (
+    INDEX_NAME, RESULT_CACHE, SEARCH_FLIGHT, build_search_body, decode_cursor, es, search_page, to_search_kwargs,
+)
+from nlp.query_compiler import TEXT_CLAUSES, KEYWORD_FIELDS, ParsedQuery
+from nlp.query_parser import DEFAULT_BRANDS, DEFAULT_CATEGORIES, DEFAULT_COLORS, DEFAULT_GENDERS, parse_query
+
+LOADER = MongoDBLoader("mongodb://localhost:27017")
+
+WORDS = ["running", "casual", "sports", "leather", "wireless", "classic", "lightweight", "premium", "slim",
+         "waterproof", "mesh", "cushioned", "formal", "trail", "smart", "pro", "max", "lite", "air", "ultra"]
+
+
+def mongo_products(count, seed=11):
+    rng = random.Random(seed)
+    for i in range(count):
+        brand, category, color = rng.choice(DEFAULT_BRANDS), rng.choice(DEFAULT_CATEGORIES), rng.choice(DEFAULT_COLORS)
+        yield {
+            "_id": ObjectId(f"{i:024x}"),
+            "name": f"{brand.title()} {' '.join(rng.sample(WORDS, 2))} {color} {category}",
+            "description": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(6, 20))) + f" {category}.",
+            "category": category,
+            "brand": brand,
+            "color": color,
+            "gender": rng.choice(DEFAULT_GENDERS),
+            "price": str(rng.randrange(200, 60000)),
+            "rating": round(rng.uniform(1, 5), 1),
+            "discount": rng.randrange(0, 60),
+            "count": rng.randrange(0, 100),
+        }
+
+
+def reference_search(products, parsed, size):
+    """
+    (_id, score) of the top size products: the filters applied to the raw
+    products, every match scored with BM25 in plain Python, the whole list
+    sorted. Fuzzy expansions and document frequencies come from the index.
+    """
+    view = es.indices[INDEX_NAME].view
+    matches = []
+    for docno, (doc_id, product) in enumerate(products):
+        if any(values and product.get(field) not in values
+               for field, values in zip(KEYWORD_FIELDS, (parsed.category, parsed.color, parsed.brand, parsed.gender))):
+            continue
+        price = product["price"]
+        if any(not {"gt": price > bound, "gte": price >= bound, "lt": price < bound, "lte": price <= bound}[op]
+               for op, bound in parsed.price.items()):
+            continue
+        score = 0.0
+        for clause in TEXT_CLAUSES if parsed.text else ():
+            best = 0.0
+            for spec in clause["fields"]:
+                field, _, boost = spec.partition("^")
+                keyword = field in KEYWORD_FIELDS
+                doc_count, avg_length = view.field_stats(field)
+                tokens = [product[field]] if keyword else analyze(product[field])
+                field_score = 0.0
+                for term in [parsed.text] if keyword else analyze(parsed.text):
+                    distance = fuzzy_distance(term, clause["fuzziness"])
+                    expansions = (view.expand(field, term, distance, clause["prefix_length"], clause["max_expansions"])
+                                  if distance else [(term, 1.0)])
+                    frequencies = [view.doc_freq(field, t) for t, _ in expansions]
+                    if not any(frequencies):
+                        continue
+                    idf = math.log(1 + (doc_count - max(frequencies) + 0.5) / (max(frequencies) + 0.5))
+                    norm = 1.0 if keyword else 1 - BM25_B + BM25_B * len(tokens) / avg_length
+                    for t, fuzzy_boost in expansions:
+                        tf = tokens.count(t)
+                        if tf:
+                            field_score += float(boost or 1) * fuzzy_boost * idf * tf / (tf + BM25_K1 * norm)
+                best = max(best, field_score)
+            score += best
+        score = float(np.float32(score))
+        matches.append(((-score, -product["rating"], -product["discount"], math.trunc(price), docno), doc_id, score))
+    matches.sort()
+    return [(doc_id, score) for _, doc_id, score in matches[:size]]
+
+
+def check_parity(products, queries, size):
+    mismatches = 0
+    for query in queries:
+        kwargs = to_search_kwargs(parse_query(query))
+        parsed = ParsedQuery.from_search_kwargs(**kwargs)
+        page = es.search(INDEX_NAME, build_search_body(**kwargs, size=size))["hits"]["hits"]
+        got = [(hit["_id"], hit["_score"]) for hit in page]
+        expected = reference_search(products, parsed, size)
+        if [i for i, _ in got] != [i for i, _ in expected] or any(
+                not math.isclose(a, b, rel_tol=1e-5) for (_, a), (_, b) in zip(got, expected)):
+            mismatches += 1
+            print(f"  mismatch for {query!r}: {got[:3]} vs {expected[:3]}")
+    print(f"parity: {len(queries) - mismatches}/{len(queries)} queries return the reference's top {size}")
+
+    # The query with the most matches, walked 20 at a time
+    kwargs = max((to_search_kwargs(parse_query(q)) for q in queries), key=lambda k: search_page(**k, size=0)["total"])
+    deep = [p["name"] for p in search_page(**kwargs, size=200)["results"]]
+    walked, cursor = [], None
+    while len(walked) < len(deep):
+        page = search_page(**kwargs, size=20, search_after=decode_cursor(cursor) if cursor else None)
+        walked += [p["name"] for p in page["results"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    print(f"cursor pages match one deep page: {walked[:len(deep)] == deep} ({len(deep)} products)")
+
+
+def engine_latency(queries, rounds):
+    RESULT_CACHE.max_bytes = 0
+    searches = [to_search_kwargs(parse_query(q)) for q in queries]
+    samples = []
+    for _ in range(rounds):
+        for kwargs in searches:
+            t0 = time.perf_counter()
+            search_page(**kwargs, size=10)
+            samples.append((time.perf_counter() - t0) * 1000)
+    print(f"{'search_page, no cache':<28} p50 {percentile(samples, 50):>6.2f}  p99 {percentile(samples, 99):>6.2f} ms"
+          f"   {len(samples) / (sum(samples) / 1000):>6.0f} searches/s")
+
+
+async def api_load(label, params_list, concurrency):
+    queue = asyncio.Queue()
+    for params in params_list:
+        queue.put_nowait(params)
+    samples, errors = [], 0
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            params = queue.get_nowait()
+            t0 = time.perf_counter()
+            response = await client.get("/search", params=params)
+            samples.append((time.perf_counter() - t0) * 1000)
+            errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=main2.app)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # /search prints every parse
+        async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=60) as client:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} p50 {percentile(samples, 50):>6.2f}  p99 {percentile(samples, 99):>6.2f} ms"
+          f"   {len(samples) / elapsed:>6.0f} requests/s   errors {errors}")
+
+
+async def writes(count):
+    found = 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main2.app), base_url="http://api") as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(count):
+                name = f"zqx{i:04d} trail shoes"
+                response = await client.post("/add-product", json={
+                    "name": name, "description": "new arrival", "category": "shoes", "color": "green",
+                    "brand": "nike", "gender": "men", "price": 999, "rating": 5.0, "stock": 1, "discount": 0,
+                }, params={"read_your_writes": "true"})
+                if response.status_code >= 300:
+                    continue
+                page = (await client.get("/search", params={"q": f"zqx{i:04d}", "size": 1,
+                                                            "read_your_writes": "true"})).json()
+                # /add-product stores lemmatized fields ("shoes" -> "shoe")
+                found += bool(page["results"]) and page["results"][0]["name"].startswith(f"zqx{i:04d}")
+    print(f"writes: {found}/{count} new products found by the next read_your_writes search; "
+          f"index {es.stats()[INDEX_NAME]}")
+
+
+async def scenarios(args, queries):
+    params = [{"q": queries[i % len(queries)], "size": 10 + i // len(queries)} for i in range(args.requests)]
+    RESULT_CACHE.max_bytes = 0
+    await api_load("/search, no cache", params, args.concurrency)
+    RESULT_CACHE.max_bytes = 64 * 1024 * 1024
+    await api_load("/search, cache warm-up", params, args.concurrency)
+    await api_load("/search, cached", params, args.concurrency)
+    await writes(args.writes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--size", type=int, default=10, help="hits compared per parity query")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the queries for engine latency")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--writes", type=int, default=20)
+    args = parser.parse_args()
+
+    for flight in (main2.SEARCH_HANDLER_FLIGHT, ASYNC_SEARCH_FLIGHT, SEARCH_FLIGHT):
+        flight.enabled = False
+    queries = list(REPRESENTATIVE_QUERIES)
+
+    start = time.perf_counter()
+    products = [(str(p["_id"]), LOADER.transform_product(p)) for p in mongo_products(args.docs)]
+    transformed = time.perf_counter() - start
+    start = time.perf_counter()
+    es.load(INDEX_NAME, ({"_id": doc_id, **product} for doc_id, product in products))
+    loaded = time.perf_counter() - start
+    print(f"{args.docs} products: transform {transformed:.2f}s, load into the embedded index {loaded:.2f}s "
+          f"({args.docs / loaded:.0f} docs/s)\n")
+
+    check_parity(products, queries, args.size)
+    print()
+    engine_latency(queries, args.rounds)
+    asyncio.run(scenarios(args, queries))
+
+
+if __name__ == "__main__":
+    main()
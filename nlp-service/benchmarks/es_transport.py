@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+SimpleElasticsearch transport settings against a local stub Elasticsearch.
+
+Three runs, each comparing the old default session with the tuned one
+built from ELASTICSEARCH_CONFIG:
+
+  bulk     --products synthetic products in _bulk chunks of --chunk, with
+           and without gzip request bodies (bytes sent, bytes received)
+  pool     --threads threads sharing one client for --searches searches
+           (connections the stub had to accept, qps)
+  retries  --searches searches while the stub rejects --reject-rate of
+           them with 429 (searches that failed)
+
+Run from nlp-service/:
+
+    python -m benchmarks.es_transport --products 20000 --threads 32
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub(latency=0.002)
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from nlp import config
+from nlp.es_query import SimpleElasticsearch
+
+HOST = os.environ["ELASTICSEARCH_HOST"]
+QUERY = {"query": {"bool": {"must": [{"match": {"category": "shoe"}}]}}, "size": 10}
+
+
+def tuned(**overrides):
+    es_config = config.ELASTICSEARCH_CONFIG
+    settings = dict(
+        pool_connections=es_config['pool_connections'],
+        pool_maxsize=es_config['pool_maxsize'],
+        compress=es_config['compress_requests'],
+        compress_min_bytes=es_config['compress_min_bytes'],
+        compress_level=es_config['compress_level'],
+        max_retries=es_config['max_retries'],
+        retry_backoff=es_config['retry_backoff'],
+        retry_statuses=es_config['retry_statuses'],
+        timeout=es_config['timeout'],
+    )
+    settings.update(overrides)
+    return SimpleElasticsearch(HOST, '', '', **settings)
+
+
+def default():
+    """The client as it was: default pool, no compression, no retries."""
+    return SimpleElasticsearch(HOST, '', '')
+
+
+def products(count, seed=42):
+    rng = random.Random(seed)
+    brands = ["nike", "adidas", "puma", "reebok", "levis", "zara", "h&m", "uniqlo"]
+    categories = ["shoe", "shirt", "jeans", "jacket", "dress", "watch"]
+    colors = ["black", "white", "red", "blue", "green", "grey"]
+    for i in range(count):
+        brand, category, color = rng.choice(brands), rng.choice(categories), rng.choice(colors)
+        yield {
+            "_index": "products",
+            "_source": {
+                "name": f"{brand} {color} {category} {i}",
+                "description": f"Comfortable {color} {category} by {brand}, regular fit, everyday wear.",
+                "category": category, "brand": brand, "color": color,
+                "gender": rng.choice(["men", "women", "unisex"]),
+                "price": float(rng.randrange(299, 9999)), "rating": round(rng.uniform(3, 5), 1),
+                "discount": rng.randrange(0, 60), "stock": rng.randrange(0, 500),
+                "photo_links": [f"https://cdn.example.com/p/{i}/{n}.jpg" for n in range(3)],
+            },
+        }
+
+
+def reset():
+    counts = STUB.RequestHandlerClass.counts
+    counts.clear()
+    return counts
+
+
+def run_bulk(label, client, count, chunk):
+    actions = list(products(count))
+    counts = reset()
+    start = time.perf_counter()
+    for i in range(0, len(actions), chunk):
+        client.bulk(actions[i:i + chunk])
+    elapsed = time.perf_counter() - start
+    print(f"  {label:10} {counts['bytes_in'] / 1e6:9.2f} MB sent {counts['bytes_out'] / 1e6:7.2f} MB received "
+          f"{count / elapsed:9.0f} docs/s")
+
+
+def run_pool(label, client, searches, threads):
+    counts = reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda _: client.search("products", QUERY), range(searches)))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:10} {counts['connections']:6d} connections {searches / elapsed:9.0f} qps")
+
+
+def run_retries(label, client, searches):
+    counts = reset()
+    failed = 0
+    for _ in range(searches):
+        try:
+            client.search("products", QUERY)
+        except Exception:
+            failed += 1
+    print(f"  {label:10} {failed:6d} failed of {searches} ({counts.get('rejected', 0)} rejections seen)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=500)
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--reject-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"bulk: {args.products} products, {args.chunk} per request")
+    run_bulk("plain", default(), args.products, args.chunk)
+    run_bulk("gzip", tuned(), args.products, args.chunk)
+
+    print(f"pool: {args.searches} searches from {args.threads} threads, stub search 2 ms")
+    run_pool("default", default(), args.searches, args.threads)
+    run_pool("tuned", tuned(), args.searches, args.threads)
+
+    print(f"retries: {args.searches // 4} searches, {args.reject_rate:.0%} answered 429")
+    STUB.RequestHandlerClass.reject_rate = args.reject_rate
+    run_retries("none", default(), args.searches // 4)
+    run_retries("backoff", tuned(retry_backoff=0.01), args.searches // 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Per-token extractOne matching vs the vectorized AttributeMatcher, with and
+without the SymSpell deletion index, as the brand vocabulary grows.
+
+Run from nlp-service/:
+
+    python -m benchmarks.fuzzy_matcher --sizes 25,1000,10000,50000
+"""
+
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Levenshtein
+
+from nlp.fuzzy_matcher import AttributeMatcher
+from nlp.symspell import DeletionIndex
+from nlp.query_parser import VOCABULARY
+
+_vocab = VOCABULARY.snapshot
+CATEGORIES = list(_vocab.categories)
+COLORS = list(_vocab.colors)
+GENDERS = list(_vocab.genders)
+BRANDS = list(_vocab.brands)
+
+
+# The per-token matching query_parser did before AttributeMatcher; the
+# vectorized results must be the same
+def fuzzy_match(token, choices, threshold=60):
+    match, score, _ = process.extractOne(token, choices, scorer=fuzz.ratio)
+    return match if score >= threshold else None
+
+
+def fuzzy_match_brand(token, choices, categories=CATEGORIES, threshold=80):
+    """Brand fuzzy matching with category safety and higher thresholds."""
+    token_lower = token.lower()
+
+    # Block if token is a category
+    if token_lower in [c.lower() for c in categories]:
+        return None
+
+    if token_lower in [choice.lower() for choice in choices]:
+        return token_lower
+
+    results = []
+
+    # Ratio scoring
+    ratio_result = process.extractOne(token_lower, choices, scorer=fuzz.ratio)
+    if ratio_result[1] >= threshold:
+        results.append((ratio_result[0], ratio_result[1], 'ratio'))
+
+    # Partial ratio
+    partial_result = process.extractOne(token_lower, choices, scorer=fuzz.partial_ratio)
+    if partial_result[1] >= 70 and not any(token_lower in c.lower() for c in categories):
+        results.append((partial_result[0], partial_result[1], 'partial'))
+
+    # Token sort ratio
+    token_sort_result = process.extractOne(token_lower, choices, scorer=fuzz.token_sort_ratio)
+    if token_sort_result[1] >= threshold:
+        results.append((token_sort_result[0], token_sort_result[1], 'token_sort'))
+
+    # Token set ratio
+    token_set_result = process.extractOne(token_lower, choices, scorer=fuzz.token_set_ratio)
+    if token_set_result[1] >= 70 and not any(token_lower in c.lower() for c in categories):
+        results.append((token_set_result[0], token_set_result[1], 'token_set'))
+
+    if results:
+        best_match = max(results, key=lambda x: x[1])
+        return best_match[0]
+
+    return None
+
+
+def synthetic_brands(count, seed=7):
+    """The real brands padded with pronounceable made-up names."""
+    rng = random.Random(seed)
+    consonants = "bcdfghjklmnprstvwz"
+    vowels = "aeiou"
+    brands = list(dict.fromkeys(BRANDS))
+    seen = set(brands)
+    while len(brands) < count:
+        name = "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.15:
+            name += " " + "".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(2))
+        if name not in seen:
+            seen.add(name)
+            brands.append(name)
+    return brands[:count]
+
+
+def legacy_match(tokens, brands):
+    return [
+        (fuzzy_match(t, CATEGORIES), fuzzy_match_brand(t, brands), fuzzy_match(t, COLORS), fuzzy_match(t, GENDERS))
+        for t in tokens
+    ]
+
+
+def vectorized_match(matcher, tokens):
+    m = matcher.match(tokens, tokens)
+    return list(zip(m.category, m.brand, m.color, m.gender))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="25,1000,10000,50000")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    token_lists = [q.lower().split() for q in REPRESENTATIVE_QUERIES]
+
+    print(f"{len(token_lists)} queries, per-query latency in ms (workers={args.workers})\n")
+    print(f"{'brands':>8} {'extractOne':>11} {'cdist':>9} {'same':>6} {'indexed':>9} {'agree':>7} {'typo recall':>12} {'index build s':>14}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        brands = synthetic_brands(size)
+        matcher = AttributeMatcher(CATEGORIES, brands, COLORS, GENDERS, workers=args.workers)
+
+        start = time.perf_counter()
+        indexes = {"brands": DeletionIndex(brands)}
+        build_s = time.perf_counter() - start
+        indexed_matcher = AttributeMatcher(
+            CATEGORIES, brands, COLORS, GENDERS, workers=args.workers, indexes=indexes, index_min_size=0
+        )
+
+        start = time.perf_counter()
+        legacy = [legacy_match(tokens, brands) for tokens in token_lists]
+        legacy_ms = (time.perf_counter() - start) * 1000 / len(token_lists)
+
+        start = time.perf_counter()
+        vectorized = [vectorized_match(matcher, tokens) for tokens in token_lists]
+        vector_ms = (time.perf_counter() - start) * 1000 / len(token_lists)
+
+        start = time.perf_counter()
+        indexed = [vectorized_match(indexed_matcher, tokens) for tokens in token_lists]
+        indexed_ms = (time.perf_counter() - start) * 1000 / len(token_lists)
+
+        same = legacy == vectorized
+        # Share of brand matches the index-pruned matcher gets exactly right,
+        # and the same restricted to typo matches (within 2 edits), which is
+        # what the index is meant to find. The rest are far partial matches.
+        rows = [
+            (token, a[1], b[1])
+            for tokens, la, lb in zip(token_lists, legacy, indexed)
+            for token, a, b in zip(tokens, la, lb)
+        ]
+        agree = sum(a == b for _, a, b in rows) / len(rows)
+        typos = [(a, b) for token, a, b in rows if a and Levenshtein.distance(token, a) <= 2]
+        recall = sum(a == b for a, b in typos) / len(typos) if typos else 1.0
+        print(
+            f"{size:>8} {legacy_ms:>11.3f} {vector_ms:>9.3f} {str(same):>6} "
+            f"{indexed_ms:>9.3f} {agree:>7.1%} {recall:>12.1%} {build_s:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+JSON work on the search and bulk paths, standard library vs orjson
+(nlp.json_codec), plus what filter_path and RawJSON passthrough save.
+
+- decode: a _search response of --size full products, whole and trimmed
+  to SEARCH_FILTER_PATH
+- bulk: the NDJSON body for --docs products
+- render: a /search response of --size products, as FastAPI's default
+  JSONResponse did it (jsonable_encoder + json.dumps), with
+  FastJSONResponse on the decoded list, and on a cached page's RawJSON
+
+Run from nlp-service/:
+
+    python -m benchmarks.json_codec --size 50 --docs 20000
+"""
+
+import argparse
+import json
+import os
+import time
+
+from benchmarks.stub_es import filter_response, search_hits, start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from nlp import json_codec
+from nlp.es_query import INDEX_NAME, SEARCH_FILTER_PATH, bulk_body, search_response_page
+from nlp.main2 import FastJSONResponse
+
+
+def timed(fn, rounds):
+    """Best of 5 runs of fn * rounds, in microseconds per call"""
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / rounds * 1e6
+
+
+def backends():
+    available = ["json"] + (["orjson"] if json_codec.orjson is not None else [])
+    for backend in available:
+        json_codec.BACKEND = backend
+        yield backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=50, help="products per search page")
+    parser.add_argument("--docs", type=int, default=20000, help="products in the bulk body")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    response = {"took": 3, "timed_out": False, "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+                "hits": search_hits(json.dumps({"size": args.size}))}
+    trimmed = filter_response(response, [path.split(".") for path in SEARCH_FILTER_PATH.split(",")])
+    whole_bytes = json.dumps(response).encode("utf-8")
+    trimmed_bytes = json.dumps(trimmed).encode("utf-8")
+    actions = [{"_index": INDEX_NAME, "_id": hit["_id"], "_source": hit["_source"]}
+               for hit in (search_hits(json.dumps({"size": 1000}))["hits"] * (args.docs // 1000 + 1))[:args.docs]]
+    body = {"size": args.size}
+    print(f"search response: {len(whole_bytes)} bytes, {len(trimmed_bytes)} with filter_path; "
+          f"bulk body: {len(bulk_body(actions)) / 1e6:.1f} MB\n")
+
+    print(f"{'backend':<8} {'decode':>10} {'decode fp':>10} {'bulk body':>11} "
+          f"{'render default':>15} {'render list':>12} {'render raw':>11}")
+    for backend in backends():
+        decode = timed(lambda: json_codec.loads(whole_bytes), args.rounds)
+        decode_fp = timed(lambda: json_codec.loads(trimmed_bytes), args.rounds)
+        bulk = timed(lambda: bulk_body(actions), 3) / 1000
+
+        page = search_response_page(json_codec.loads(trimmed_bytes), body)
+        raw_page = search_response_page(json_codec.loads(trimmed_bytes), body, raw_results=True)
+        default = timed(lambda: JSONResponse(jsonable_encoder(page)), args.rounds)
+        as_list = timed(lambda: FastJSONResponse(page), args.rounds)
+        as_raw = timed(lambda: FastJSONResponse(raw_page), args.rounds)
+        assert json.loads(FastJSONResponse(raw_page).body) == json.loads(JSONResponse(jsonable_encoder(page)).body)
+        print(f"{backend:<8} {decode:>8.0f}µs {decode_fp:>8.0f}µs {bulk:>9.0f}ms "
+              f"{default:>13.0f}µs {as_list:>10.0f}µs {as_raw:>9.0f}µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Offline parse_query / parse_queries benchmark over a synthetic corpus.
+
+Needs no Elasticsearch. The parse cache is off so every query is parsed.
+Reports throughput, p50/p95/p99 latency and peak RSS for single and batch
+parsing; with --baseline it fails (exit 1) when throughput drops or p95
+grows by more than --tolerance against an earlier --output.
+
+Run from nlp-service/:
+
+    python -m benchmarks.parser_suite --count 20000 --output parser.json
+    python -m benchmarks.parser_suite --count 20000 --baseline parser.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+os.environ.setdefault("PARSE_CACHE_SIZE", "0")
+
+from benchmarks.corpus import synthetic_corpus
+from benchmarks.pipeline_profiles import percentile, rss_mb
+from nlp.query_parser import parse_queries, parse_query
+
+# Metrics the regression gate compares, and which direction is worse
+GATED = {"qps": "lower", "p95_ms": "higher"}
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(samples_ms, count, seconds):
+    return {
+        "queries": count,
+        "seconds": round(seconds, 3),
+        "qps": round(count / seconds, 1),
+        "p50_ms": round(percentile(samples_ms, 50), 4),
+        "p95_ms": round(percentile(samples_ms, 95), 4),
+        "p99_ms": round(percentile(samples_ms, 99), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def bench_single(corpus):
+    samples = []
+    start = time.perf_counter()
+    for q in corpus:
+        t0 = time.perf_counter()
+        parse_query(q)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples, len(corpus), time.perf_counter() - start)
+
+
+def bench_batch(corpus, batch_size):
+    """Latency samples are per batch; throughput is per query."""
+    samples = []
+    start = time.perf_counter()
+    for i in range(0, len(corpus), batch_size):
+        t0 = time.perf_counter()
+        for _ in parse_queries(corpus[i:i + batch_size], batch_size=batch_size):
+            pass
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples, len(corpus), time.perf_counter() - start)
+
+
+def check_regressions(results, baseline, tolerance):
+    failures = []
+    for mode, metrics in results["modes"].items():
+        before = baseline.get("modes", {}).get(mode)
+        if not before:
+            continue
+        for metric, worse in GATED.items():
+            old, new = before[metric], metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (worse == "lower" and change < -tolerance) or (worse == "higher" and change > tolerance):
+                failures.append(f"{mode} {metric}: {old} -> {new} ({change:+.1%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=20000, help="queries in the synthetic corpus")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--warmup", type=int, default=500, help="queries parsed before measuring")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --output to gate against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.count, seed=args.seed)
+    for q in synthetic_corpus(args.warmup, seed=args.seed + 1):
+        parse_query(q)
+
+    results = {
+        "count": args.count,
+        "seed": args.seed,
+        "batch_size": args.batch_size,
+        "rss_after_load_mb": round(rss_mb(), 1),
+        "modes": {
+            "single": bench_single(corpus),
+            "batch": bench_batch(corpus, args.batch_size),
+        },
+    }
+
+    print(f"{args.count} synthetic queries (seed {args.seed}), batch_size={args.batch_size}")
+    print(f"{'mode':8} {'qps':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    for mode, m in results["modes"].items():
+        print(f"{mode:8} {m['qps']:10.1f} {m['p50_ms']:9.3f} {m['p95_ms']:9.3f} {m['p99_ms']:9.3f} {m['peak_rss_mb']:12.1f}")
+    print("(batch latencies are per batch)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        failures = check_regressions(results, baseline, args.tolerance)
+        if failures:
+            print(f"❌ Regressions beyond {args.tolerance:.0%}:")
+            for failure in failures:
+                print(f"   {failure}")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compare spaCy pipeline profiles for query parsing.
+
+Each profile runs in its own subprocess so RSS is measured in isolation.
+Run from nlp-service/:
+
+    python -m benchmarks.pipeline_profiles --rounds 20
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+
+
+def rss_mb():
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def run_profile(rounds):
+    """Child process: load the parser under SPACY_PROFILE and time it."""
+    base_rss = rss_mb()
+    start = time.perf_counter()
+    from nlp.query_parser import parse_query, nlp
+    load_s = time.perf_counter() - start
+    loaded_rss = rss_mb()
+
+    # Warm-up so lazy allocations are not charged to the first query
+    parsed = {q: parse_query(q) for q in REPRESENTATIVE_QUERIES}
+
+    samples = []
+    for _ in range(rounds):
+        for q in REPRESENTATIVE_QUERIES:
+            t0 = time.perf_counter()
+            parse_query(q)
+            samples.append((time.perf_counter() - t0) * 1000)
+
+    for result in parsed.values():
+        result["keywords"] = sorted(result["keywords"])
+
+    print(json.dumps({
+        "pipeline": nlp.pipe_names,
+        "load_s": load_s,
+        "rss_mb": loaded_rss - base_rss,
+        "peak_rss_mb": rss_mb(),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "mean_ms": sum(samples) / len(samples),
+        "parsed": parsed,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--profiles", default="full,slim")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args.rounds)
+        return
+
+    results = {}
+    for profile in args.profiles.split(","):
+        env = dict(os.environ, SPACY_PROFILE=profile, SYNONYM_RELOAD_INTERVAL="0")
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.pipeline_profiles", "--child", "--rounds", str(args.rounds)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        results[profile] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    reference = results.get("full") or next(iter(results.values()))
+    print(f"{len(REPRESENTATIVE_QUERIES)} queries x {args.rounds} rounds\n")
+    print(f"{'profile':<8} {'load s':>7} {'RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'agree':>7}  pipeline")
+    for profile, r in results.items():
+        agree = sum(r["parsed"][q] == reference["parsed"][q] for q in REPRESENTATIVE_QUERIES)
+        print(
+            f"{profile:<8} {r['load_s']:>7.2f} {r['rss_mb']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+            f"{r['mean_ms']:>8.2f} {agree:>3}/{len(REPRESENTATIVE_QUERIES):<3}  {','.join(r['pipeline'])}"
+        )
+
+
+if __name__ == "__main__":
+    main()
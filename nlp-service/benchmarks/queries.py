@@ -0,0 +1,34 @@
+# Representative /search queries: short attribute queries, price phrases,
+# typos, multi-word synonyms and free text.
+REPRESENTATIVE_QUERIES = [
+    "black nike shoes under 2000",
+    "phone under 3000",
+    "blue adidas sneakers for women below 1500",
+    "red running shoes for men",
+    "smart phones between 10000 and 20000",
+    "samsung galaxy phone",
+    "iphone 12 above 50000",
+    "pumma slippers",
+    "addidas trainers upto 3000",
+    "navy blue jacket",
+    "comfortable sneakers for sports",
+    "durable blue running shoes",
+    "shoes for women under 1500",
+    "sky blue t-shirts for girls",
+    "leather jackets",
+    "h&m tops for ladies",
+    "woodland boots",
+    "new balance running shoe",
+    "red tape formal shoes",
+    "sony headphones under 5000",
+    "kids sandals",
+    "pink crocs",
+    "gold watches for him",
+    "one plus phone",
+    "nikey shose",
+    "wireless earphone",
+    "electronics under 999",
+    "white heels for women",
+    "grey hoodies",
+    "charcoal grey trousers over 1200",
+]
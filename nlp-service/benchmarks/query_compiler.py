@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Compiled search bodies vs the previous inline builder.
+
+Checks, over search arguments from the synthetic query corpus (plus
+multi-valued filters and page options), that nlp.query_compiler keeps the
+previous semantics: the same exact filters (moved from ``must`` to
+``filter``), the same scoring clauses, sort and page options, and that
+the stored template renders to the same body as the inline compiler.
+Exits 1 on any mismatch.
+
+Then compares body size and build + serialize time for the previous
+builder, the compiled inline body and the template request, and the
+request bytes of inline vs template searches against a local stub
+Elasticsearch.
+
+Run from nlp-service/:
+
+    python -m benchmarks.query_compiler --count 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+os.environ["ES_RESULT_CACHE_MAX_BYTES"] = "0"
+
+from benchmarks.corpus import synthetic_corpus
+from nlp import es_query
+from nlp.query_compiler import DEFAULT_FROM, DEFAULT_SIZE, ParsedQuery, render_template, template_body
+from nlp.query_parser import parse_query
+
+
+# The builder as it was before nlp.query_compiler: every filter in must
+def legacy_keyword_clause(field, value):
+    """
+    term clause for one value, terms clause for a list of alternatives
+    (any of them matches); None when there is nothing to filter on.
+    """
+    if isinstance(value, str):
+        value = [value]
+    values = list(dict.fromkeys(v.lower() for v in value or () if v))
+    if not values:
+        return None
+    if len(values) == 1:
+        return {"term": {field: values[0]}}
+    return {"terms": {field: values}}
+
+def legacy_body(category=None, color=None, brand=None, gender=None, price_filter=None, query_text=None,
+                      size=None, offset=None, search_after=None, source=None, track_total_hits=None):
+    must_clauses = []
+
+    for field, value in (("category", category), ("color", color), ("brand", brand), ("gender", gender)):
+        clause = legacy_keyword_clause(field, value)
+        if clause:
+            must_clauses.append(clause)
+    if price_filter:
+        op = price_filter.get("operator")
+        if op == "between":
+            must_clauses.append({"range": {"price": {"gte": price_filter["min"], "lte": price_filter["max"]}}})
+        elif op == ">":
+            must_clauses.append({"range": {"price": {"gt": price_filter["value"]}}})
+        elif op == "<":
+            must_clauses.append({"range": {"price": {"lt": price_filter["value"]}}})
+        elif op == ">=":
+            must_clauses.append({"range": {"price": {"gte": price_filter["value"]}}})
+        elif op == "<=":
+            must_clauses.append({"range": {"price": {"lte": price_filter["value"]}}})
+
+    should_clause = []
+    if query_text:
+        # Add fuzzy matching for better handling of misspelled terms
+        should_clause.extend([
+            {
+                "multi_match": {
+                    "query": query_text,
+                    "fields": ["name^3", "description", "category"],
+                    "fuzziness": "AUTO",  # Enable fuzzy matching
+                    "prefix_length": 2,    # Minimum prefix length for fuzzy matching
+                    "max_expansions": 50   # Maximum number of terms to expand to
+                }
+            },
+            {
+                "multi_match": {
+                    "query": query_text,
+                    "fields": ["brand^2", "name^3"],
+                    "fuzziness": "AUTO",
+                    "prefix_length": 1,    # Lower prefix for brand matching
+                    "max_expansions": 20
+                }
+            }
+        ])
+
+    query_body = {
+        "query": {
+            "bool": {
+                "must": must_clauses,
+                "should": should_clause,
+                "minimum_should_match": 0
+            }
+        },
+        "sort": [
+            {"_score": "desc"},
+            {"rating": "desc"},
+            {"discount": "desc"},
+            {"price": "asc"},
+            {"_doc": "asc"}  # tiebreaker, so search_after never skips or repeats ties
+        ]
+    }
+
+    if size is not None:
+        query_body["size"] = size
+    if offset:
+        query_body["from"] = offset
+    if search_after is not None:
+        query_body["search_after"] = search_after
+    if source is not None:
+        query_body["_source"] = source
+    if track_total_hits is not None:
+        query_body["track_total_hits"] = track_total_hits
+
+    return query_body
+
+
+def canonical(clauses):
+    return sorted(json.dumps(c, sort_keys=True) for c in clauses)
+
+
+def check(kwargs, page):
+    """Differences between the previous and the compiled body for one search."""
+    problems = []
+    old = legacy_body(**kwargs, **page)
+    new = es_query.build_search_body(**kwargs, **page)
+    old_bool, new_bool = old["query"]["bool"], new["query"]["bool"]
+    if canonical(old_bool["must"]) != canonical(new_bool["filter"]) or new_bool.get("must"):
+        problems.append(f"filters: {old_bool['must']} vs {new_bool['filter']}")
+    if old_bool["should"] != new_bool["should"] or old_bool["minimum_should_match"] != new_bool["minimum_should_match"]:
+        problems.append("scoring clauses differ")
+    for key in set(old) | set(new):
+        if key != "query" and old.get(key) != new.get(key):
+            problems.append(f"{key}: {old.get(key)} vs {new.get(key)}")
+
+    parsed = ParsedQuery.from_search_kwargs(**kwargs)
+    rendered = render_template(template_body(parsed, **page)["params"])
+    expected = dict(new, size=new.get("size", DEFAULT_SIZE), **{"from": new.get("from", DEFAULT_FROM)})
+    if json.loads(json.dumps(expected)) != rendered:
+        problems.append(f"template renders {rendered} instead of {expected}")
+    return problems
+
+
+def searches(count, seed=11):
+    """(search kwargs, page options) from the corpus, with some multi-valued and paged variants."""
+    rng = random.Random(seed)
+    pages = [{}, {"size": 20}, {"size": 20, "offset": 40}, {"size": 10, "search_after": [1.5, 4.0, 10, 999, 7]},
+             {"source": ["name", "price"], "track_total_hits": False}, {"track_total_hits": True}]
+    for q in synthetic_corpus(count):
+        kwargs = es_query.to_search_kwargs(parse_query(q))
+        if rng.random() < 0.2 and kwargs["category"]:
+            kwargs["category"] = [kwargs["category"], kwargs["category"] + "s"]
+        if rng.random() < 0.1:
+            kwargs["price_filter"] = {"operator": rng.choice([">", "<"]), "value": rng.randrange(100, 5000)}
+        yield kwargs, rng.choice(pages)
+
+
+def time_builds(label, build, items, rounds=5):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = 0
+        for kwargs, page in items:
+            size += len(json.dumps(build(kwargs, page)))
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:18} {size / len(items):9.0f} {best / len(items) * 1e6:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--searches", type=int, default=500, help="round trips per mode against the stub")
+    args = parser.parse_args()
+
+    items = list(searches(args.count))
+    failures = [(kwargs, page, problems) for kwargs, page in items for problems in [check(kwargs, page)] if problems]
+    print(f"semantics: {len(items) - len(failures)}/{len(items)} searches match the previous bodies")
+    for kwargs, page, problems in failures[:5]:
+        print(f"  {kwargs} {page}: {problems}")
+
+    print(f"  {'body':18} {'bytes':>9} {'us/build':>9}")
+    time_builds("previous inline", lambda kw, page: legacy_body(**kw, **page), items)
+    time_builds("compiled inline", lambda kw, page: es_query.build_search_body(**kw, **page), items)
+    time_builds("template params", lambda kw, page: template_body(ParsedQuery.from_search_kwargs(**kw), **page), items)
+
+    counts = STUB.RequestHandlerClass.counts
+    print(f"stub round trips ({args.searches} each):")
+    for label, template in (("inline", False), ("template", True)):
+        es_query.SEARCH_TEMPLATE = template
+        counts.clear()
+        start = time.perf_counter()
+        for kwargs, _ in items[:args.searches]:
+            es_query.search_page(**kwargs)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:18} {counts['bytes_in'] / args.searches:9.0f} bytes/request "
+              f"{elapsed / args.searches * 1000:7.2f} ms/search")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Search latency and cluster refresh counts under each refresh policy.
+
+Runs a mixed workload (one /add-product style write every --write-every
+searches) against a local stub Elasticsearch whose refreshes cost
+--refresh-latency seconds, and compares the old behaviour (refresh before
+every search and after every write) with the none / wait_for / debounce
+policies and with read-your-writes on every search.
+
+Run from nlp-service/:
+
+    python -m benchmarks.refresh_policy --searches 2000 --write-every 20
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub(latency=0.002, refresh_latency=0.01)
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from benchmarks.pipeline_profiles import percentile
+from nlp import es_query
+from nlp.refresh_policy import RefreshPolicy
+
+PRODUCT = {"name": "runner", "category": "shoe", "brand": "nike", "color": "black", "price": 1999}
+
+
+def run(label, searches, write_every, mode="debounce", legacy=False, read_your_writes=False, delay=1.0):
+    es_query.REFRESH_POLICY = RefreshPolicy(es_query.es, mode=mode, delay=delay)
+    counts = STUB.RequestHandlerClass.counts
+    counts.clear()
+
+    samples = []
+    start = time.perf_counter()
+    for i in range(searches):
+        if i % write_every == 0:
+            es_query.index_product(PRODUCT)
+            if legacy:
+                es_query.es.refresh(index=es_query.INDEX_NAME)
+        t0 = time.perf_counter()
+        if legacy:
+            es_query.es.refresh(index=es_query.INDEX_NAME)
+        es_query.search_products(category="shoe", brand="nike", read_your_writes=read_your_writes)
+        samples.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    time.sleep(delay * 2)  # let a pending debounced refresh land
+
+    print(f"{label:26} {percentile(samples, 50):8.2f} {percentile(samples, 95):8.2f} "
+          f"{searches / elapsed:8.1f} {counts.get('refresh', 0):9d} {counts.get('write', 0):7d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--write-every", type=int, default=20, help="one write per this many searches")
+    parser.add_argument("--delay", type=float, default=1.0, help="debounce delay in seconds")
+    args = parser.parse_args()
+
+    print(f"{args.searches} searches, one write every {args.write_every}; "
+          f"stub search 2 ms, refresh 10 ms, debounce {args.delay}s")
+    print(f"{'policy':26} {'p50 ms':>8} {'p95 ms':>8} {'qps':>8} {'refreshes':>9} {'writes':>7}")
+    n, w = args.searches, args.write_every
+    run("legacy (refresh always)", n, w, mode="none", legacy=True)
+    run("none", n, w, mode="none")
+    run("wait_for", n, w, mode="wait_for")
+    run("debounce", n, w, mode="debounce", delay=args.delay)
+    run("debounce + read-your-writes", n, w, mode="debounce", read_your_writes=True, delay=args.delay)
+
+
+if __name__ == "__main__":
+    main()
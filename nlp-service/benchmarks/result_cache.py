@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Search result cache on a skewed query mix with interleaved writes.
+
+Draws --searches queries from the representative set with Zipf-like
+popularity, indexes one product every --write-every searches, and runs
+them through search_products against a local stub Elasticsearch (--latency
+per search) with the result cache off and on.
+
+Run from nlp-service/:
+
+    python -m benchmarks.result_cache --searches 5000 --write-every 100
+"""
+
+import argparse
+import os
+import random
+import time
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from benchmarks.pipeline_profiles import percentile
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+from nlp import es_query
+from nlp.query_parser import parse_query
+
+PRODUCT = {"name": "runner", "category": "shoe", "brand": "nike", "color": "black", "price": 1999}
+
+
+def workload(searches, seed=7):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(REPRESENTATIVE_QUERIES))]
+    queries = rng.choices(REPRESENTATIVE_QUERIES, weights=weights, k=searches)
+    return [es_query.to_search_kwargs(parse_query(q)) for q in queries]
+
+
+def run(label, searches, write_every, max_bytes):
+    cache = es_query.RESULT_CACHE
+    cache.max_bytes = max_bytes
+    cache.clear()
+    cache.hits = cache.misses = cache.stale = 0
+    cache.saved_seconds = 0.0
+    counts = STUB.RequestHandlerClass.counts
+    counts.clear()
+
+    samples = []
+    for i, kwargs in enumerate(searches):
+        if i % write_every == 0:
+            es_query.index_product(PRODUCT)
+        t0 = time.perf_counter()
+        es_query.search_products(**kwargs)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    stats = cache.stats()
+    print(f"{label:10} {counts.get('search', 0):9d} {stats['hit_rate']:9.1%} {stats['stale']:6d} "
+          f"{percentile(samples, 50):8.2f} {percentile(samples, 95):8.2f} {stats['saved_seconds']:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--searches", type=int, default=5000)
+    parser.add_argument("--write-every", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub Elasticsearch search latency (s)")
+    args = parser.parse_args()
+    STUB.RequestHandlerClass.latency = args.latency
+    es_query.REFRESH_POLICY.mode = "none"  # keep background refreshes out of the comparison
+    es_query.REFRESH_POLICY.delay = 0  # the stub's writes are searchable at once
+
+    searches = workload(args.searches)
+    print(f"{args.searches} searches over {len(REPRESENTATIVE_QUERIES)} queries, one write every "
+          f"{args.write_every}; stub search {args.latency * 1000:.0f} ms")
+    print(f"{'cache':10} {'searches':>9} {'hit rate':>9} {'stale':>6} {'p50 ms':>8} {'p95 ms':>8} {'saved s':>9}")
+    run("off", searches, args.write_every, 0)
+    run("on", searches, args.write_every, 32 * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    main()
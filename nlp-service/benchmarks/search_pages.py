@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Response payload and latency of /search result pages.
+
+Calls /search on a local stub Elasticsearch (whose catalog entries carry a
+description and photo links, like real products) and compares full
+documents with fields=card, exact totals with track_total_hits=false, and
+deep pages reached by from against the same pages reached by cursor.
+Sizes are the JSON the API returns; times include the Elasticsearch round
+trip, so on a real cluster the _source and total savings are larger.
+
+Run from nlp-service/:
+
+    python -m benchmarks.search_pages --rounds 200
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+os.environ["ES_RESULT_CACHE_MAX_BYTES"] = "0"  # measure round trips, not cache hits
+
+from fastapi.testclient import TestClient
+
+from benchmarks.pipeline_profiles import percentile
+from nlp.main2 import app
+
+QUERY = "black nike running shoes"
+
+
+def measure(client, label, rounds, **params):
+    samples, size = [], 0
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        response = client.get("/search", params={"q": QUERY, **params})
+        samples.append((time.perf_counter() - t0) * 1000)
+        response.raise_for_status()
+        size = len(response.content)
+    print(f"{label:34} {size:9d} {percentile(samples, 50):8.2f} {percentile(samples, 95):8.2f}")
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        measure(client, "warm-up", 20)
+        print(f"{'page':34} {'bytes':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        measure(client, "size=10, all fields", args.rounds)
+        measure(client, "size=10, fields=card", args.rounds, fields="card")
+        measure(client, "size=10, fields=card, no total", args.rounds, fields="card", track_total_hits="false")
+        measure(client, "size=50, all fields", args.rounds, size=50)
+        measure(client, "size=50, fields=card", args.rounds, size=50, fields="card")
+
+        # Walk 5 pages of 20 by cursor and check they match from-based paging
+        cursor, by_cursor = None, []
+        for _ in range(5):
+            page = client.get("/search", params={"q": QUERY, "size": 20, **({"cursor": cursor} if cursor else {})}).json()
+            by_cursor.extend(p["name"] for p in page["results"])
+            cursor = page["next_cursor"]
+        by_from = [p["name"] for n in range(5) for p in
+                   client.get("/search", params={"q": QUERY, "size": 20, "from": 20 * n}).json()["results"]]
+        print(f"cursor pages match from pages: {by_cursor == by_from} ({len(by_cursor)} products)")
+
+
+if __name__ == "__main__":
+    main()
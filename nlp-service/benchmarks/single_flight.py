@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Bursts of identical searches with and without single-flight coalescing.
+
+Fires --burst concurrent copies of each query at the /search handler
+(coroutines on one loop) and at search_products (threads), against a
+local stub Elasticsearch with --latency per search, and counts the
+searches that reached it.
+
+Run from nlp-service/:
+
+    python -m benchmarks.single_flight --burst 200 --latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_es import start_stub
+
+STUB = start_stub()
+os.environ["ELASTICSEARCH_HOST"] = f"http://127.0.0.1:{STUB.server_port}"
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+os.environ["ES_ASYNC_MAX_KEEPALIVE"] = "200"
+os.environ["ES_RESULT_CACHE_MAX_BYTES"] = "0"  # count coalescing alone, not cache hits
+
+from nlp import es_async, es_query, main2
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+
+FLIGHTS = (main2.SEARCH_HANDLER_FLIGHT, es_async.ASYNC_SEARCH_FLIGHT, es_query.SEARCH_FLIGHT)
+# /search's query parameter defaults, for calling the handler directly
+SEARCH_ARGS = dict(read_your_writes=False, size=10, offset=0, cursor=None, fields="all", track_total_hits=None)
+
+
+async def handler_burst(queries, burst):
+    for q in queries:
+        await asyncio.gather(*(main2.search(q=q, **SEARCH_ARGS) for _ in range(burst)))
+    await es_async.async_es.close()
+
+
+def thread_burst(queries, burst):
+    with ThreadPoolExecutor(min(burst, 64)) as pool:
+        for q in queries:
+            kwargs = main2.to_search_kwargs(main2.parse_query(q))
+            list(pool.map(lambda _: es_query.search_products(**kwargs), range(burst)))
+
+
+def run(label, fn, enabled, calls):
+    for flight in FLIGHTS:
+        flight.enabled = enabled
+    counts = STUB.RequestHandlerClass.counts
+    counts.clear()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:32} {calls:7d} {counts.get('search', 0):9d} {elapsed * 1000:9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--burst", type=int, default=200, help="concurrent copies of each query")
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub Elasticsearch search latency (s)")
+    args = parser.parse_args()
+    STUB.RequestHandlerClass.latency = args.latency
+
+    queries = REPRESENTATIVE_QUERIES[:args.queries]
+    calls = len(queries) * args.burst
+    print(f"{len(queries)} queries x {args.burst} concurrent copies, stub search {args.latency * 1000:.0f} ms")
+    print(f"{'':32} {'calls':>7} {'searches':>9} {'ms':>9}")
+    for enabled in (False, True):
+        state = "single-flight" if enabled else "no coalescing"
+        run(f"/search handler, {state}", lambda: asyncio.run(handler_burst(queries, args.burst)), enabled, calls)
+        run(f"search_products, {state}", lambda: thread_burst(queries, args.burst), enabled, calls)
+    for flight in FLIGHTS:
+        print(flight.name, flight.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Minimal local stand-in for Elasticsearch, for benchmarks that need the API
+up without a cluster. Answers ping/info, _search, _msearch, _bulk, _refresh
+and document writes from a fixed catalog of 1000 products (_search pages
+through it like Elasticsearch would).
+
+    python -m benchmarks.stub_es --port 9250
+    ELASTICSEARCH_HOST=http://127.0.0.1:9250 python -m nlp.serve
+
+``start_stub(port)`` runs it in a background thread instead. ``latency``
+adds a fixed delay to every search and ``refresh_latency`` to every
+refresh, to mimic a real cluster; ``bulk_latency`` is per 1000 bulk
+documents. ``reject_rate`` answers that fraction of searches and bulks with
+429, like an overloaded cluster, and ``item_reject_rate`` rejects that
+fraction of the items inside a bulk. ``slow_rate`` of the searches take
+``slow_latency`` instead of ``latency`` (a slow shard, a GC pause; 1.0 is
+a stalled cluster). gzip request bodies are accepted, responses are
+gzipped when the client asks and trimmed to ``filter_path`` when given.
+"""
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CATALOG = [
+    {
+        "_index": "products",
+        "_id": str(i),
+        "_score": 1.0,
+        "_source": {"name": f"Product {i}", "brand": "nike", "category": "shoe", "color": "black",
+                    "gender": "unisex", "price": 1000 + 100 * i, "rating": 4.0, "discount": 10, "stock": 5,
+                    "description": f"Product {i}: breathable mesh upper, cushioned midsole and a durable "
+                                   "rubber outsole for everyday running and training.",
+                    "photo_links": [f"https://cdn.example.com/products/{i}/{n}.jpg" for n in range(4)]},
+        "sort": [1.0, 4.0, 10, 1000 + 100 * i, i],
+    }
+    for i in range(1000)
+]
+HITS = CATALOG[:10]
+
+
+def search_hits(body):
+    """
+    hits section for a search body: honours size, from, search_after (on the
+    trailing _doc sort value), _source includes and track_total_hits.
+    """
+    try:
+        query = json.loads(body) if body else {}
+    except ValueError:
+        query = {}
+    size = query.get("size", 10)
+    start = query.get("from", 0)
+    if query.get("search_after"):
+        start = query["search_after"][-1] + 1
+    hits = CATALOG[start:start + size]
+    includes = query.get("_source")
+    if isinstance(includes, list):
+        hits = [dict(hit, _source={k: v for k, v in hit["_source"].items() if k in includes}) for hit in hits]
+    section = {"max_score": 1.0, "hits": hits}
+    if query.get("track_total_hits") is not False:
+        section["total"] = {"value": len(CATALOG), "relation": "eq"}
+    return section
+
+
+def filter_response(value, paths):
+    """Keep only the dotted paths of filter_path (arrays are walked, empty parts dropped)."""
+    if isinstance(value, list):
+        items = [filter_response(item, paths) for item in value]
+        return [item for item in items if item not in ({}, [])]
+    if not isinstance(value, dict):
+        return value
+    kept = {}
+    for key, item in value.items():
+        rest = [path[1:] for path in paths if path[0] == key]
+        if any(not path for path in rest):
+            kept[key] = item
+        elif rest:
+            item = filter_response(item, rest)
+            if item not in ({}, []):
+                kept[key] = item
+    return kept
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+    refresh_latency = 0.0
+    reject_rate = 0.0
+    slow_rate = 0.0
+    slow_latency = 0.0
+    item_reject_rate = 0.0
+    bulk_latency = 0.0
+    counts = {}
+    documents = set()
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self._count("connections")  # one handler per accepted connection
+
+    def _send(self, payload, status=200):
+        query = parse_qs(urlsplit(self.path).query)
+        if "filter_path" in query and status < 300:
+            payload = filter_response(payload, [path.split(".") for path in query["filter_path"][0].split(",")])
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self._count("bytes_out", len(body))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, name, n=1):
+        counts = type(self).counts
+        counts[name] = counts.get(name, 0) + n
+
+    def _search_latency(self):
+        if self.slow_rate and random.random() < self.slow_rate:
+            self._count("slow")
+            return self.slow_latency
+        return self.latency
+
+    def _rejected(self):
+        if self.reject_rate and random.random() < self.reject_rate:
+            self._count("rejected")
+            self._send({"error": {"type": "es_rejected_execution_exception"}, "status": 429}, status=429)
+            return True
+        return False
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.split("?")[0].endswith("/_search"):
+            return self.do_POST()
+        self._send({"cluster_name": "stub", "version": {"number": "8.0.0"}})
+
+    def do_PUT(self):
+        self.do_POST()
+
+    def do_DELETE(self):
+        self._send({"acknowledged": True})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        self._count("bytes_in", length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        path = self.path.split("?")[0]
+        hits = {"total": {"value": len(CATALOG), "relation": "eq"}, "max_score": 1.0, "hits": HITS}
+
+        if path.endswith(("/_search", "/_search/template", "/_bulk")) and self._rejected():
+            return
+        if path.endswith("/_msearch"):
+            self._count("msearch")
+            time.sleep(self._search_latency())
+            searches = len([line for line in body.splitlines() if line.strip()]) // 2
+            self._send({"took": 1, "responses": [{"took": 1, "hits": hits, "status": 200}] * searches})
+        elif path.endswith("/_search/template"):
+            from nlp.query_compiler import render_template
+
+            self._count("search_template")
+            time.sleep(self._search_latency())
+            rendered = json.dumps(render_template(json.loads(body)["params"]))
+            self._send({"took": 1, "timed_out": False, "hits": search_hits(rendered)})
+        elif path.endswith("/_search"):
+            self._count("search")
+            time.sleep(self._search_latency())
+            self._send({"took": 1, "timed_out": False, "hits": search_hits(body)})
+        elif path.endswith("/_refresh"):
+            self._count("refresh")
+            time.sleep(self.refresh_latency)
+            self._send({"_shards": {"total": 1, "successful": 1, "failed": 0}})
+        elif path.endswith("/_bulk"):
+            self._count("bulk")
+            actions = [json.loads(line) for line in body.splitlines()[::2] if line.strip()]
+            time.sleep(self.bulk_latency * len(actions) / 1000)
+            items = []
+            for action in actions:
+                if self.item_reject_rate and random.random() < self.item_reject_rate:
+                    self._count("items_rejected")
+                    items.append({"index": {"status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+                    continue
+                doc_id = action["index"].get("_id")
+                with self.lock:
+                    if doc_id is None:
+                        doc_id = f"auto-{len(self.documents)}"
+                    status = 200 if doc_id in self.documents else 201
+                    self.documents.add(doc_id)
+                items.append({"index": {"_id": doc_id, "status": status}})
+            errors = any(item["index"]["status"] >= 300 for item in items)
+            self._send({"took": 1, "errors": errors, "items": items})
+        else:
+            self._count("write")
+            self._send({"_id": "stub", "result": "created"}, status=201)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # load tests open many connections at once
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out have hung up by the time a slow answer is sent
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub(port=0, latency=0.0, refresh_latency=0.0, reject_rate=0.0, item_reject_rate=0.0, bulk_latency=0.0,
+               slow_rate=0.0, slow_latency=0.0):
+    """
+    Serve the stub in a daemon thread; returns the server (see server_port,
+    RequestHandlerClass.counts for requests per operation and bytes on the
+    wire, and RequestHandlerClass.documents for the _ids bulk-indexed).
+    """
+    handler = type("Handler", (StubHandler,), {"latency": latency, "refresh_latency": refresh_latency,
+                                               "reject_rate": reject_rate, "item_reject_rate": item_reject_rate,
+                                               "bulk_latency": bulk_latency, "slow_rate": slow_rate,
+                                               "slow_latency": slow_latency, "counts": {}, "documents": set(),
+                                               "lock": threading.Lock()})
+    server = StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="stub-es", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub Elasticsearch")
+    parser.add_argument("--port", type=int, default=9250)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every search")
+    parser.add_argument("--refresh-latency", type=float, default=0.0, help="seconds added to every refresh")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="fraction of searches/bulks answered 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of searches that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="seconds a slow search takes")
+    parser.add_argument("--item-reject-rate", type=float, default=0.0, help="fraction of bulk items rejected with 429")
+    parser.add_argument("--bulk-latency", type=float, default=0.0, help="seconds per 1000 bulk documents")
+    args = parser.parse_args()
+    server = start_stub(args.port, args.latency, args.refresh_latency, args.reject_rate,
+                        args.item_reject_rate, args.bulk_latency, args.slow_rate, args.slow_latency)
+    print(f"🧪 Stub Elasticsearch on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Synonym parity: queries whose synonyms the compiled SynonymIndex must
+treat exactly as the original normalize_token / MULTIWORD_SYNONYM_PATTERNS
+did. Only the phrases section rewrites multi-word text; multi-word entries
+in the field sections ("hp laptops", "formal shoes") never matched a
+single token, so the query's words are normalized one at a time. Field
+synonyms are compared as written, so ones with capitals ("TVs") never
+match a lowercased token.
+
+BASELINE holds parse_query's output for each query before the index was
+introduced. Exits 1 on any difference.
+
+Run from nlp-service/:
+
+    python -m benchmarks.synonym_parity
+"""
+
+import os
+import sys
+
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+os.environ.setdefault("PARSE_CACHE_SIZE", "0")
+
+from nlp.query_parser import parse_query
+
+
+def _parsed(keywords, category=None, brand=None, color=None, gender=None, price_min=None, price_max=None):
+    return {"keywords": keywords, "category": category, "brand": brand, "color": color, "gender": gender,
+            "price_min": price_min, "price_max": price_max}
+
+
+BASELINE = {
+    "hp laptops": _parsed(["hp"], category="electronic"),
+    "dell laptops under 50000": _parsed([], category="electronic", color="yellow", price_max=50000),
+    "realme phones": _parsed(["realme"], category="electronic"),
+    "mens formal shoes": _parsed(["formal"], category="shoe", gender="men"),
+    "nikey sports shoes between 1000 and 3000": _parsed(["sports"], category="shoe", brand="nike",
+                                                        price_min=1000, price_max=3000),
+    "asus rog laptop": _parsed(["rog"], category="flat", brand="samsung"),
+    "smart phones between 10000 and 20000": _parsed([], category="smartphone", price_min=10000, price_max=20000),
+    "red running shoes for men": _parsed(["sports"], category="shoe", brand="red tape", gender="men"),
+    "one plus phone": _parsed([], category="electronic", brand="oneplus", color="orange"),
+    "tvs": _parsed(["tvs"]),
+    "led tvs": _parsed(["tvs"], brand="apple"),
+    "samsung tvs under 40000": _parsed(["tvs"], brand="samsung", price_max=40000),
+}
+
+
+def main():
+    failures = 0
+    for query, expected in BASELINE.items():
+        got = parse_query(query)
+        got = {**got, "keywords": sorted(got["keywords"])}
+        expected = {**expected, "keywords": sorted(expected["keywords"])}
+        if got != expected:
+            failures += 1
+            print(f"❌ {query!r}\n   baseline {expected}\n   now      {got}")
+    print(f"{len(BASELINE) - failures}/{len(BASELINE)} queries parse as before")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
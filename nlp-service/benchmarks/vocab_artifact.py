@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Worker cold start with and without a precompiled vocabulary artifact.
+
+Builds an artifact for a synthetic brand list, then imports nlp.query_parser
+in fresh processes with and without VOCAB_ARTIFACT_PATH and reports the
+import time and what load_artifact alone costs.
+
+Run from nlp-service/:
+
+    python -m benchmarks.vocab_artifact --brands 100000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SYNONYM_RELOAD_INTERVAL", "0")
+
+from benchmarks.fuzzy_matcher import synthetic_brands
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import nlp.query_parser as qp
+print(time.perf_counter() - start, len(qp.VOCABULARY.snapshot.brands))
+"""
+
+LOAD_SNIPPET = """
+import sys, time
+from nlp.vocab_artifact import load_artifact
+start = time.perf_counter()
+artifact = load_artifact(sys.argv[1])
+print(time.perf_counter() - start, len(artifact.snapshot.brands))
+"""
+
+
+def run(snippet, *args, env=None):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet, *args],
+        capture_output=True, text=True, check=True, env=env,
+    ).stdout.strip().splitlines()[-1]
+    seconds, brands = out.split()
+    return float(seconds), int(brands)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--brands", type=int, default=100000, help="synthetic brands in the vocabulary")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    from nlp.vocab_artifact import build_artifact, save_artifact
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "vocab.bin")
+        start = time.perf_counter()
+        artifact = build_artifact({"brands": synthetic_brands(args.brands)})
+        save_artifact(path, artifact.snapshot, artifact.lemma_table, artifact.indexes, artifact.settings)
+        build_s = time.perf_counter() - start
+        print(f"{len(artifact.snapshot.brands)} brands: built in {build_s:.1f}s, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB on disk")
+
+        env = dict(os.environ, VOCAB_ARTIFACT_PATH=path)
+        load = min(run(LOAD_SNIPPET, path)[0] for _ in range(args.rounds))
+        with_artifact = min(run(IMPORT_SNIPPET, env=env)[0] for _ in range(args.rounds))
+        default_s, default_brands = run(IMPORT_SNIPPET, env=dict(os.environ, VOCAB_ARTIFACT_PATH=""))
+
+        print(f"{'':32} {'seconds':>8}")
+        print(f"{'load_artifact':32} {load:8.3f}")
+        print(f"{'import query_parser + artifact':32} {with_artifact:8.3f}")
+        print(f"{f'import query_parser ({default_brands} brands)':32} {default_s:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
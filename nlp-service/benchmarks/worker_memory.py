@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory of the API with pre-forked workers (python -m nlp.serve)
+vs independently started ones (uvicorn --workers).
+
+Starts a local stub Elasticsearch, brings the server up with each worker
+count, sends a few searches so every worker has parsed something, and
+reads RSS, PSS and USS (private memory) for every worker from /proc.
+PSS charges shared pages proportionally, so its total is what the workers
+really cost together. Linux only.
+
+Run from nlp-service/:
+
+    python -m benchmarks.worker_memory --workers 1,4,16
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.queries import REPRESENTATIVE_QUERIES
+from benchmarks.stub_es import start_stub
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid):
+    """RSS, PSS and USS (private clean + dirty) of pid in kB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return values["Rss"], values["Pss"], values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+
+
+def descendants(pid):
+    children = []
+    for child in open(f"/proc/{pid}/task/{pid}/children").read().split():
+        children.append(int(child))
+        children.extend(descendants(int(child)))
+    return children
+
+
+def worker_pids(master, expected):
+    """
+    Processes under master that are running the app (uvicorn adds a spawn
+    helper, and serves a single worker from the master itself).
+    """
+    pids = [p for p in descendants(master) if memory_kb(p)[0] > 50 * 1024]
+    return pids[-expected:] or [master]
+
+
+def measure(mode, workers, es_host):
+    port = free_port()
+    env = dict(os.environ, ELASTICSEARCH_HOST=es_host, SYNONYM_RELOAD_INTERVAL="0")
+    if mode == "prefork":
+        cmd = [sys.executable, "-m", "nlp.serve", "--workers", str(workers), "--port", str(port),
+               "--host", "127.0.0.1", "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "nlp.main2:app", "--workers", str(workers),
+               "--port", str(port), "--host", "127.0.0.1", "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        deadline = time.time() + 60 + 10 * workers
+        while True:
+            try:
+                if requests.get(f"{url}/lists", timeout=1).ok and len(worker_pids(proc.pid, workers)) >= workers:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"{mode} server with {workers} workers did not come up")
+            time.sleep(0.5)
+
+        for _ in range(4 * workers):
+            for q in REPRESENTATIVE_QUERIES[:5]:
+                requests.get(f"{url}/search", params={"q": q}, timeout=10)
+        time.sleep(1)
+
+        pids = worker_pids(proc.pid, workers)
+        rows = [memory_kb(p) for p in pids]
+        master = memory_kb(proc.pid) if proc.pid not in pids else (0, 0, 0)
+        return {
+            "rss_mb": sum(r[0] for r in rows) / len(rows) / 1024,
+            "pss_mb": sum(r[1] for r in rows) / len(rows) / 1024,
+            "uss_mb": sum(r[2] for r in rows) / len(rows) / 1024,
+            "total_pss_mb": (sum(r[1] for r in rows) + master[1]) / 1024,
+        }
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,4,16", help="comma-separated worker counts")
+    parser.add_argument("--modes", default="prefork,uvicorn")
+    args = parser.parse_args()
+
+    stub = start_stub()
+    es_host = f"http://127.0.0.1:{stub.server_port}"
+
+    print(f"{'mode':8} {'workers':>7} {'RSS/worker':>11} {'PSS/worker':>11} {'USS/worker':>11} {'total PSS':>10}")
+    for mode in args.modes.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            m = measure(mode, workers, es_host)
+            print(f"{mode:8} {workers:7d} {m['rss_mb']:10.1f}M {m['pss_mb']:10.1f}M "
+                  f"{m['uss_mb']:10.1f}M {m['total_pss_mb']:9.1f}M")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+# gunicorn -c gunicorn.conf.py nlp.main2:app
+#
+# Same model as ``python -m nlp.serve``: the app (spaCy model, vocabulary,
+# synonym index) is imported once in the master and shared copy-on-write
+# by the forked uvicorn workers.
+import os
+
+from nlp.serve import prepare_for_fork
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    # Runs after the app is preloaded and before the first worker is forked
+    prepare_for_fork()
@@ -0,0 +1,161 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from nlp.json_codec import dumps
+
+# Item statuses worth sending again: the cluster was too busy, not the document wrong
+RETRY_STATUSES = {429, 503}
+
+
+def action_lines(action):
+    """NDJSON bytes (action line + source line) for one bulk index action."""
+    meta = {"_index": action["_index"]}
+    if action.get("_id") is not None:
+        meta["_id"] = str(action["_id"])
+    return dumps({"index": meta}) + b"\n" + dumps(action["_source"]) + b"\n"
+
+
+class BulkReport:
+    """Outcome of a BulkIndexer run, with the failures of every chunk that had any."""
+
+    def __init__(self):
+        self.docs = 0
+        self.indexed = 0
+        self.failed = 0
+        self.retried = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.indices = set()
+        self.chunk_failures = []
+
+    @property
+    def docs_per_sec(self):
+        return self.indexed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "docs": self.docs,
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "elapsed": round(self.elapsed, 3),
+            "docs_per_sec": round(self.docs_per_sec, 1),
+            "chunk_failures": self.chunk_failures,
+        }
+
+
+class BulkIndexer:
+    """
+    Streams index actions ({"_index", "_id", "_source"}) into _bulk requests.
+
+    Actions are read lazily from any iterable and cut into chunks of at most
+    chunk_docs documents and chunk_bytes of NDJSON. Up to max_in_flight
+    chunks are sent in parallel; reading the next chunk waits for a free
+    slot, so memory stays bounded however large the catalog is. Items
+    rejected with 429/503 are collected and re-sent together in a smaller
+    _bulk request, with exponential backoff; other item errors, and items
+    the response has no entry for, are recorded against their chunk.
+
+    Give actions an _id (e.g. the MongoDB _id) and a rerun overwrites the
+    same documents instead of adding copies.
+    """
+
+    def __init__(self, client, chunk_docs=500, chunk_bytes=5 * 1024 * 1024, max_in_flight=4,
+                 max_retries=3, retry_backoff=1.0, refresh=None, verbose=True):
+        self.client = client
+        self.chunk_docs = chunk_docs
+        self.chunk_bytes = chunk_bytes
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.refresh = refresh
+        self.verbose = verbose
+
+    def chunks(self, actions):
+        """(lines, indices) per chunk: encoded actions and the indices they write to."""
+        lines, size, indices = [], 0, set()
+        for action in actions:
+            encoded = action_lines(action)
+            if lines and (len(lines) >= self.chunk_docs or size + len(encoded) > self.chunk_bytes):
+                yield lines, indices
+                lines, size, indices = [], 0, set()
+            lines.append(encoded)
+            size += len(encoded)
+            indices.add(action["_index"])
+        if lines:
+            yield lines, indices
+
+    def run(self, actions):
+        report = BulkReport()
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        start = time.perf_counter()
+
+        def send(number, lines, indices):
+            try:
+                indexed, failed, retried, errors = self._send_chunk(lines, indices)
+            except Exception as e:
+                indexed, failed, retried, errors = 0, len(lines), 0, [str(e)]
+            finally:
+                slots.release()
+            with lock:
+                report.indexed += indexed
+                report.failed += failed
+                report.retried += retried
+                if failed:
+                    report.chunk_failures.append({"chunk": number, "docs": len(lines), "failed": failed,
+                                                  "errors": errors[:5]})
+            if failed and self.verbose:
+                print(f"⚠️ Bulk chunk {number}: {failed}/{len(lines)} documents failed: {errors[:3]}")
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for number, (lines, indices) in enumerate(self.chunks(actions)):
+                slots.acquire()  # backpressure: don't read ahead of max_in_flight chunks
+                report.docs += len(lines)
+                report.chunks += 1
+                report.bytes += sum(len(line) for line in lines)
+                report.indices |= indices
+                pool.submit(send, number, lines, indices)
+
+        report.elapsed = time.perf_counter() - start
+        if self.verbose:
+            print(f"📤 Bulk indexed {report.indexed}/{report.docs} documents in {report.chunks} chunks, "
+                  f"{report.elapsed:.1f}s ({report.docs_per_sec:.0f} docs/s), "
+                  f"{report.retried} retried, {report.failed} failed")
+        return report
+
+    def _send_chunk(self, lines, indices):
+        """Send one chunk, re-sending rejected items; (indexed, failed, retried, errors)."""
+        indexed = failed = retried = 0
+        errors = []
+        pending = lines
+        for attempt in range(self.max_retries + 1):
+            result = self.client.bulk_ndjson(b"".join(pending), indices, refresh=self.refresh)
+            items = result.get("items", [])
+            rejected = []
+            for line, item in zip(pending, items):
+                outcome = next(iter(item.values()))
+                status = outcome.get("status", 500)
+                if status < 300:
+                    indexed += 1
+                elif status in RETRY_STATUSES and attempt < self.max_retries:
+                    rejected.append(line)
+                else:
+                    failed += 1
+                    error = outcome.get("error", {})
+                    errors.append(error.get("reason") or error.get("type") or f"status {status}")
+            if len(items) < len(pending):
+                # A truncated response says nothing about the rest; don't count them as indexed
+                missing = len(pending) - len(items)
+                failed += missing
+                errors.append(f"{missing} items missing from the _bulk response")
+            if not rejected:
+                break
+            retried += len(rejected)
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            pending = rejected
+        return indexed, failed, retried, errors
@@ -6,5 +6,108 @@ ELASTICSEARCH_CONFIG = {
     'api_key': os.getenv('ELASTICSEARCH_API_KEY'),
     'cloud_id': os.getenv('ELASTICSEARCH_CLOUD_ID'),
     'index_name': os.getenv('ELASTICSEARCH_INDEX', 'products'),
-    'verify_certs': os.getenv('ELASTICSEARCH_VERIFY_CERTS', 'true').lower() == 'true'
-} 
\ No newline at end of file
+    'verify_certs': os.getenv('ELASTICSEARCH_VERIFY_CERTS', 'true').lower() == 'true',
+    # Search backend: "elasticsearch", or "embedded" to search an in-process
+    # index (nlp.embedded_search) instead of a cluster, loaded at startup from
+    # embedded_catalog (a JSON array or NDJSON file of transformed products);
+    # its writes become searchable embedded_refresh_interval seconds later
+    # (-1: only on refresh), like an index's refresh_interval
+    'backend': os.getenv('SEARCH_BACKEND', 'elasticsearch').lower(),
+    'embedded_catalog': os.getenv('EMBEDDED_CATALOG', ''),
+    'embedded_refresh_interval': float(os.getenv('EMBEDDED_REFRESH_INTERVAL', '1')),
+    # When writes become searchable: "debounce" (one background refresh
+    # refresh_delay seconds after a burst of writes), "wait_for" (each write
+    # waits for the next refresh) or "none" (index refresh_interval only)
+    'refresh_policy': os.getenv('ES_REFRESH_POLICY', 'debounce'),
+    'refresh_delay': float(os.getenv('ES_REFRESH_DELAY', '1.0')),
+    # Pooled connections of the asyncio client used by the API handlers
+    'async_max_connections': int(os.getenv('ES_ASYNC_MAX_CONNECTIONS', '100')),
+    'async_max_keepalive': int(os.getenv('ES_ASYNC_MAX_KEEPALIVE', '20')),
+    'timeout': float(os.getenv('ES_TIMEOUT', '30')),
+    'connect_timeout': float(os.getenv('ES_CONNECT_TIMEOUT', '2')),
+    # Time budget of a /search or /search/batch request, from the API entry
+    # through every Elasticsearch call it makes (timeouts are cut to what is
+    # left); 0 disables
+    'search_deadline': float(os.getenv('ES_SEARCH_DEADLINE', '2')),
+    # Hedged searches: a second identical request once the first has taken
+    # longer than this percentile of recent searches (0 disables), never
+    # sooner than hedge_min_delay seconds
+    'hedge_percentile': float(os.getenv('ES_HEDGE_PERCENTILE', '0')),
+    'hedge_min_delay': float(os.getenv('ES_HEDGE_MIN_DELAY', '0.05')),
+    # Circuit breaker: opens when breaker_failure_ratio of the last
+    # breaker_window calls (at least breaker_min_calls) failed, then lets a
+    # probe through every breaker_reset_timeout seconds
+    'breaker': os.getenv('ES_BREAKER', 'true').lower() == 'true',
+    'breaker_window': int(os.getenv('ES_BREAKER_WINDOW', '20')),
+    'breaker_failure_ratio': float(os.getenv('ES_BREAKER_FAILURE_RATIO', '0.5')),
+    'breaker_min_calls': int(os.getenv('ES_BREAKER_MIN_CALLS', '10')),
+    'breaker_reset_timeout': float(os.getenv('ES_BREAKER_RESET_TIMEOUT', '5')),
+    # Serve cached search results, however old, while Elasticsearch can't answer
+    'serve_stale': os.getenv('ES_SERVE_STALE', 'true').lower() == 'true',
+    # Blocking client transport: connection pools kept (one per host) and
+    # keep-alive connections per host; size pool_maxsize to the worker's threads
+    'pool_connections': int(os.getenv('ES_POOL_CONNECTIONS', '10')),
+    'pool_maxsize': int(os.getenv('ES_POOL_MAXSIZE', '32')),
+    # gzip request bodies of at least compress_min_bytes (bulk, msearch, big queries)
+    'compress_requests': os.getenv('ES_COMPRESS_REQUESTS', 'true').lower() == 'true',
+    'compress_min_bytes': int(os.getenv('ES_COMPRESS_MIN_BYTES', '1024')),
+    'compress_level': int(os.getenv('ES_COMPRESS_LEVEL', '6')),
+    # Retries with exponential backoff (retry_backoff * 2^n s, honouring
+    # Retry-After) on overload/gateway statuses; 0 disables
+    'max_retries': int(os.getenv('ES_MAX_RETRIES', '3')),
+    'retry_backoff': float(os.getenv('ES_RETRY_BACKOFF', '0.5')),
+    'retry_statuses': [int(s) for s in os.getenv('ES_RETRY_STATUSES', '429,502,503').split(',') if s.strip()],
+    # Concurrent identical searches share one in-flight request (single-flight)
+    'single_flight': os.getenv('ES_SINGLE_FLIGHT', 'true').lower() == 'true',
+    # Search result cache, bounded by bytes (0 disables); entries expire after
+    # result_cache_ttl seconds and on any write or refresh of their index
+    'result_cache_max_bytes': int(os.getenv('ES_RESULT_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    'result_cache_ttl': float(os.getenv('ES_RESULT_CACHE_TTL', '30')),
+    # Catalog reloads (bulk_index_stream): chunk limits, parallel requests, and
+    # retries with backoff (retry_backoff * 2^n s) of items rejected with 429/503
+    'bulk_chunk_docs': int(os.getenv('ES_BULK_CHUNK_DOCS', '500')),
+    'bulk_chunk_bytes': int(os.getenv('ES_BULK_CHUNK_BYTES', str(5 * 1024 * 1024))),
+    'bulk_max_in_flight': int(os.getenv('ES_BULK_MAX_IN_FLIGHT', '4')),
+    'bulk_max_retries': int(os.getenv('ES_BULK_MAX_RETRIES', '3')),
+    'bulk_retry_backoff': float(os.getenv('ES_BULK_RETRY_BACKOFF', '1.0')),
+    # Store the search body as a mustache template and send only its parameters
+    'search_template': os.getenv('ES_SEARCH_TEMPLATE', 'false').lower() == 'true',
+    # Result pages: largest size a caller may ask for, and the _source fields
+    # a listing card needs (fields=card on /search)
+    'max_page_size': int(os.getenv('ES_MAX_PAGE_SIZE', '100')),
+    'card_fields': [f.strip() for f in os.getenv(
+        'ES_CARD_FIELDS', 'name,brand,category,color,gender,price,rating,discount,stock'
+    ).split(',') if f.strip()],
+}
+
+PARSER_CONFIG = {
+    'spacy_model': os.getenv('SPACY_MODEL', 'en_core_web_sm'),
+    # "slim" drops parser/ner which query parsing never reads; "full" loads everything
+    'spacy_profile': os.getenv('SPACY_PROFILE', 'slim'),
+    'synonym_path': os.getenv('SYNONYM_PATH', os.path.join(os.path.dirname(__file__), 'synonym.json')),
+    # Seconds between synonym.json change checks; 0 disables hot reload
+    'synonym_reload_interval': float(os.getenv('SYNONYM_RELOAD_INTERVAL', '5')),
+    # Max entries in the LRU of out-of-vocabulary token lemmas
+    'lemma_cache_size': int(os.getenv('LEMMA_CACHE_SIZE', '10000')),
+    # rapidfuzz cdist worker threads for the attribute matcher (-1 = all cores)
+    'fuzzy_workers': int(os.getenv('FUZZY_WORKERS', '1')),
+    # Vocabularies at least this large are matched through the SymSpell
+    # deletion index (edit distance / prefix length) instead of a full scan
+    'fuzzy_index_min_size': int(os.getenv('FUZZY_INDEX_MIN_SIZE', '2000')),
+    'fuzzy_index_distance': int(os.getenv('FUZZY_INDEX_DISTANCE', '2')),
+    'fuzzy_index_prefix_length': int(os.getenv('FUZZY_INDEX_PREFIX_LENGTH', '7')),
+    # Parsed-query cache; size 0 disables it
+    'parse_cache_size': int(os.getenv('PARSE_CACHE_SIZE', '10000')),
+    'parse_cache_ttl': float(os.getenv('PARSE_CACHE_TTL', '300')),
+    # nlp.pipe settings for parse_queries
+    'batch_size': int(os.getenv('PARSE_BATCH_SIZE', '256')),
+    'n_process': int(os.getenv('PARSE_N_PROCESS', '1')),
+    # Parse queries made only of known words without running spaCy; queries
+    # whose possible lemmas allow more combinations than this use spaCy
+    'fast_path': os.getenv('PARSE_FAST_PATH', 'true').lower() == 'true',
+    'fast_path_max_combinations': int(os.getenv('PARSE_FAST_PATH_MAX_COMBINATIONS', '8')),
+    # Per-stage latency histograms for parse_query (exported on /metrics)
+    'stage_metrics': os.getenv('PARSE_STAGE_METRICS', 'false').lower() == 'true',
+    # Precompiled vocabulary (python -m nlp.vocab_artifact build); empty builds at startup
+    'vocab_artifact_path': os.getenv('VOCAB_ARTIFACT_PATH', ''),
+}
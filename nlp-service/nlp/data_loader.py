@@ -1,7 +1,7 @@
 # data_loader.py
 import os
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 
@@ -14,7 +14,8 @@ except ImportError:
     pass
 
 # Import Elasticsearch client
-from es_query import es, INDEX_NAME, bulk_index
+from nlp.es_query import INDEX_NAME, bulk_index_stream
+from nlp.json_codec import dumps
 
 class MongoDBLoader:
     def __init__(self, mongo_uri: str, database_name: str = "ecommerce", collection_name: str = "products"):
@@ -94,6 +95,25 @@ class MongoDBLoader:
             print(f"❌ Error fetching products from MongoDB: {e}")
             return []
     
+    def iter_products(self, limit: int = None, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Stream products from MongoDB, batch_size documents per round trip,
+        without holding the whole collection in memory
+        
+        Args:
+            limit: Maximum number of products to fetch (None for all)
+            batch_size: Documents fetched per cursor batch
+        """
+        if self.collection is None:
+            print("❌ Not connected to MongoDB. Call connect() first.")
+            return
+        
+        print(f"📥 Streaming products from MongoDB collection: {self.collection_name}")
+        cursor = self.collection.find({}).batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        yield from cursor
+    
     def transform_product(self, product: Dict[str, Any]) -> Dict[str, Any]:
         """
         Transform MongoDB product to Elasticsearch format
@@ -153,46 +173,46 @@ class MongoDBLoader:
         return transformed
 
     
-    def index_products_to_elasticsearch(self, products: List[Dict[str, Any]]) -> bool:
+    def product_actions(self, products: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Bulk index actions for products, keyed by their MongoDB _id so a
+        reload overwrites documents instead of duplicating them
+        """
+        for product in products:
+            action = {"_index": INDEX_NAME, "_source": self.transform_product(product)}
+            if product.get('_id') is not None:
+                action["_id"] = str(product['_id'])
+            yield action
+    
+    def index_products_to_elasticsearch(self, products: Iterable[Dict[str, Any]]) -> bool:
         """
         Index products to Elasticsearch
         
         Args:
-            products: List of products to index
+            products: Products to index (a list, or a stream from iter_products)
             
         Returns:
             True if successful, False otherwise
         """
-        if not products:
-            print("⚠️ No products to index")
-            return False
-        
         try:
-            print(f"📤 Indexing {len(products)} products to Elasticsearch...")
+            print(f"📤 Indexing products to Elasticsearch...")
             
-            # Transform products
-            transformed_products = [self.transform_product(product) for product in products]
+            # Chunked, parallel bulk requests with retries (see nlp.bulk_indexer)
+            report = bulk_index_stream(self.product_actions(products))
             
-            # Prepare bulk actions
-            actions = [
-                {
-                    "_index": INDEX_NAME,
-                    "_source": product
-                } for product in transformed_products
-            ]
-            
-            # Bulk index
-            result = bulk_index(es, actions)
+            if report.docs == 0:
+                print("⚠️ No products to index")
+                return False
             
             # Check for errors
-            if result.get('errors', False):
-                print("❌ Some documents failed to index:")
-                for item in result.get('items', []):
-                    if 'index' in item and item['index'].get('error'):
-                        print(f"   Error: {item['index']['error']}")
+            if report.failed:
+                print(f"❌ {report.failed} documents failed to index:")
+                for chunk in report.chunk_failures:
+                    print(f"   Chunk {chunk['chunk']}: {chunk['failed']}/{chunk['docs']} failed, e.g. {chunk['errors'][0]}")
                 return False
             
-            print(f"✅ Successfully indexed {len(products)} products to Elasticsearch")
+            print(f"✅ Successfully indexed {report.indexed} products to Elasticsearch "
+                  f"({report.docs_per_sec:.0f} docs/s)")
             return True
             
         except Exception as e:
@@ -224,14 +244,8 @@ def load_and_index_products_from_mongodb(
         if not loader.connect():
             return False
         
-        # Fetch products
-        products = loader.fetch_products(limit)
-        if not products:
-            print("❌ No products found in MongoDB")
-            return False
-        
-        # Index to Elasticsearch
-        success = loader.index_products_to_elasticsearch(products)
+        # Stream products straight into the bulk indexer
+        success = loader.index_products_to_elasticsearch(loader.iter_products(limit))
         
         return success
         
@@ -239,6 +253,39 @@ def load_and_index_products_from_mongodb(
         # Always disconnect
         loader.disconnect()
 
+def export_products_from_mongodb(
+    mongo_uri: str,
+    path: str,
+    database_name: str = "ecommerce",
+    collection_name: str = "products",
+    limit: int = None
+) -> int:
+    """
+    Write transformed products from MongoDB to an NDJSON file, one product
+    (with its "_id") per line: a catalog for the embedded search backend
+    (SEARCH_BACKEND=embedded, EMBEDDED_CATALOG=path)
+    
+    Returns:
+        Number of products written, or -1 if MongoDB couldn't be reached
+    """
+    loader = MongoDBLoader(mongo_uri, database_name, collection_name)
+    
+    try:
+        if not loader.connect():
+            return -1
+        
+        count = 0
+        with open(path, "wb") as f:
+            for action in loader.product_actions(loader.iter_products(limit)):
+                product = {"_id": action["_id"], **action["_source"]} if "_id" in action else action["_source"]
+                f.write(dumps(product) + b"\n")
+                count += 1
+        print(f"✅ Exported {count} products to {path}")
+        return count
+        
+    finally:
+        loader.disconnect()
+
 # Example usage
 if __name__ == "__main__":
     # Your MongoDB URI
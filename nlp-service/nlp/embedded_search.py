@@ -0,0 +1,994 @@
+"""
+Embedded search backend: the product index in process memory, searched
+with NumPy, for tests, local development and running (and load testing)
+the service without Elasticsearch (SEARCH_BACKEND=embedded).
+
+EmbeddedElasticsearch has SimpleElasticsearch's methods and answers them
+the way Elasticsearch does for the bodies this service sends (see
+nlp.query_compiler): bool queries with term/terms/range filters,
+multi_match scored with BM25 and field boosts, fuzziness AUTO with
+prefix_length and max_expansions, match_all, sort with search_after,
+size/from, _source includes and track_total_hits. es_query and es_async
+(result cache, single-flight, cursors, refresh policy, bulk indexing) run
+on top of it unchanged.
+
+Documents are indexed per the index mapping: text fields (name,
+description) into an inverted index of lowercased word tokens, keyword
+fields (category, color, brand, gender) and numbers (price, rating,
+discount, stock) into columnar arrays that serve filters and sorting. As
+in Elasticsearch, a multi_match reads a keyword field as one term: the
+whole query text.
+
+Writes are buffered and become searchable on refresh (an explicit one,
+refresh=true/wait_for, or refresh_interval seconds after the first
+pending write). Each refresh adds an immutable segment and small segments
+are merged as they pile up; searches read the current segments without
+locking.
+"""
+
+import asyncio
+import base64
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from fnmatch import fnmatchcase
+
+import numpy as np
+from rapidfuzz.distance import OSA
+
+from nlp.json_codec import loads
+from nlp.query_compiler import render_template
+from nlp.resilience import call_timeouts
+
+# Lucene's BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Elasticsearch's index.max_result_window, and the hits it counts exactly
+# when a search doesn't set track_total_hits
+MAX_RESULT_WINDOW = 10000
+DEFAULT_TRACK_TOTAL_HITS = 10000
+
+# A new segment is merged into the one before it while that one holds at
+# most this many times its live documents, so a catalog plus a stream of
+# single-document refreshes stays at a few segments
+MERGE_RATIO = 2
+
+INTEGER_TYPES = ("integer", "long", "short", "byte")
+FLOAT_TYPES = ("float", "double", "half_float", "scaled_float")
+
+# Word tokens, keeping inner apostrophes ("men's") like the standard tokenizer
+_TOKEN = re.compile(r"\w+(?:['’]\w+)*")
+
+
+def analyze(text):
+    """Terms of a text field value or query: lowercased word tokens."""
+    return _TOKEN.findall(text.lower())
+
+
+def fuzzy_distance(term, fuzziness):
+    """Edits allowed for term: fuzziness AUTO (AUTO:3,6), a number, or None."""
+    if not fuzziness:
+        return 0
+    fuzziness = str(fuzziness).upper()
+    if fuzziness.startswith("AUTO"):
+        low, high = (3, 6)
+        if ":" in fuzziness:
+            low, high = (int(n) for n in fuzziness.split(":", 1)[1].split(","))
+        return 0 if len(term) < low else 1 if len(term) < high else 2
+    return min(int(float(fuzziness)), 2)
+
+
+def _error(status, error_type, reason):
+    """What SimpleElasticsearch raises for an Elasticsearch error response"""
+    return Exception(f"Elasticsearch error {status}: {error_type}: {reason}")
+
+
+def _new_id():
+    """A random 20-character _id, like Elasticsearch's"""
+    return base64.urlsafe_b64encode(os.urandom(15)).decode("ascii")
+
+
+def _first(value):
+    if isinstance(value, list):
+        return next((v for v in value if v is not None), None)
+    return value
+
+
+def _keyword(value):
+    value = _first(value)
+    if value is None or isinstance(value, dict):
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _number(value, integer):
+    value = _first(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return math.trunc(number) if integer and math.isfinite(number) else number
+
+
+def _text(value):
+    if isinstance(value, list):
+        value = " ".join(v for v in value if isinstance(v, str))
+    return value if isinstance(value, str) else None
+
+
+def _clauses(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _filter_source(source, spec):
+    """A hit's _source for a _source option (True/None, False, patterns, or includes/excludes)"""
+    if spec is None or spec is True:
+        return dict(source)
+    if spec is False:
+        return None
+    if isinstance(spec, dict):
+        includes = _clauses(spec.get("includes", spec.get("include")))
+        excludes = _clauses(spec.get("excludes", spec.get("exclude")))
+    else:
+        includes, excludes = _clauses(spec), []
+    return {key: value for key, value in source.items()
+            if (not includes or any(fnmatchcase(key, p) for p in includes))
+            and not any(fnmatchcase(key, p) for p in excludes)}
+
+
+class _Segment:
+    """
+    An immutable batch of documents and its index: keyword codes and
+    numbers as columns, text fields as postings (term -> document
+    positions and term frequencies) plus per-document lengths.
+    """
+
+    __slots__ = ("size", "docnos", "ids", "sources", "keywords", "keyword_counts", "numbers", "postings",
+                 "lengths", "vocab", "stats")
+
+    def __init__(self, docnos, ids, sources, keywords, numbers, postings, lengths, dictionaries):
+        self.size = len(ids)
+        self.docnos = docnos
+        self.ids = ids
+        self.sources = sources
+        self.keywords = keywords
+        self.numbers = numbers
+        self.postings = postings
+        self.lengths = lengths
+        # Sorted terms per field, for fuzzy expansion; document counts and
+        # summed lengths per field, for BM25
+        self.vocab = {}
+        self.stats = {}
+        self.keyword_counts = {}
+        for field, codes in keywords.items():
+            counts = np.bincount(codes[codes >= 0])
+            values = list(dictionaries[field])
+            self.keyword_counts[field] = counts
+            self.vocab[field] = sorted(values[code] for code in np.flatnonzero(counts))
+            self.stats[field] = (int(counts.sum()), float(counts.sum()))  # one term each, no norms
+        for field, field_postings in postings.items():
+            self.vocab[field] = sorted(field_postings)
+            self.stats[field] = (int(np.count_nonzero(lengths[field])), float(lengths[field].sum()))
+
+    @classmethod
+    def build(cls, docs, mapping, dictionaries):
+        """Segment of docs, a list of (docno, _id, _source)"""
+        size = len(docs)
+        sources = [source for _, _, source in docs]
+        keywords, numbers, postings, lengths = {}, {}, {}, {}
+        for field, field_type in mapping.items():
+            values = [source.get(field) for source in sources]
+            if field_type == "keyword":
+                codes = dictionaries.setdefault(field, {})
+                column = np.full(size, -1, dtype=np.int32)
+                for i, value in enumerate(values):
+                    value = _keyword(value)
+                    if value is not None:
+                        column[i] = codes.setdefault(value, len(codes))
+                keywords[field] = column
+            elif field_type in INTEGER_TYPES or field_type in FLOAT_TYPES:
+                integer = field_type in INTEGER_TYPES
+                numbers[field] = np.fromiter((_number(v, integer) for v in values), dtype=np.float64, count=size)
+            elif field_type == "text":
+                term_lists = {}
+                field_lengths = np.zeros(size, dtype=np.float32)
+                for i, value in enumerate(values):
+                    value = _text(value)
+                    if not value:
+                        continue
+                    terms = analyze(value)
+                    field_lengths[i] = len(terms)
+                    for term, tf in Counter(terms).items():
+                        entry = term_lists.get(term)
+                        if entry is None:
+                            entry = term_lists[term] = ([], [])
+                        entry[0].append(i)
+                        entry[1].append(tf)
+                postings[field] = {term: (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32))
+                                   for term, (ids, tfs) in term_lists.items()}
+                lengths[field] = field_lengths
+        docnos = np.fromiter((docno for docno, _, _ in docs), dtype=np.int64, count=size)
+        return cls(docnos, [doc_id for _, doc_id, _ in docs], sources, keywords, numbers, postings, lengths,
+                   dictionaries)
+
+    @classmethod
+    def merge(cls, segments, lives, dictionaries):
+        """One segment with the live documents of segments, in order"""
+        keeps, remaps, offset = [], [], 0
+        for segment, live in zip(segments, lives):
+            keep = np.flatnonzero(live)
+            remap = np.full(segment.size, -1, dtype=np.int64)
+            remap[keep] = np.arange(offset, offset + len(keep))
+            keeps.append(keep)
+            remaps.append(remap)
+            offset += len(keep)
+        first = segments[0]
+        ids, sources = [], []
+        for segment, keep in zip(segments, keeps):
+            for i in keep.tolist():
+                ids.append(segment.ids[i])
+                sources.append(segment.sources[i])
+
+        def column(arrays):
+            return np.concatenate([array[keep] for array, keep in zip(arrays, keeps)])
+
+        keywords = {field: column([s.keywords[field] for s in segments]) for field in first.keywords}
+        numbers = {field: column([s.numbers[field] for s in segments]) for field in first.numbers}
+        lengths = {field: column([s.lengths[field] for s in segments]) for field in first.lengths}
+        postings = {}
+        for field in first.postings:
+            parts = {}
+            for segment, remap in zip(segments, remaps):
+                for term, (term_ids, tfs) in segment.postings[field].items():
+                    new_ids = remap[term_ids]
+                    alive = new_ids >= 0
+                    if not alive.all():
+                        new_ids, tfs = new_ids[alive], tfs[alive]
+                    if len(new_ids):
+                        parts.setdefault(term, []).append((new_ids.astype(np.int32), tfs))
+            postings[field] = {
+                term: pieces[0] if len(pieces) == 1 else
+                (np.concatenate([p[0] for p in pieces]), np.concatenate([p[1] for p in pieces]))
+                for term, pieces in parts.items()
+            }
+        return cls(column([s.docnos for s in segments]), ids, sources, keywords, numbers, postings, lengths,
+                   dictionaries)
+
+    def doc_freq(self, field, term, dictionaries):
+        if field in self.postings:
+            entry = self.postings[field].get(term)
+            return 0 if entry is None else len(entry[0])
+        code = dictionaries.get(field, {}).get(term)
+        counts = self.keyword_counts[field]
+        return int(counts[code]) if code is not None and code < len(counts) else 0
+
+
+class _View:
+    """What searches see of an index: its segments and which of their documents are live."""
+
+    __slots__ = ("segments", "lives", "dictionaries", "docs", "_stats", "_expansions")
+
+    def __init__(self, segments, lives, dictionaries):
+        self.segments = tuple(segments)
+        self.lives = tuple(lives)
+        self.dictionaries = dictionaries
+        self.docs = sum(int(np.count_nonzero(live)) for live in self.lives)
+        self._stats = {}
+        for segment in self.segments:
+            for field, (count, total) in segment.stats.items():
+                old_count, old_total = self._stats.get(field, (0, 0.0))
+                self._stats[field] = (old_count + count, old_total + total)
+        self._expansions = {}
+
+    def field_stats(self, field):
+        """(documents with the field, their average length) over every segment, deleted documents included like Lucene"""
+        count, total = self._stats.get(field, (0, 0.0))
+        return count, (total / count if count else 1.0)
+
+    def doc_freq(self, field, term):
+        return sum(segment.doc_freq(field, term, self.dictionaries) for segment in self.segments)
+
+    def expand(self, field, term, distance, prefix_length, max_expansions):
+        """
+        Indexed terms within distance edits (transpositions count as one)
+        of term and sharing its first prefix_length characters, closest
+        first, at most max_expansions: [(term, boost)], boost 1 - edits /
+        shorter length as in Lucene's FuzzyQuery. Cached per view.
+        """
+        key = (field, term, distance, prefix_length, max_expansions)
+        cached = self._expansions.get(key)
+        if cached is not None:
+            return cached
+        prefix = term[:prefix_length]
+        found = {}
+        for segment in self.segments:
+            vocab = segment.vocab.get(field, ())
+            i = bisect_left(vocab, prefix)
+            while i < len(vocab) and vocab[i].startswith(prefix):
+                candidate = vocab[i]
+                i += 1
+                if candidate in found or abs(len(candidate) - len(term)) > distance:
+                    continue
+                edits = OSA.distance(term, candidate, score_cutoff=distance)
+                if edits <= distance:
+                    found[candidate] = edits
+        ranked = sorted(found.items(), key=lambda item: (item[1], item[0]))[:max_expansions]
+        cached = [(t, 1.0 - edits / min(len(t), len(term))) for t, edits in ranked]
+        if len(self._expansions) >= 10000:
+            self._expansions.clear()
+        self._expansions[key] = cached
+        return cached
+
+
+def _parse_field(spec):
+    """("name", 3.0) for "name^3" """
+    field, _, boost = spec.partition("^")
+    return field, float(boost) if boost else 1.0
+
+
+def _single(query, kind):
+    if not isinstance(query, dict) or len(query) != 1:
+        raise _error(400, "parsing_exception", f"[{kind}] query malformed")
+    return next(iter(query.items()))
+
+
+class EmbeddedIndex:
+    """
+    One index: buffered writes, segments, and searches over them. Fields
+    are indexed as their mapping type says; unmapped fields are only
+    stored in _source.
+    """
+
+    def __init__(self, name, mappings=None, refresh_interval=1.0):
+        self.name = name
+        properties = (mappings or {}).get("properties", {})
+        self.mapping = {field: spec.get("type") for field, spec in properties.items() if isinstance(spec, dict)}
+        self.refresh_interval = refresh_interval
+        # keyword field -> value -> code; append-only, shared by every segment
+        self.dictionaries = {}
+        self._lock = threading.Lock()
+        self._pending = {}  # _id -> _source, or None for a delete
+        self._pending_since = None
+        self._locations = {}  # _id -> (segment, position) of its searchable copy
+        self._next_docno = 0
+        self.view = _View((), (), self.dictionaries)
+        self.refreshes = 0
+        self.merges = 0
+
+    def exists(self, doc_id):
+        """Whether the latest write of doc_id (searchable or not) left a document"""
+        with self._lock:
+            if doc_id in self._pending:
+                return self._pending[doc_id] is not None
+            return doc_id in self._locations
+
+    def _write(self, doc_id, source):
+        with self._lock:
+            existed = self._pending[doc_id] is not None if doc_id in self._pending else doc_id in self._locations
+            self._pending.pop(doc_id, None)  # a rewrite is a new document, last in _doc order
+            self._pending[doc_id] = source
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+        return existed
+
+    def put(self, doc_id, source):
+        """Index (or overwrite) a document; "created" or "updated"."""
+        return "updated" if self._write(doc_id, dict(source)) else "created"
+
+    def delete(self, doc_id):
+        """Delete a document; whether it existed."""
+        return self._write(doc_id, None)
+
+    def refresh_due(self):
+        since = self._pending_since
+        return since is not None and 0 <= self.refresh_interval <= time.monotonic() - since
+
+    def refresh(self):
+        """Make pending writes searchable; False if there were none."""
+        with self._lock:
+            if not self._pending:
+                return False
+            pending, self._pending, self._pending_since = self._pending, {}, None
+            segments, lives = list(self.view.segments), list(self.view.lives)
+            positions = {id(segment): i for i, segment in enumerate(segments)}
+            copied = set()
+            docs = []
+            for doc_id, source in pending.items():
+                location = self._locations.pop(doc_id, None)
+                if location is not None:
+                    i = positions[id(location[0])]
+                    if i not in copied:  # searches may be reading the old live mask
+                        lives[i] = lives[i].copy()
+                        copied.add(i)
+                    lives[i][location[1]] = False
+                if source is not None:
+                    docs.append((self._next_docno, doc_id, source))
+                    self._next_docno += 1
+            if docs:
+                segment = _Segment.build(docs, self.mapping, self.dictionaries)
+                segments.append(segment)
+                lives.append(np.ones(segment.size, dtype=bool))
+                for position, (_, doc_id, _) in enumerate(docs):
+                    self._locations[doc_id] = (segment, position)
+            self._merge(segments, lives)
+            self.view = _View(segments, lives, self.dictionaries)
+            self.refreshes += 1
+        return True
+
+    def _merge(self, segments, lives):
+        while len(segments) > 1 and np.count_nonzero(lives[-2]) <= MERGE_RATIO * np.count_nonzero(lives[-1]):
+            merged = _Segment.merge(segments[-2:], lives[-2:], self.dictionaries)
+            segments[-2:] = [merged]
+            lives[-2:] = [np.ones(merged.size, dtype=bool)]
+            for position, doc_id in enumerate(merged.ids):
+                self._locations[doc_id] = (merged, position)
+            self.merges += 1
+
+    def stats(self):
+        view = self.view
+        return {"docs": view.docs, "segments": len(view.segments), "pending": len(self._pending),
+                "refreshes": self.refreshes, "merges": self.merges}
+
+    # Queries compile against a view into functions of a segment that
+    # return (matching documents, their scores), both arrays over the
+    # segment with scores 0 where the query doesn't match. In filter
+    # context only the matching documents are computed.
+
+    def _compile(self, query, view):
+        kind, spec = _single(query, "query")
+        if kind == "match_all":
+            boost = (spec or {}).get("boost", 1.0)
+            return lambda segment: (np.ones(segment.size, dtype=bool), np.full(segment.size, boost))
+        if kind == "bool":
+            return self._compile_bool(spec, view)
+        if kind in ("term", "terms", "range"):
+            matches, boost = self._compile_mask(kind, spec)
+
+            def run(segment):
+                mask = matches(segment)
+                return mask, np.where(mask, boost, 0.0)
+            return run
+        if kind in ("multi_match", "match"):
+            if kind == "match":
+                field, spec = _single(spec, kind)
+                spec = dict(spec, fields=[field]) if isinstance(spec, dict) else {"query": spec, "fields": [field]}
+            return self._compile_text(spec, view)
+        raise _error(400, "parsing_exception", f"[{kind}] query is not supported by the embedded backend")
+
+    def _compile_filter(self, query, view):
+        kind, spec = _single(query, "query")
+        if kind in ("term", "terms", "range"):
+            return self._compile_mask(kind, spec)[0]
+        compiled = self._compile(query, view)
+        return lambda segment: compiled(segment)[0]
+
+    def _compile_mask(self, kind, spec):
+        """(function of a segment -> matching documents, boost) of a term, terms or range query"""
+        field, values = _single(spec, kind)
+        if kind == "range":
+            return (lambda segment: self._range_mask(segment, field, values)), values.get("boost", 1.0)
+        boost = 1.0
+        if kind == "term":
+            if isinstance(values, dict):
+                boost = values.get("boost", 1.0)
+                values = values.get("value")
+            values = [values]
+        return (lambda segment: self._term_mask(segment, field, values)), boost
+
+    def _compile_bool(self, spec, view):
+        filters = [self._compile_filter(q, view) for q in _clauses(spec.get("filter"))]
+        musts = [self._compile(q, view) for q in _clauses(spec.get("must"))]
+        must_nots = [self._compile_filter(q, view) for q in _clauses(spec.get("must_not"))]
+        shoulds = [self._compile(q, view) for q in _clauses(spec.get("should"))]
+        if not (filters or musts or must_nots or shoulds):
+            return self._compile({"match_all": {}}, view)
+        minimum = int(spec.get("minimum_should_match", 0 if filters or musts or must_nots else 1))
+
+        def run(segment):
+            mask = np.ones(segment.size, dtype=bool)
+            scores = np.zeros(segment.size)
+            for clause in filters:
+                mask &= clause(segment)
+            for clause in must_nots:
+                mask &= ~clause(segment)
+            for clause in musts:
+                matched, clause_scores = clause(segment)
+                mask &= matched
+                scores += clause_scores
+            if shoulds:
+                matched_count = np.zeros(segment.size, dtype=np.int32)
+                for clause in shoulds:
+                    matched, clause_scores = clause(segment)
+                    matched_count += matched
+                    scores += clause_scores
+                if minimum:
+                    mask &= matched_count >= minimum
+            scores[~mask] = 0.0
+            return mask, scores
+        return run
+
+    def _term_mask(self, segment, field, values):
+        if field in segment.keywords:
+            codes = self.dictionaries.get(field, {})
+            table = np.zeros(len(codes) + 1, dtype=bool)  # the last entry serves code -1 (missing)
+            table[[codes[v] for v in (_keyword(v) for v in values) if v in codes]] = True
+            return table[segment.keywords[field]]
+        if field in segment.numbers:
+            return np.isin(segment.numbers[field], [_number(v, False) for v in values])
+        if field in segment.postings:
+            mask = np.zeros(segment.size, dtype=bool)
+            for value in values:
+                entry = segment.postings[field].get(str(value))
+                if entry is not None:
+                    mask[entry[0]] = True
+            return mask
+        return np.zeros(segment.size, dtype=bool)
+
+    def _range_mask(self, segment, field, bounds):
+        column = segment.numbers.get(field)
+        if column is None:
+            if field in self.mapping:
+                raise _error(400, "query_shard_exception",
+                             f"range on [{field}] is not supported by the embedded backend")
+            return np.zeros(segment.size, dtype=bool)
+        mask = ~np.isnan(column)
+        for op, compare in (("gt", np.greater), ("gte", np.greater_equal), ("lt", np.less),
+                            ("lte", np.less_equal)):
+            if bounds.get(op) is not None:
+                mask &= compare(column, float(bounds[op]))
+        return mask
+
+    def _compile_text(self, spec, view):
+        """
+        multi_match (best_fields): per field, the sum over query terms of
+        BM25 scores times the field boost; a document scores its best field.
+        A fuzzy term matches its expansions, weighted by their fuzzy boost
+        with one document frequency (the highest) for all of them.
+        """
+        text = str(spec.get("query", ""))
+        distance_setting = spec.get("fuzziness")
+        prefix_length = int(spec.get("prefix_length", 0))
+        max_expansions = int(spec.get("max_expansions", 50))
+        fields = []
+        for field, boost in (_parse_field(f) for f in spec.get("fields", ())):
+            field_type = self.mapping.get(field)
+            if field_type == "text":
+                terms = analyze(text)
+            elif field_type == "keyword":
+                terms = [text]  # not analyzed: the whole text is one term
+            else:
+                continue
+            doc_count, avg_length = view.field_stats(field)
+            weighted = []
+            for term in terms:
+                distance = fuzzy_distance(term, distance_setting)
+                if distance:
+                    expansions = view.expand(field, term, distance, prefix_length, max_expansions)
+                else:
+                    expansions = [(term, 1.0)]
+                frequencies = [view.doc_freq(field, t) for t, _ in expansions]
+                if not any(frequencies):
+                    continue
+                df = max(frequencies)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                weighted.extend((t, boost * fuzzy_boost * idf) for t, fuzzy_boost in expansions)
+            fields.append((field, field_type, avg_length, weighted))
+
+        def run(segment):
+            best = np.zeros(segment.size)
+            for field, field_type, avg_length, weighted in fields:
+                if weighted:
+                    np.maximum(best, self._field_scores(segment, field, field_type, avg_length, weighted), out=best)
+            return best > 0, best
+        return run
+
+    def _field_scores(self, segment, field, field_type, avg_length, weighted):
+        if field_type == "keyword":
+            # One term per document and no length norm: a lookup by code
+            codes = self.dictionaries.get(field, {})
+            table = np.zeros(len(codes) + 1)  # the last entry serves code -1 (missing)
+            for term, weight in weighted:
+                code = codes.get(term)
+                if code is not None:
+                    table[code] += weight / (1 + BM25_K1)
+            return table[segment.keywords[field]]
+        scores = np.zeros(segment.size)
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * segment.lengths[field] / avg_length)
+        postings = segment.postings[field]
+        for term, weight in weighted:
+            entry = postings.get(term)
+            if entry is not None:
+                ids, tfs = entry
+                scores[ids] += weight * tfs / (tfs + norms[ids])  # ids are unique within a posting list
+        return scores
+
+    def search(self, body):
+        """A _search response for body"""
+        start = time.perf_counter()
+        view = self.view
+        size = int(body.get("size", 10))
+        offset = int(body.get("from", 0))
+        if offset + size > MAX_RESULT_WINDOW:
+            raise _error(400, "illegal_argument_exception",
+                         f"Result window is too large, from + size must be less than or equal to: "
+                         f"[{MAX_RESULT_WINDOW}] but was [{offset + size}]")
+        query = self._compile(body.get("query") or {"match_all": {}}, view)
+        sort = self._sort_specs(body.get("sort"))
+
+        matches, scores = [], []
+        for segment, live in zip(view.segments, view.lives):
+            matched, segment_scores = query(segment)
+            matched = np.flatnonzero(matched & live)
+            matches.append(matched)
+            scores.append(segment_scores[matched].astype(np.float32))  # Lucene scores are floats
+        segment_ids = np.repeat(np.arange(len(matches), dtype=np.int32), [len(m) for m in matches])
+        positions = np.concatenate(matches) if matches else np.zeros(0, dtype=np.int64)
+        scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+        total = len(positions)
+
+        keys, values = [], []
+        for field, descending in sort:
+            column = self._sort_column(view, field, matches, scores)
+            key = -column if descending else column.copy()
+            key[np.isnan(column)] = np.inf  # missing values sort last either way
+            keys.append(key)
+            values.append(column)
+        rows = np.arange(total)
+        after = body.get("search_after")
+        if after is not None:
+            if len(after) != len(sort):
+                raise _error(400, "illegal_argument_exception",
+                             f"search_after has {len(after)} value(s) but sort has {len(sort)}")
+            rows = np.flatnonzero(self._after(keys, sort, after))
+        top = self._top([key[rows] for key in keys], offset + size)
+        rows = rows[top][offset:offset + size]
+
+        source = body.get("_source")
+        hits = []
+        for row in rows.tolist():
+            segment = view.segments[segment_ids[row]]
+            position = positions[row]
+            hit = {"_index": self.name, "_id": segment.ids[position], "_score": float(scores[row])}
+            hit_source = _filter_source(segment.sources[position], source)
+            if hit_source is not None:
+                hit["_source"] = hit_source
+            hit["sort"] = [self._sort_value(field, column[row]) for (field, _), column in zip(sort, values)]
+            hits.append(hit)
+
+        hits_section = {"max_score": None, "hits": hits}
+        track = body.get("track_total_hits", DEFAULT_TRACK_TOTAL_HITS)
+        if track is True or (track is not False and total <= track):
+            hits_section["total"] = {"value": total, "relation": "eq"}
+        elif track is not False:
+            hits_section["total"] = {"value": int(track), "relation": "gte"}
+        return {
+            "took": int((time.perf_counter() - start) * 1000),
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": hits_section,
+        }
+
+    @staticmethod
+    def _sort_specs(sort):
+        """[(field, descending)] for a sort option"""
+        specs = []
+        for item in _clauses(sort) or [{"_score": "desc"}]:
+            if isinstance(item, str):
+                field, order = item, "desc" if item == "_score" else "asc"
+            else:
+                field, order = _single(item, "sort")
+                if isinstance(order, dict):
+                    order = order.get("order", "desc" if field == "_score" else "asc")
+            specs.append((field, order == "desc"))
+        return specs
+
+    def _sort_column(self, view, field, matches, scores):
+        """A sort field's values for the matching documents, as floats (NaN: missing)"""
+        if field == "_score":
+            return scores.astype(np.float64)
+        if field == "_doc":
+            columns = [segment.docnos for segment in view.segments]
+        elif self.mapping.get(field) in INTEGER_TYPES + FLOAT_TYPES:
+            columns = [segment.numbers[field] for segment in view.segments]
+        else:
+            raise _error(400, "illegal_argument_exception",
+                         f"sorting on [{field}] is not supported by the embedded backend")
+        if not columns:
+            return np.zeros(0)
+        return np.concatenate([column[matched] for column, matched in zip(columns, matches)]).astype(np.float64)
+
+    def _sort_value(self, field, value):
+        if field == "_score":
+            return float(value)
+        if field == "_doc" or self.mapping.get(field) in INTEGER_TYPES:
+            return None if math.isnan(value) else int(value)
+        return None if math.isnan(value) else float(value)
+
+    @staticmethod
+    def _after(keys, sort, after):
+        """Rows that sort after the search_after values"""
+        count = len(keys[0]) if keys else 0
+        greater = np.zeros(count, dtype=bool)
+        equal = np.ones(count, dtype=bool)
+        for key, (_, descending), value in zip(keys, sort, after):
+            value = math.inf if value is None else (-float(value) if descending else float(value))
+            greater |= equal & (key > value)
+            equal &= key == value
+        return greater
+
+    @classmethod
+    def _top(cls, keys, k):
+        """Positions of the k rows that sort first by keys (ascending), in order"""
+        count = len(keys[0]) if keys else 0
+        if not k or not count:
+            return np.zeros(0, dtype=np.int64)
+        chosen = cls._select(keys, np.arange(count), k, 0)
+        return chosen[np.lexsort([key[chosen] for key in reversed(keys)])]
+
+    @classmethod
+    def _select(cls, keys, rows, k, level):
+        """The k first of rows (any order): partition on one key, then break ties at its kth value on the next"""
+        if len(rows) <= k:
+            return rows
+        values = keys[level][rows]
+        if level == len(keys) - 1:
+            return rows[np.argpartition(values, k - 1)[:k]]
+        kth = np.partition(values, k - 1)[k - 1]
+        better = rows[values < kth]
+        ties = rows[values == kth]
+        return np.concatenate([better, cls._select(keys, ties, k - len(better), level + 1)])
+
+
+class EmbeddedElasticsearch:
+    """
+    In-process stand-in for SimpleElasticsearch: the same methods and
+    responses, answered from EmbeddedIndex instances instead of a cluster.
+    Searches honour an expired deadline (nlp.resilience) but never time out
+    or fail otherwise, so breakers and hedging have nothing to do.
+    """
+
+    def __init__(self, refresh_interval=1.0):
+        self.refresh_interval = refresh_interval
+        self.indices = {}
+        self.scripts = {}
+        self.write_listeners = []
+        self._lock = threading.Lock()
+
+    def _written(self, *indices):
+        """Tell write listeners (e.g. the result cache) which indices changed"""
+        for index in indices:
+            for listener in self.write_listeners:
+                listener(index)
+
+    def _index(self, name, create=False):
+        index = self.indices.get(name)
+        if index is None:
+            if not create:
+                raise _error(404, "index_not_found_exception", f"no such index [{name}]")
+            with self._lock:
+                index = self.indices.setdefault(name, EmbeddedIndex(name, refresh_interval=self.refresh_interval))
+        return index
+
+    def _searchable(self, name):
+        """The index, refreshed first when refresh_interval has passed since a pending write"""
+        index = self._index(name)
+        if index.refresh_due() and index.refresh():
+            self._written(name)
+        return index
+
+    def ping(self):
+        """Test connection"""
+        return True
+
+    def info(self):
+        """Get cluster info"""
+        return {"name": "embedded", "cluster_name": "embedded", "version": {"number": "embedded"}}
+
+    def index_exists(self, index):
+        """Check if index exists"""
+        return index in self.indices
+
+    def create_index(self, index, body=None):
+        """Create index (its mappings say how each field is indexed)"""
+        try:
+            with self._lock:
+                if index in self.indices:
+                    raise _error(400, "resource_already_exists_exception", f"index [{index}] already exists")
+                self.indices[index] = EmbeddedIndex(index, (body or {}).get("mappings"), self.refresh_interval)
+            return {"acknowledged": True, "index": index}
+        finally:
+            self._written(index)
+
+    def delete_index(self, index):
+        """Delete index"""
+        try:
+            with self._lock:
+                if self.indices.pop(index, None) is None:
+                    raise _error(404, "index_not_found_exception", f"no such index [{index}]")
+            return {"acknowledged": True}
+        finally:
+            self._written(index)
+
+    def index_document(self, index, body, doc_id=None, refresh=None):
+        """Index a document (refresh: None, "true" or "wait_for")"""
+        try:
+            target = self._index(index, create=True)
+            doc_id = str(doc_id) if doc_id else _new_id()
+            result = target.put(doc_id, body)
+            if refresh:
+                target.refresh()
+            return {"_index": index, "_id": doc_id, "result": result}
+        finally:
+            self._written(index)
+
+    def bulk(self, actions, refresh=None):
+        """Bulk index documents"""
+        actions = list(actions)
+        return self._bulk([("index", action["_index"], action.get("_id"), action["_source"]) for action in actions],
+                          refresh)
+
+    def bulk_ndjson(self, body, indices=(), refresh=None):
+        """Apply a prebuilt _bulk NDJSON body (index, create and delete actions)"""
+        lines = iter(line for line in body.splitlines() if line.strip())
+        operations = []
+        for line in lines:
+            (op, meta), = loads(line).items()
+            source = None if op == "delete" else loads(next(lines))
+            operations.append((op, meta.get("_index"), meta.get("_id"), source))
+        return self._bulk(operations, refresh)
+
+    def _bulk(self, operations, refresh):
+        start = time.perf_counter()
+        items = []
+        written = set()
+        try:
+            for op, index, doc_id, source in operations:
+                written.add(index)
+                if op == "delete":
+                    found = doc_id is not None and index in self.indices and self.indices[index].delete(str(doc_id))
+                    items.append({"delete": {"_index": index, "_id": doc_id, "result": "deleted" if found else
+                                             "not_found", "status": 200 if found else 404}})
+                    continue
+                target = self._index(index, create=True)
+                doc_id = str(doc_id) if doc_id is not None else _new_id()
+                if op == "create" and target.exists(doc_id):
+                    items.append({op: {"_index": index, "_id": doc_id, "status": 409, "error": {
+                        "type": "version_conflict_engine_exception", "reason": "document already exists"}}})
+                    continue
+                result = target.put(doc_id, source)
+                items.append({op: {"_index": index, "_id": doc_id, "result": result,
+                                   "status": 200 if result == "updated" else 201}})
+            if refresh:
+                for index in written & self.indices.keys():
+                    self.indices[index].refresh()
+            return {"took": int((time.perf_counter() - start) * 1000),
+                    "errors": any(next(iter(item.values()))["status"] >= 300 for item in items), "items": items}
+        finally:
+            self._written(*written)
+
+    def search(self, index, body, filter_path=None):
+        """Search documents (filter_path is accepted; the response is never sent anywhere to trim)"""
+        call_timeouts(None, None)  # raises DeadlineExceeded once the deadline has passed
+        return self._searchable(index).search(body)
+
+    def search_template(self, index, body, filter_path=None):
+        """Search with a stored template: body is {"id": ..., "params": {...}}"""
+        source = self.scripts.get(body.get("id")) if "id" in body else body.get("source")
+        if source is None:
+            raise _error(404, "resource_not_found_exception", f"unable to find script [{body.get('id')}]")
+        return self.search(index, render_template(body.get("params", {}), source), filter_path)
+
+    def put_script(self, script_id, body):
+        """Store a script or search template"""
+        self.scripts[script_id] = body["script"]["source"]
+        return {"acknowledged": True}
+
+    def msearch(self, index, bodies):
+        """Run several searches against one index, like a single _msearch request"""
+        call_timeouts(None, None)
+        responses = []
+        for body in bodies:
+            try:
+                responses.append(dict(self._searchable(index).search(body), status=200))
+            except Exception as e:
+                responses.append({"error": {"type": "search_phase_execution_exception", "reason": str(e)},
+                                  "status": 400})
+        return {"took": sum(r.get("took", 0) for r in responses), "responses": responses}
+
+    def refresh(self, index):
+        """Refresh index"""
+        try:
+            self._index(index).refresh()
+            return {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+        finally:
+            self._written(index)
+
+    def load(self, index, products):
+        """
+        Index products (data_loader.MongoDBLoader.transform_product dicts; an
+        "_id" key, if any, is the document _id) and make them searchable;
+        returns how many were loaded.
+        """
+        target = self._index(index, create=True)
+        count = 0
+        for product in products:
+            source = dict(product)
+            doc_id = source.pop("_id", None)
+            target.put(str(doc_id) if doc_id is not None else _new_id(), source)
+            count += 1
+        self.refresh(index)
+        return count
+
+    def load_catalog(self, index, path):
+        """load() the products in a JSON array (.json) or NDJSON file at path"""
+        with open(path, "rb") as f:
+            if path.endswith(".json"):
+                return self.load(index, loads(f.read()))
+            return self.load(index, (loads(line) for line in f if line.strip()))
+
+    def stats(self):
+        return {name: index.stats() for name, index in self.indices.items()}
+
+
+class AsyncEmbeddedElasticsearch:
+    """
+    asyncio counterpart of EmbeddedElasticsearch, with
+    AsyncSimpleElasticsearch's methods: each call runs on the wrapped client
+    in a worker thread, so a large search doesn't hold up the event loop.
+    Writes notify the wrapped client's write listeners.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.write_listeners = []
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"hedges": 0, "hedge_wins": 0, "hedge_delay": 0.0}
+
+    async def ping(self):
+        return self.client.ping()
+
+    async def info(self):
+        return self.client.info()
+
+    async def index_exists(self, index):
+        return self.client.index_exists(index)
+
+    async def create_index(self, index, body=None):
+        return await asyncio.to_thread(self.client.create_index, index, body)
+
+    async def delete_index(self, index):
+        return await asyncio.to_thread(self.client.delete_index, index)
+
+    async def index_document(self, index, body, doc_id=None, refresh=None):
+        return await asyncio.to_thread(self.client.index_document, index, body, doc_id, refresh)
+
+    async def bulk(self, actions, refresh=None):
+        return await asyncio.to_thread(self.client.bulk, actions, refresh)
+
+    async def search(self, index, body, filter_path=None):
+        return await asyncio.to_thread(self.client.search, index, body, filter_path)
+
+    async def search_template(self, index, body, filter_path=None):
+        return await asyncio.to_thread(self.client.search_template, index, body, filter_path)
+
+    async def put_script(self, script_id, body):
+        return self.client.put_script(script_id, body)
+
+    async def msearch(self, index, bodies):
+        return await asyncio.to_thread(self.client.msearch, index, bodies)
+
+    async def refresh(self, index):
+        return await asyncio.to_thread(self.client.refresh, index)
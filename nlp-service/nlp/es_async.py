@@ -0,0 +1,361 @@
+import asyncio
+import os
+import time
+
+import httpx
+
+from nlp import config
+from nlp.embedded_search import AsyncEmbeddedElasticsearch
+from nlp.es_query import (
+    EMBEDDED, ES_BREAKER, ES_METRICS, INDEX_NAME, REFRESH_POLICY, RESULT_CACHE, SEARCH_FILTER_PATH,
+    build_search_body, build_search_request, bulk_body, msearch_body, msearch_sources, own_page,
+    es, gzip_body, request_failed, response_error, search_params, search_response_page, stale_page,
+)
+from nlp.json_codec import dumps, loads
+from nlp.resilience import ElasticsearchUnavailable, LatencyWindow, call_timeouts, hedged, remaining
+from nlp.result_cache import body_key
+from nlp.single_flight import AsyncSingleFlight
+
+
+class AsyncSimpleElasticsearch:
+    """
+    asyncio counterpart of SimpleElasticsearch, with the same methods, on a
+    pooled httpx.AsyncClient. Awaiting a round trip lets the event loop
+    serve other requests instead of blocking on the socket.
+
+    The HTTP client is created on first use, so it binds to the loop of the
+    worker that uses it (not the master that imported this module).
+
+    The transport is tuned like SimpleElasticsearch's: max_connections
+    pooled connections (max_keepalive kept idle), gzip request bodies of at
+    least compress_min_bytes, and up to max_retries retries of connect
+    errors and of retry_statuses with exponential backoff (Retry-After is
+    honoured). Writes that aren't idempotent (an id-less _doc, _bulk) are
+    only retried on 429.
+
+    Timeouts and the breaker work as in SimpleElasticsearch. Searches can
+    also be hedged: with hedge_percentile set, a search still running after
+    that percentile of recent search latencies (at least hedge_min_delay)
+    is sent a second time and the first answer wins.
+    """
+
+    def __init__(self, host, username, password, max_connections=100, max_keepalive=20,
+                 compress=False, compress_min_bytes=1024, compress_level=6,
+                 max_retries=0, retry_backoff=0.0, retry_statuses=(), timeout=30.0,
+                 connect_timeout=None, breaker=None, hedge_percentile=0, hedge_min_delay=0.05):
+        self.host = host.rstrip('/')
+        self.auth = (username, password) if username and password else None
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.compress_level = compress_level
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.write_retry_statuses = self.retry_statuses & {429}
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.search_latency = LatencyWindow()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._client = None
+        self.write_listeners = []
+        os.register_at_fork(after_in_child=self._forget_client)
+
+    def _forget_client(self):
+        # A client (and its sockets) from before a fork belongs to the parent
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # The transport retries connect errors; _request retries statuses
+            transport = httpx.AsyncHTTPTransport(verify=False, limits=self.limits, retries=self.max_retries)
+            self._client = httpx.AsyncClient(
+                base_url=self.host, auth=self.auth, transport=transport, timeout=self.timeout
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method, path, data=None, content_type="application/json", hedge=False,
+                       idempotent=True):
+        """
+        Make HTTP request to Elasticsearch (hedge: an idempotent read that may
+        be sent twice; idempotent=False: retried on 429 only)
+        """
+        headers = {"Content-Type": content_type}
+        if data and not isinstance(data, (str, bytes)):
+            data = dumps(data)
+        if data and self.compress:
+            data = gzip_body(data, headers, self.compress_min_bytes, self.compress_level)
+
+        delay = self.hedge_delay() if hedge else None
+        retry_statuses = self.retry_statuses if idempotent else self.write_retry_statuses
+        if self.breaker is not None:
+            self.breaker.before_call()
+
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                connect, read = call_timeouts(self.timeout, self.connect_timeout)
+                timeout = httpx.Timeout(read, connect=connect)
+
+                def send():
+                    return self.client.request(method, path, content=data, headers=headers, timeout=timeout)
+
+                if delay is None:
+                    response = await send()
+                else:
+                    response, hedge_won = await hedged(send, delay)
+                    if hedge_won is not None:
+                        self.hedges += 1
+                        self.hedge_wins += hedge_won
+            except httpx.HTTPError as e:
+                raise request_failed(self.breaker, e) from e
+            except BaseException:
+                if self.breaker is not None:
+                    self.breaker.record(None)
+                raise
+            wait = self.retry_wait(attempt, response) if response.status_code in retry_statuses else None
+            if wait is None:
+                break
+            attempt += 1
+            await asyncio.sleep(wait)
+
+        if response.status_code >= 400:
+            raise response_error(self.breaker, response.status_code, response.text)
+        if self.breaker is not None:
+            self.breaker.record(True)
+        if hedge:
+            self.search_latency.observe(time.perf_counter() - start)
+
+        return loads(response.content) if response.content else {}
+
+    def retry_wait(self, attempt, response):
+        """
+        Seconds to wait before retrying response (Retry-After, else
+        retry_backoff * 2^attempt), or None if it isn't retried: no retries
+        left, or the wait would outlast the deadline.
+        """
+        if attempt >= self.max_retries:
+            return None
+        try:
+            wait = float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            wait = self.retry_backoff * 2 ** attempt
+        left = remaining()
+        return None if left is not None and wait >= left else wait
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging a search, or None not to hedge it"""
+        if not self.hedge_percentile or (self.breaker is not None and self.breaker.state != self.breaker.CLOSED):
+            return None  # a struggling cluster doesn't need twice the searches
+        threshold = self.search_latency.percentile(self.hedge_percentile)
+        if threshold is None:
+            return None
+        delay = max(threshold, self.hedge_min_delay)
+        left = remaining()
+        return None if left is not None and delay >= left else delay
+
+    def stats(self):
+        return {"hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                "hedge_delay": self.hedge_delay() or 0.0}
+
+    def _written(self, *indices):
+        """Tell write listeners (e.g. the result cache) which indices changed"""
+        for index in indices:
+            for listener in self.write_listeners:
+                listener(index)
+
+    async def ping(self):
+        """Test connection"""
+        try:
+            await self._request('GET', '/')
+            return True
+        except Exception:
+            return False
+
+    async def info(self):
+        """Get cluster info"""
+        return await self._request('GET', '/')
+
+    async def index_exists(self, index):
+        """Check if index exists"""
+        try:
+            await self._request('HEAD', f'/{index}')
+            return True
+        except Exception:
+            return False
+
+    async def create_index(self, index, body=None):
+        """Create index"""
+        try:
+            return await self._request('PUT', f'/{index}', body)
+        finally:
+            self._written(index)
+
+    async def delete_index(self, index):
+        """Delete index"""
+        try:
+            return await self._request('DELETE', f'/{index}')
+        finally:
+            self._written(index)
+
+    async def index_document(self, index, body, doc_id=None, refresh=None):
+        """Index a document (refresh: None, "true" or "wait_for")"""
+        params = f'?refresh={refresh}' if refresh else ''
+        try:
+            if doc_id:
+                return await self._request('PUT', f'/{index}/_doc/{doc_id}{params}', body)
+            return await self._request('POST', f'/{index}/_doc{params}', body, idempotent=False)
+        finally:
+            self._written(index)
+
+    async def bulk(self, actions, refresh=None):
+        """Bulk index documents"""
+        params = f'?refresh={refresh}' if refresh else ''
+        try:
+            return await self._request('POST', f'/_bulk{params}', bulk_body(actions), content_type="application/x-ndjson",
+                                       idempotent=False)
+        finally:
+            # Even a failed bulk may have applied some of its actions
+            self._written(*{action["_index"] for action in actions})
+
+    async def search(self, index, body, filter_path=None):
+        """Search documents (filter_path: only these response fields)"""
+        return await self._request('POST', f'/{index}/_search{search_params(filter_path)}', body, hedge=True)
+
+    async def search_template(self, index, body, filter_path=None):
+        """Search with a stored template: body is {"id": ..., "params": {...}}"""
+        # _search/template takes no timeout parameter; the client timeouts still apply
+        path = f'/{index}/_search/template{search_params(filter_path, timeout=False)}'
+        return await self._request('POST', path, body, hedge=True)
+
+    async def put_script(self, script_id, body):
+        """Store a script or search template"""
+        return await self._request('PUT', f'/_scripts/{script_id}', body)
+
+    async def msearch(self, index, bodies):
+        """Run several searches against one index in a single _msearch request"""
+        return await self._request('POST', '/_msearch', msearch_body(index, bodies), content_type="application/x-ndjson",
+                                   hedge=True)
+
+    async def refresh(self, index):
+        """Refresh index"""
+        try:
+            return await self._request('POST', f'/{index}/_refresh')
+        finally:
+            self._written(index)
+
+
+def get_async_elasticsearch_client():
+    """
+    Async client for the same cluster as es_query.es (already checked at
+    import), or for its in-process index with SEARCH_BACKEND=embedded.
+    """
+    if EMBEDDED:
+        return AsyncEmbeddedElasticsearch(es)
+    return AsyncSimpleElasticsearch(
+        os.getenv('ELASTICSEARCH_HOST', 'http://localhost:9200'),
+        os.getenv('ELASTICSEARCH_USERNAME'),
+        os.getenv('ELASTICSEARCH_PASSWORD'),
+        max_connections=config.ELASTICSEARCH_CONFIG['async_max_connections'],
+        max_keepalive=config.ELASTICSEARCH_CONFIG['async_max_keepalive'],
+        compress=config.ELASTICSEARCH_CONFIG['compress_requests'],
+        compress_min_bytes=config.ELASTICSEARCH_CONFIG['compress_min_bytes'],
+        compress_level=config.ELASTICSEARCH_CONFIG['compress_level'],
+        max_retries=config.ELASTICSEARCH_CONFIG['max_retries'],
+        retry_backoff=config.ELASTICSEARCH_CONFIG['retry_backoff'],
+        retry_statuses=config.ELASTICSEARCH_CONFIG['retry_statuses'],
+        timeout=config.ELASTICSEARCH_CONFIG['timeout'],
+        connect_timeout=config.ELASTICSEARCH_CONFIG['connect_timeout'],
+        breaker=ES_BREAKER,
+        hedge_percentile=config.ELASTICSEARCH_CONFIG['hedge_percentile'],
+        hedge_min_delay=config.ELASTICSEARCH_CONFIG['hedge_min_delay'],
+    )
+
+
+async_es = get_async_elasticsearch_client()
+async_es.write_listeners.append(RESULT_CACHE.bump)
+
+# Identical concurrent searches (same query body) share one round trip
+ASYNC_SEARCH_FLIGHT = AsyncSingleFlight("search_async", enabled=config.ELASTICSEARCH_CONFIG['single_flight'])
+
+
+async def _ensure_visible():
+    # Only for read_your_writes callers, so the sync policy runs in a thread
+    await asyncio.to_thread(REFRESH_POLICY.ensure_visible, INDEX_NAME)
+
+
+async def search_page_async(category=None, color=None, brand=None, gender=None, price_filter=None,
+                            query_text=None, size=None, offset=None, search_after=None, source=None,
+                            track_total_hits=None, read_your_writes=False, raw_results=False):
+    """search_page for async callers."""
+    query_body = build_search_request(category, color, brand, gender, price_filter, query_text, size=size,
+                                      offset=offset, search_after=search_after, source=source,
+                                      track_total_hits=track_total_hits)
+    if read_your_writes:
+        await _ensure_visible()
+        # Not coalesced: a search already in flight may predate the caller's write
+        return await run_search_async(query_body, raw_results=raw_results)
+    key = body_key(query_body)
+    page = RESULT_CACHE.get(INDEX_NAME, key)
+    if page is None:
+        try:
+            page = await ASYNC_SEARCH_FLIGHT.do(key, lambda: run_search_async(query_body, key, raw_results))
+        except ElasticsearchUnavailable:
+            page = stale_page(key)
+            if page is None:
+                raise
+    return own_page(page, raw_results)
+
+
+async def run_search_async(query_body, cache_key=None, raw_results=False):
+    """run_search for async callers."""
+    generation = RESULT_CACHE.generation(INDEX_NAME)
+    start = time.perf_counter()
+    if "id" in query_body:
+        res = await async_es.search_template(index=INDEX_NAME, body=query_body, filter_path=SEARCH_FILTER_PATH)
+    else:
+        res = await async_es.search(index=INDEX_NAME, body=query_body, filter_path=SEARCH_FILTER_PATH)
+    elapsed = time.perf_counter() - start
+    ES_METRICS.observe("search", elapsed)
+    page = search_response_page(res, query_body, raw_results)
+    if cache_key is not None and not res.get("timed_out"):
+        RESULT_CACHE.put(INDEX_NAME, cache_key, generation, page, elapsed)
+    return page
+
+
+async def search_products_batch_async(searches, read_your_writes=False):
+    """
+    Run many searches in one _msearch round trip. Each item in searches is
+    a dict of search_products keyword arguments; returns one result list
+    per item, in the same order.
+    """
+    if not searches:
+        return []
+    bodies = [build_search_body(**kwargs) for kwargs in searches]
+    if read_your_writes:
+        await _ensure_visible()
+    start = time.perf_counter()
+    res = await async_es.msearch(index=INDEX_NAME, bodies=bodies)
+    ES_METRICS.observe("msearch", time.perf_counter() - start)
+    return msearch_sources(res)
+
+
+async def index_product_async(doc, read_your_writes=False):
+    """index_product for async callers."""
+    refresh = REFRESH_POLICY.write_refresh(read_your_writes)
+    start = time.perf_counter()
+    result = await async_es.index_document(index=INDEX_NAME, body=doc, refresh=refresh)
+    ES_METRICS.observe("index", time.perf_counter() - start)
+    REFRESH_POLICY.after_write(INDEX_NAME, refreshed=refresh is not None)
+    return result
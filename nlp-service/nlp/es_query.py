@@ -1,11 +1,26 @@
+import base64
+import gzip
 import os
+import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
+from urllib3.util.retry import Retry
 
 # Load Bonsai credentials
 from nlp import config
+from nlp.bulk_indexer import BulkIndexer
+from nlp.embedded_search import EmbeddedElasticsearch
+from nlp.json_codec import RawJSON, dumps, dumps_lines, loads
+from nlp.metrics import StageMetrics
+from nlp.query_compiler import ParsedQuery, compile_body, register_template, template_body, TEMPLATE_ID
+from nlp.refresh_policy import RefreshPolicy
+from nlp.resilience import (
+    CircuitBreaker, DeadlineExceeded, ElasticsearchUnavailable, call_timeouts, deadline_passed, server_timeout,
+)
+from nlp.result_cache import ResultCache, body_key
+from nlp.single_flight import SingleFlight
 
 # Load environment variables from .env file if it exists
 try:
@@ -18,29 +33,177 @@ except ImportError:
 # Disable SSL warnings
 disable_warnings(InsecureRequestWarning)
 
+def bulk_body(actions):
+    """NDJSON body for _bulk: an index action line + source line per action"""
+    bulk_data = []
+    for action in actions:
+        # Add action line (with the document's _id if it has one)
+        action_line = {"index": {"_index": action["_index"]}}
+        if action.get("_id") is not None:
+            action_line["index"]["_id"] = str(action["_id"])
+        bulk_data.append(action_line)
+        # Add source line
+        bulk_data.append(action["_source"])
+    return dumps_lines(bulk_data)
+
+def msearch_body(index, bodies):
+    """
+    NDJSON body for _msearch: a header line + body line per search. _msearch
+    has no timeout parameter, so each body carries the deadline's search
+    timeout instead.
+    """
+    es_timeout = server_timeout()
+    lines = []
+    for body in bodies:
+        lines.append({"index": index})
+        lines.append(dict(body, timeout=es_timeout) if es_timeout else body)
+    return dumps_lines(lines)
+
+def search_params(filter_path=None, timeout=True):
+    """Query string for _search: filter_path, and the deadline's search timeout"""
+    params = []
+    if filter_path:
+        params.append(f'filter_path={filter_path}')
+    es_timeout = server_timeout() if timeout else None
+    if es_timeout:
+        params.append(f'timeout={es_timeout}')
+    return '?' + '&'.join(params) if params else ''
+
+def gzip_body(data, headers, min_bytes=0, level=6):
+    """Body as bytes, gzipped (with Content-Encoding) when at least min_bytes long"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if len(data) >= min_bytes:
+        data = gzip.compress(data, compresslevel=level)
+        headers["Content-Encoding"] = "gzip"
+    return data
+
+def request_failed(breaker, error):
+    """Record a transport error and turn it into ElasticsearchUnavailable/DeadlineExceeded"""
+    if breaker is not None:
+        breaker.record(False)
+    if deadline_passed():
+        return DeadlineExceeded(f"Elasticsearch didn't answer within the request deadline: {error}")
+    return ElasticsearchUnavailable(f"Elasticsearch unreachable: {error}")
+
+def response_error(breaker, status, text):
+    """Exception for an error status; 429/5xx mean the cluster is in trouble and count against breaker"""
+    unavailable = status == 429 or status >= 500
+    if breaker is not None:
+        breaker.record(not unavailable)
+    message = f"Elasticsearch error {status}: {text}"
+    return ElasticsearchUnavailable(message, status) if unavailable else Exception(message)
+
 class SimpleElasticsearch:
-    def __init__(self, host, username, password):
+    """
+    Minimal Elasticsearch REST client on a pooled requests.Session.
+
+    The transport is tunable for a hosted cluster: pool_connections host
+    pools of up to pool_maxsize keep-alive connections each (so TLS
+    handshakes are paid once per connection, not per request), gzip request
+    bodies of at least compress_min_bytes, compressed responses, and up to
+    max_retries retries with exponential backoff on retry_statuses. Writes
+    that aren't idempotent (an id-less _doc, _bulk) are only retried on 429:
+    after a 502/503 the first attempt may have been applied.
+
+    Every call waits at most connect_timeout to connect and timeout for the
+    answer, both cut to the current deadline (see nlp.resilience), and goes
+    through breaker, which fails calls fast while the cluster is failing.
+    """
+
+    def __init__(self, host, username, password, pool_connections=10, pool_maxsize=10,
+                 compress=False, compress_min_bytes=1024, compress_level=6,
+                 max_retries=0, retry_backoff=0.0, retry_statuses=(), timeout=None,
+                 connect_timeout=None, breaker=None):
         self.host = host.rstrip('/')
         self.auth = (username, password)
-        self.session = requests.Session()
-        self.session.auth = self.auth
-        self.session.verify = False
-        
-    def _request(self, method, path, data=None):
-        """Make HTTP request to Elasticsearch"""
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.compress_level = compress_level
+        self.retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,  # a timed-out search or write may have run; don't repeat it
+            status=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=tuple(retry_statuses),
+            allowed_methods=None,  # _search/_msearch/_bulk are POSTs
+            respect_retry_after_header=True,
+            raise_on_status=False,  # hand the last response to _request
+        )
+        self.write_retry = self.retry.new(status_forcelist=tuple(s for s in retry_statuses if s == 429))
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker
+        self.write_listeners = []
+        self.session = self._new_session(self.retry)
+        self.write_session = self._new_session(self.write_retry)
+        # Pooled sockets opened before a fork must not be shared with the
+        # children (see nlp.serve), so each child starts with a fresh pool
+        os.register_at_fork(after_in_child=self._reset_session)
+
+    def _new_session(self, retry):
+        session = requests.Session()
+        session.auth = self.auth
+        session.verify = False
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _reset_session(self):
+        self.session = self._new_session(self.retry)
+        self.write_session = self._new_session(self.write_retry)
+
+    def _encode(self, data, headers):
+        """Body as bytes, gzipped (with Content-Encoding) when large enough"""
+        if not self.compress:
+            return data.encode("utf-8") if isinstance(data, str) else data
+        return gzip_body(data, headers, self.compress_min_bytes, self.compress_level)
+
+    def _request(self, method, path, data=None, content_type="application/json", idempotent=True):
+        """Make HTTP request to Elasticsearch (idempotent=False: retried on 429 only)"""
         url = f"{self.host}{path}"
-        headers = {"Content-Type": "application/json"}
+        headers = {"Content-Type": content_type}
         
+        if data and not isinstance(data, (str, bytes)):
+            data = dumps(data)
         if data:
-            data = json.dumps(data)
-            
-        response = self.session.request(method, url, data=data, headers=headers)
+            data = self._encode(data, headers)
+        
+        timeout = call_timeouts(self.timeout, self.connect_timeout)
+        if self.breaker is not None:
+            self.breaker.before_call()
+        try:
+            session = self.session if idempotent else self.write_session
+            response = session.request(method, url, data=data, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            raise request_failed(self.breaker, e) from e
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.record(None)
+            raise
         
         if response.status_code >= 400:
-            raise Exception(f"Elasticsearch error {response.status_code}: {response.text}")
+            raise response_error(self.breaker, response.status_code, response.text)
+        if self.breaker is not None:
+            self.breaker.record(True)
             
-        return response.json() if response.content else {}
+        return loads(response.content) if response.content else {}
     
+    def _written(self, *indices):
+        """Tell write listeners (e.g. the result cache) which indices changed"""
+        for index in indices:
+            for listener in self.write_listeners:
+                listener(index)
+
     def ping(self):
         """Test connection"""
         try:
@@ -63,65 +226,111 @@ class SimpleElasticsearch:
     
     def create_index(self, index, body=None):
         """Create index"""
-        return self._request('PUT', f'/{index}', body)
+        try:
+            return self._request('PUT', f'/{index}', body)
+        finally:
+            self._written(index)
     
     def delete_index(self, index):
         """Delete index"""
-        return self._request('DELETE', f'/{index}')
+        try:
+            return self._request('DELETE', f'/{index}')
+        finally:
+            self._written(index)
     
-    def index_document(self, index, body, doc_id=None):
-        """Index a document"""
-        if doc_id:
-            return self._request('PUT', f'/{index}/_doc/{doc_id}', body)
-        else:
-            return self._request('POST', f'/{index}/_doc', body)
+    def index_document(self, index, body, doc_id=None, refresh=None):
+        """Index a document (refresh: None, "true" or "wait_for")"""
+        params = f'?refresh={refresh}' if refresh else ''
+        try:
+            if doc_id:
+                return self._request('PUT', f'/{index}/_doc/{doc_id}{params}', body)
+            else:
+                return self._request('POST', f'/{index}/_doc{params}', body, idempotent=False)
+        finally:
+            self._written(index)
     
-    def bulk(self, actions):
+    def bulk(self, actions, refresh=None):
         """Bulk index documents"""
-        bulk_data = []
-        for action in actions:
-            # Add action line
-            action_line = {"index": {"_index": action["_index"]}}
-            bulk_data.append(json.dumps(action_line))
-            # Add source line
-            bulk_data.append(json.dumps(action["_source"]))
-        
-        bulk_body = '\n'.join(bulk_data) + '\n'
-        
-        response = self.session.post(
-            f"{self.host}/_bulk",
-            data=bulk_body,
-            headers={"Content-Type": "application/x-ndjson"},
-            verify=False
-        )
-        
-        return response.json()
+        return self.bulk_ndjson(bulk_body(actions), {action["_index"] for action in actions}, refresh=refresh)
+    
+    def bulk_ndjson(self, body, indices=(), refresh=None):
+        """Send a prebuilt _bulk NDJSON body that writes to indices"""
+        params = f'?refresh={refresh}' if refresh else ''
+        try:
+            return self._request('POST', f'/_bulk{params}', body, content_type="application/x-ndjson",
+                                 idempotent=False)
+        finally:
+            # Even a failed bulk may have applied some of its actions
+            self._written(*indices)
+    
+    def search(self, index, body, filter_path=None):
+        """Search documents (filter_path: only these response fields)"""
+        return self._request('POST', f'/{index}/_search{search_params(filter_path)}', body)
+    
+    def search_template(self, index, body, filter_path=None):
+        """Search with a stored template: body is {"id": ..., "params": {...}}"""
+        # _search/template takes no timeout parameter; the client timeouts still apply
+        return self._request('POST', f'/{index}/_search/template{search_params(filter_path, timeout=False)}', body)
+    
+    def put_script(self, script_id, body):
+        """Store a script or search template"""
+        return self._request('PUT', f'/_scripts/{script_id}', body)
     
-    def search(self, index, body):
-        """Search documents"""
-        return self._request('POST', f'/{index}/_search', body)
+    def msearch(self, index, bodies):
+        """Run several searches against one index in a single _msearch request"""
+        return self._request('POST', '/_msearch', msearch_body(index, bodies), content_type="application/x-ndjson")
     
     def refresh(self, index):
         """Refresh index"""
-        return self._request('POST', f'/{index}/_refresh')
+        try:
+            return self._request('POST', f'/{index}/_refresh')
+        finally:
+            self._written(index)
+
+# SEARCH_BACKEND=embedded: every search and write goes to an in-process
+# index (nlp.embedded_search) instead of a cluster
+SEARCH_BACKENDS = ("elasticsearch", "embedded")
+EMBEDDED = config.ELASTICSEARCH_CONFIG['backend'] == "embedded"
 
 # Configuration for different environments
 def get_elasticsearch_client():
     """
     Create Elasticsearch client based on environment configuration
+    (an in-process EmbeddedElasticsearch with SEARCH_BACKEND=embedded)
     """
+    es_config = config.ELASTICSEARCH_CONFIG
+    if es_config['backend'] not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend '{es_config['backend']}', expected one of {SEARCH_BACKENDS}")
+    if EMBEDDED:
+        print("🗂️ Searching an embedded in-process index (SEARCH_BACKEND=embedded), no Elasticsearch")
+        return EmbeddedElasticsearch(refresh_interval=es_config['embedded_refresh_interval'])
+
     es_host = os.getenv('ELASTICSEARCH_HOST', 'http://localhost:9200')
     es_username = os.getenv('ELASTICSEARCH_USERNAME')
     es_password = os.getenv('ELASTICSEARCH_PASSWORD')
     
     print(f"🔗 Connecting to: {es_host}")
     
+    transport = dict(
+        pool_connections=es_config['pool_connections'],
+        pool_maxsize=es_config['pool_maxsize'],
+        compress=es_config['compress_requests'],
+        compress_min_bytes=es_config['compress_min_bytes'],
+        compress_level=es_config['compress_level'],
+        max_retries=es_config['max_retries'],
+        retry_backoff=es_config['retry_backoff'],
+        retry_statuses=es_config['retry_statuses'],
+        timeout=es_config['timeout'],
+        connect_timeout=es_config['connect_timeout'],
+        breaker=ES_BREAKER,
+    )
+
     if es_username and es_password:
         # For hosted Elasticsearch with basic auth (like Bonsai)
-        es = SimpleElasticsearch(es_host, es_username, es_password)
+        es = SimpleElasticsearch(es_host, es_username, es_password, **transport)
     else:
         # For local development, fall back to requests
-        es = SimpleElasticsearch(es_host, '', '')
+        es = SimpleElasticsearch(es_host, '', '', **transport)
     
     # Test connection
     try:
@@ -137,15 +346,97 @@ def get_elasticsearch_client():
         print(f"❌ Failed to connect to Elasticsearch: {e}")
         raise ConnectionError(f"Could not connect to Elasticsearch: {e}")
 
+# Shared by both clients of this process: they talk to the same cluster
+ES_BREAKER = CircuitBreaker(
+    enabled=config.ELASTICSEARCH_CONFIG['breaker'],
+    window=config.ELASTICSEARCH_CONFIG['breaker_window'],
+    failure_ratio=config.ELASTICSEARCH_CONFIG['breaker_failure_ratio'],
+    min_calls=config.ELASTICSEARCH_CONFIG['breaker_min_calls'],
+    reset_timeout=config.ELASTICSEARCH_CONFIG['breaker_reset_timeout'],
+)
+
 # Initialize Elasticsearch client
 es = get_elasticsearch_client()
 
 INDEX_NAME = os.getenv('ELASTICSEARCH_INDEX', 'products')
 
+# When writes are made searchable; searches never refresh on their own
+REFRESH_POLICY = RefreshPolicy(
+    es,
+    mode=config.ELASTICSEARCH_CONFIG['refresh_policy'],
+    delay=config.ELASTICSEARCH_CONFIG['refresh_delay'],
+)
+
+# Round-trip latency of search/index calls, served by /metrics
+ES_METRICS = StageMetrics(enabled=True, description="Elasticsearch round-trip time per operation.")
+
+# Identical concurrent searches (same query body) share one round trip
+SEARCH_FLIGHT = SingleFlight("search", enabled=config.ELASTICSEARCH_CONFIG['single_flight'])
+
+def setup_search_template():
+    """Register the stored search template if ES_SEARCH_TEMPLATE is on; False to search inline."""
+    if not config.ELASTICSEARCH_CONFIG['search_template']:
+        return False
+    try:
+        register_template(es)
+        print(f"✅ Registered search template {TEMPLATE_ID}")
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not register search template, searching inline: {e}")
+        return False
+
+# Searches send only template parameters when on
+SEARCH_TEMPLATE = setup_search_template()
+
+# Recent search results by query body; every write or refresh of an index
+# (through this client or the async one) invalidates that index's entries,
+# and nothing is cached while one of this process's writes isn't searchable
+RESULT_CACHE = ResultCache(
+    max_bytes=config.ELASTICSEARCH_CONFIG['result_cache_max_bytes'],
+    ttl=config.ELASTICSEARCH_CONFIG['result_cache_ttl'],
+    settled=REFRESH_POLICY.settled,
+)
+es.write_listeners.append(RESULT_CACHE.bump)
+REFRESH_POLICY.refresh_listeners.append(RESULT_CACHE.bump)
+
 # Helper function to mimic the old helpers.bulk functionality
-def bulk_index(es_client, actions):
+def bulk_index(es_client, actions, read_your_writes=False):
     """Bulk index documents using our SimpleElasticsearch client"""
-    return es_client.bulk(actions)
+    actions = list(actions)
+    refresh = REFRESH_POLICY.write_refresh(read_your_writes)
+    result = es_client.bulk(actions, refresh=refresh)
+    for index in {action["_index"] for action in actions}:
+        REFRESH_POLICY.after_write(index, refreshed=refresh is not None)
+    return result
+
+def bulk_index_stream(actions, **options):
+    """
+    Index a stream of actions (any iterable, e.g. a generator over a MongoDB
+    cursor) in parallel chunks with a BulkIndexer configured from
+    ELASTICSEARCH_CONFIG (options override it); returns its BulkReport.
+    """
+    es_config = config.ELASTICSEARCH_CONFIG
+    settings = dict(
+        chunk_docs=es_config['bulk_chunk_docs'],
+        chunk_bytes=es_config['bulk_chunk_bytes'],
+        max_in_flight=es_config['bulk_max_in_flight'],
+        max_retries=es_config['bulk_max_retries'],
+        retry_backoff=es_config['bulk_retry_backoff'],
+    )
+    settings.update(options)
+    report = BulkIndexer(es, **settings).run(actions)
+    for index in report.indices:
+        REFRESH_POLICY.after_write(index)
+    return report
+
+def index_product(doc, read_your_writes=False):
+    """Index one product, made searchable according to REFRESH_POLICY."""
+    refresh = REFRESH_POLICY.write_refresh(read_your_writes)
+    start = time.perf_counter()
+    result = es.index_document(index=INDEX_NAME, body=doc, refresh=refresh)
+    ES_METRICS.observe("index", time.perf_counter() - start)
+    REFRESH_POLICY.after_write(INDEX_NAME, refreshed=refresh is not None)
+    return result
 
 # Define a sample mapping for the product index (run once)
 def create_index():
@@ -175,6 +466,18 @@ def create_index():
             }
         )
 
+def load_embedded_catalog():
+    """SEARCH_BACKEND=embedded: create the product index and load EMBEDDED_CATALOG into it"""
+    if not EMBEDDED:
+        return
+    create_index()
+    path = config.ELASTICSEARCH_CONFIG['embedded_catalog']
+    if path:
+        count = es.load_catalog(INDEX_NAME, path)
+        print(f"✅ Loaded {count} products from {path} into the embedded index")
+
+load_embedded_catalog()
+
 #delete index
 # Index sample data
 def index_sample_data():
@@ -241,78 +544,195 @@ def index_sample_data():
     ]
     bulk_index(es, actions)
 
-# Updated search function with scoring + ranking
-def search_products(category=None, color=None, brand=None, gender=None, price_filter=None, query_text=None):
-    must_clauses = []
-
-    if category:
-        must_clauses.append({"term": {"category": category.lower()}})
-    if color:
-        must_clauses.append({"term": {"color": color.lower()}})
-    if brand:
-        must_clauses.append({"term": {"brand": brand.lower()}})
-    if gender:
-        must_clauses.append({"term": {"gender": gender.lower()}})
-    if price_filter:
-        op = price_filter.get("operator")
-        if op == "between":
-            must_clauses.append({"range": {"price": {"gte": price_filter["min"], "lte": price_filter["max"]}}})
-        elif op == ">":
-            must_clauses.append({"range": {"price": {"gt": price_filter["value"]}}})
-        elif op == "<":
-            must_clauses.append({"range": {"price": {"lt": price_filter["value"]}}})
-        elif op == ">=":
-            must_clauses.append({"range": {"price": {"gte": price_filter["value"]}}})
-        elif op == "<=":
-            must_clauses.append({"range": {"price": {"lte": price_filter["value"]}}})
-
-    should_clause = []
-    if query_text:
-        # Add fuzzy matching for better handling of misspelled terms
-        should_clause.extend([
-            {
-                "multi_match": {
-                    "query": query_text,
-                    "fields": ["name^3", "description", "category"],
-                    "fuzziness": "AUTO",  # Enable fuzzy matching
-                    "prefix_length": 2,    # Minimum prefix length for fuzzy matching
-                    "max_expansions": 50   # Maximum number of terms to expand to
-                }
-            },
-            {
-                "multi_match": {
-                    "query": query_text,
-                    "fields": ["brand^2", "name^3"],
-                    "fuzziness": "AUTO",
-                    "prefix_length": 1,    # Lower prefix for brand matching
-                    "max_expansions": 20
-                }
-            }
-        ])
-
-    query_body = {
-        "query": {
-            "bool": {
-                "must": must_clauses,
-                "should": should_clause,
-                "minimum_should_match": 0
-            }
-        },
-        "sort": [
-            {"_score": "desc"},
-            {"rating": "desc"},
-            {"discount": "desc"},
-            {"price": "asc"}
-        ]
+def to_search_kwargs(filters: dict) -> dict:
+    """Turn parse_query output into search_products keyword arguments."""
+    return {
+        "category": filters.get("category"),
+        "color": filters.get("color"),
+        "brand": filters.get("brand"),
+        "gender": filters.get("gender"),
+        "price_filter": {
+            "operator": "between",
+            "min": filters["price_min"],
+            "max": filters["price_max"]
+        } if filters["price_min"] is not None and filters["price_max"] is not None else (
+            {"operator": ">=", "value": filters["price_min"]} if filters["price_min"] is not None else (
+                {"operator": "<=", "value": filters["price_max"]} if filters["price_max"] is not None else None
+            )
+        ),
+        "query_text": " ".join(filters["keywords"]) if filters["keywords"] else None
     }
 
+# Elasticsearch's index.max_result_window: from + size can't go past it
+MAX_RESULT_WINDOW = 10000
+
+def encode_cursor(sort_values):
+    """Opaque search_after cursor from a hit's sort values"""
+    raw = dumps(sort_values)
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """Sort values of a cursor from encode_cursor; ValueError if it isn't one"""
+    try:
+        values = loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values
+
+def source_fields(fields):
+    """_source includes for a fields option: "card", "all"/None, or a comma list"""
+    if not fields or fields == "all":
+        return None
+    if fields == "card":
+        return list(config.ELASTICSEARCH_CONFIG['card_fields'])
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+# Build the scored + ranked search body shared by single and batch search
+# (see nlp.query_compiler). category, color, brand and gender take one value
+# or a list of alternatives. size/offset page through the top hits;
+# search_after (sort values of the last hit, see encode_cursor) continues
+# past them. source limits the returned fields and track_total_hits=False
+# skips counting all matches.
+def build_search_body(category=None, color=None, brand=None, gender=None, price_filter=None, query_text=None,
+                      size=None, offset=None, search_after=None, source=None, track_total_hits=None):
+    parsed = ParsedQuery.from_search_kwargs(category, color, brand, gender, price_filter, query_text)
+    return compile_body(parsed, size, offset, search_after, source, track_total_hits)
+
+def build_search_request(category=None, color=None, brand=None, gender=None, price_filter=None, query_text=None,
+                         **page):
+    """
+    What search_page sends: the stored template's id and parameters when
+    ES_SEARCH_TEMPLATE is on (and registered), else build_search_body's body.
+    """
+    if not SEARCH_TEMPLATE:
+        return build_search_body(category, color, brand, gender, price_filter, query_text, **page)
+    parsed = ParsedQuery.from_search_kwargs(category, color, brand, gender, price_filter, query_text)
+    return template_body(parsed, **page)
+
+# The parts of a search response search_response_page reads; Elasticsearch
+# leaves out the rest (_index, _id, _score, _shards, ...)
+SEARCH_FILTER_PATH = "timed_out,hits.total,hits.hits._source,hits.hits.sort"
+
+# When Elasticsearch can't answer, serve a cached page however old
+SERVE_STALE = config.ELASTICSEARCH_CONFIG['serve_stale']
+
+# Updated search function with scoring + ranking
+def search_products(category=None, color=None, brand=None, gender=None, price_filter=None, query_text=None,
+                    read_your_writes=False, **page):
+    """Matching products (their _source); page takes search_page's paging options."""
+    return search_page(category, color, brand, gender, price_filter, query_text,
+                       read_your_writes=read_your_writes, **page)["results"]
+
+def search_page(category=None, color=None, brand=None, gender=None, price_filter=None, query_text=None,
+                size=None, offset=None, search_after=None, source=None, track_total_hits=None,
+                read_your_writes=False, raw_results=False):
+    """
+    One page of matching products: {"total", "total_relation", "results",
+    "next_cursor"}. total is the real hit count ("gte" relation when
+    Elasticsearch stopped counting, None with track_total_hits=False);
+    next_cursor, when set, is the search_after value for the next page.
+
+    raw_results=True is for callers that only serialize the page: results
+    may then be the already-encoded RawJSON (or a shared list), which
+    nlp.json_codec.dumps inserts without encoding it again.
+    """
+    query_body = build_search_request(category, color, brand, gender, price_filter, query_text, size=size,
+                                      offset=offset, search_after=search_after, source=source,
+                                      track_total_hits=track_total_hits)
+
     # 🔍 Debug: print final ES query
     # print("Elasticsearch Query:")
     # print(json.dumps(query_body, indent=2))
 
-    es.refresh(index=INDEX_NAME)  # Ensure docs are searchable
-    res = es.search(index=INDEX_NAME, body=query_body)
-    return [hit["_source"] for hit in res["hits"]["hits"]]
+    if read_your_writes:
+        REFRESH_POLICY.ensure_visible(INDEX_NAME)
+        # Not coalesced: a search already in flight may predate the caller's write
+        return run_search(query_body, raw_results=raw_results)
+    key = body_key(query_body)
+    page = RESULT_CACHE.get(INDEX_NAME, key)
+    if page is None:
+        try:
+            page = SEARCH_FLIGHT.do(key, lambda: run_search(query_body, key, raw_results))
+        except ElasticsearchUnavailable:
+            page = stale_page(key)
+            if page is None:
+                raise
+    return own_page(page, raw_results)
+
+def stale_page(key):
+    """
+    The cached page for key, however old, marked "stale": the degraded
+    answer while Elasticsearch is down or too slow (ES_SERVE_STALE).
+    """
+    page = RESULT_CACHE.get_stale(INDEX_NAME, key) if SERVE_STALE else None
+    return None if page is None else dict(page, stale=True)
+
+def own_page(page, raw_results=False):
+    """
+    The caller's copy of a page: cached and coalesced pages are shared. Its
+    results are a new list, or left as they are for raw_results callers.
+    """
+    results = page["results"]
+    if raw_results:
+        return dict(page)
+    if isinstance(results, RawJSON):
+        return dict(page, results=loads(results.data))
+    return dict(page, results=list(results))
+
+def run_search(query_body, cache_key=None, raw_results=False):
+    """
+    One timed _search (or _search/template) round trip, as a search_page
+    result, stored in RESULT_CACHE under cache_key if given. raw_results
+    encodes the results once, here, for every response that serves them.
+    """
+    generation = RESULT_CACHE.generation(INDEX_NAME)
+    start = time.perf_counter()
+    if "id" in query_body:
+        res = es.search_template(index=INDEX_NAME, body=query_body, filter_path=SEARCH_FILTER_PATH)
+    else:
+        res = es.search(index=INDEX_NAME, body=query_body, filter_path=SEARCH_FILTER_PATH)
+    elapsed = time.perf_counter() - start
+    ES_METRICS.observe("search", elapsed)
+    page = search_response_page(res, query_body, raw_results)
+    # Partial results (shards that hit the search timeout) aren't cached
+    if cache_key is not None and not res.get("timed_out"):
+        RESULT_CACHE.put(INDEX_NAME, cache_key, generation, page, elapsed)
+    return page
+
+def search_response_page(res, query_body, raw_results=False):
+    """search_page result from the response to query_body (inline or template)"""
+    # filter_path drops empty parts: no "hits" without matches, no total
+    # with track_total_hits=False
+    hits = res.get("hits", {}).get("hits", [])
+    total = res.get("hits", {}).get("total")
+    if isinstance(total, int):  # Elasticsearch 6 and rest_total_hits_as_int
+        total = {"value": total, "relation": "eq"}
+    options = query_body.get("params", query_body)
+    size = options.get("size", 10)
+    seen = options.get("from", 0) + len(hits)
+    more = len(hits) == size and size > 0 and (total is None or total["relation"] != "eq" or seen < total["value"])
+    results = [hit["_source"] for hit in hits]
+    return {
+        "total": total["value"] if total else None,
+        "total_relation": total["relation"] if total else None,
+        "results": RawJSON(dumps(results)) if raw_results else results,
+        "next_cursor": encode_cursor(hits[-1]["sort"]) if more and "sort" in hits[-1] else None,
+    }
+
+def msearch_hits(res):
+    """Hit lists from an _msearch response; raises on the first failed search."""
+    results = []
+    for response in res.get("responses", []):
+        if "error" in response:
+            raise Exception(f"Elasticsearch error {response.get('status')}: {response['error']}")
+        results.append(response["hits"]["hits"])
+    return results
+
+def msearch_sources(res):
+    """_source lists from an _msearch response; raises on the first failed search."""
+    return [[hit["_source"] for hit in hits] for hits in msearch_hits(res)]
 
 # For standalone testing
 if __name__ == "__main__":
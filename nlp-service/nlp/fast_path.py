@@ -0,0 +1,143 @@
+import itertools
+import threading
+
+from spacy.tokens import Doc
+
+# Components that make a token's lemma depend on its context. The tagger is
+# handled by trying every tag it can output; a morphologizer can't be, so
+# pipelines with one never take the fast path.
+_CONTEXT_PIPES = ("tagger", "morphologizer")
+
+# Components re-run on a single-token doc once a tag has been set
+_TAG_DEPENDENT_PIPES = ("attribute_ruler", "lemmatizer")
+
+
+class FastToken:
+    """The token attributes parse_doc reads, without a spaCy Doc behind them."""
+
+    __slots__ = ("text", "lemma_", "is_stop", "is_punct", "like_num")
+
+    def __init__(self, text, lemma, is_stop, is_punct, like_num):
+        self.text = text
+        self.lemma_ = lemma
+        self.is_stop = is_stop
+        self.is_punct = is_punct
+        self.like_num = like_num
+
+
+class FastPath:
+    """
+    Tokenizes known queries without running the spaCy pipeline.
+
+    A query qualifies when every whitespace-separated word is known
+    (``admit``-ed, a synonym, or a plain number). For a known word the
+    lexical flags come from the spaCy vocab and the lemma from running the
+    lemmatizer under every tag the tagger can produce, so the fast tokens
+    carry every lemma spaCy could assign in context. ``tokenize`` returns
+    one token list per combination of those lemmas; the caller only trusts
+    the fast path when all combinations give the same parse.
+
+    Word information is computed once per word, on first use.
+    """
+
+    def __init__(self, nlp, max_combinations=8):
+        self.nlp = nlp
+        self.max_combinations = max_combinations
+        self._known = set()
+        self._words = {}
+        self._lock = threading.Lock()
+
+        names = dict(nlp.pipeline)
+        self.enabled = "morphologizer" not in names
+        self._tagger = names.get("tagger")
+        self._tag_pipes = []
+        if self._tagger is not None:
+            after = nlp.pipe_names[nlp.pipe_names.index("tagger") + 1:]
+            self._tag_pipes = [names[n] for n in after if n in _TAG_DEPENDENT_PIPES]
+
+        self.hits = 0
+        self.fallbacks = {"unknown": 0, "ambiguous": 0}
+        self.fast_seconds = 0.0
+        self.spacy_parses = 0
+        self.spacy_seconds = 0.0
+
+    def admit(self, words):
+        """Mark words (multi-word terms are split) as known."""
+        known = set()
+        for word in words:
+            known.update(word.lower().split())
+        with self._lock:
+            self._known |= known
+
+    def _lemmas(self, word):
+        if self._tagger is None:
+            return (self.nlp(word)[0].lemma_,)
+        lemmas = {}
+        for tag in self._tagger.labels:
+            doc = Doc(self.nlp.vocab, words=[word])
+            doc[0].tag_ = tag
+            for pipe in self._tag_pipes:
+                doc = pipe(doc)
+            lemmas.setdefault(doc[0].lemma_)
+        return tuple(lemmas)
+
+    def _word(self, word):
+        """Lemma variants + lexical flags for word, None if spaCy would split it."""
+        info = self._words.get(word)
+        if info is not None or word in self._words:
+            return info
+        if len(self.nlp.tokenizer(word)) != 1:
+            info = None
+        else:
+            lex = self.nlp.vocab[word]
+            info = (self._lemmas(word), lex.is_stop, lex.is_punct, lex.like_num)
+        self._words[word] = info
+        return info
+
+    def tokenize(self, query, synonyms):
+        """
+        Token lists for every lemma combination of query, or the reason the
+        query needs the full pipeline ("unknown" / "ambiguous").
+        """
+        variants = []
+        combinations = 1
+        for word in query.split():
+            if word.isdigit() and word.isascii():
+                lex = self.nlp.vocab[word]
+                variants.append((FastToken(word, word, lex.is_stop, lex.is_punct, lex.like_num),))
+                continue
+            if word not in self._known and word not in synonyms.reverse and word not in synonyms.canonical:
+                return "unknown"
+            info = self._word(word)
+            if info is None:
+                return "unknown"
+            lemmas, is_stop, is_punct, like_num = info
+            combinations *= len(lemmas)
+            if combinations > self.max_combinations:
+                return "ambiguous"
+            variants.append([FastToken(word, lemma, is_stop, is_punct, like_num) for lemma in lemmas])
+        return [list(tokens) for tokens in itertools.product(*variants)]
+
+    def record_fast(self, seconds):
+        self.hits += 1
+        self.fast_seconds += seconds
+
+    def record_fallback(self, reason):
+        self.fallbacks[reason] += 1
+
+    def record_spacy(self, seconds):
+        self.spacy_parses += 1
+        self.spacy_seconds += seconds
+
+    def stats(self):
+        total = self.hits + sum(self.fallbacks.values())
+        return {
+            "enabled": self.enabled,
+            "known_words": len(self._known),
+            "hits": self.hits,
+            "fallbacks": dict(self.fallbacks),
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "fast_ms_mean": round(1000 * self.fast_seconds / self.hits, 4) if self.hits else 0.0,
+            "spacy_parses": self.spacy_parses,
+            "spacy_ms_mean": round(1000 * self.spacy_seconds / self.spacy_parses, 4) if self.spacy_parses else 0.0,
+        }
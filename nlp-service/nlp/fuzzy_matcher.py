@@ -0,0 +1,171 @@
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# Thresholds of the original per-token fuzzy_match / fuzzy_match_brand
+# (kept in benchmarks/fuzzy_matcher.py as the reference)
+DEFAULT_THRESHOLD = 60
+BRAND_THRESHOLD = 80
+BRAND_LOOSE_THRESHOLD = 70
+
+# Brand scorers in the order fuzzy_match_brand tries them. The flag says
+# whether the looser threshold + category-substring guard applies.
+BRAND_SCORERS = [
+    (fuzz.ratio, False),
+    (fuzz.partial_ratio, True),
+    (fuzz.token_sort_ratio, False),
+    (fuzz.token_set_ratio, True),
+]
+
+
+class TokenMatches:
+    """
+    Best fuzzy candidate per token for each attribute (None if no match).
+    ``calls`` is how many token/vocabulary/scorer lookups were scored.
+    """
+
+    __slots__ = ("category", "brand", "color", "gender", "calls")
+
+    def __init__(self, category, brand, color, gender, calls=0):
+        self.category = category
+        self.brand = brand
+        self.color = color
+        self.gender = gender
+        self.calls = calls
+
+
+class AttributeMatcher:
+    """
+    Scores all query tokens against every attribute vocabulary at once.
+
+    Choice lists are frozen and pre-lowercased when the matcher is built;
+    matching runs one rapidfuzz ``cdist`` per vocabulary and scorer instead
+    of one ``extractOne`` per token. Results are the same as calling
+    the original ``fuzzy_match`` / ``fuzzy_match_brand`` token by token
+    (see benchmarks/fuzzy_matcher.py).
+
+    Vocabularies with at least ``index_min_size`` entries and a
+    DeletionIndex in ``indexes`` are not scanned: only terms within the
+    index's edit distance are scored. That bounds the cost per token, at
+    the price of missing far-off partial/token-set matches.
+    """
+
+    def __init__(self, categories, brands, colors, genders, workers=1, indexes=None, index_min_size=2000):
+        self.categories = list(categories)
+        self.brands = list(brands)
+        self.colors = list(colors)
+        self.genders = list(genders)
+        self.workers = workers
+        self.indexes = indexes or {}
+        self.index_min_size = index_min_size
+
+        # First position of each term in the indexed vocabularies
+        self._positions = {}
+        for name, choices in (("categories", self.categories), ("brands", self.brands),
+                              ("colors", self.colors), ("genders", self.genders)):
+            if name in self.indexes and len(choices) >= index_min_size:
+                positions = {}
+                for i, choice in enumerate(choices):
+                    positions.setdefault(choice.lower(), i)
+                self._positions[name] = positions
+
+        self.categories_lower = [c.lower() for c in self.categories]
+        self.category_set = set(self.categories_lower)
+        self.brand_lookup = {}
+        for brand in self.brands:
+            self.brand_lookup.setdefault(brand.lower(), brand)
+
+    def _best(self, tokens, choices, scorer, cutoff, name=None):
+        """
+        (choice, score) of the first best choice for every token. Scores under
+        cutoff come back as 0, which lets rapidfuzz skip most of the work.
+        """
+        index = self.indexes.get(name)
+        if index is not None and len(choices) >= self.index_min_size:
+            return [self._best_indexed(token, choices, scorer, cutoff, name, index) for token in tokens]
+
+        scores = process.cdist(
+            tokens, choices, scorer=scorer, score_cutoff=cutoff, dtype=np.float64, workers=self.workers
+        )
+        best = scores.argmax(axis=1)
+        return [(choices[i], s) for i, s in zip(best, scores[np.arange(len(tokens)), best])]
+
+    def _best_indexed(self, token, choices, scorer, cutoff, name, index):
+        positions = self._positions[name]
+        # Keep only terms in this vocabulary snapshot, in vocabulary order so
+        # ties resolve like a full scan would
+        found = sorted(positions[t] for t in index.candidates(token) if t in positions)
+        if not found:
+            return None, 0
+        match = process.extractOne(token, [choices[i] for i in found], scorer=scorer, score_cutoff=cutoff)
+        if match is None:
+            return None, 0
+        return match[0], match[1]
+
+    def _match_simple(self, tokens, choices, name, threshold=DEFAULT_THRESHOLD):
+        if not tokens or not choices:
+            return [None] * len(tokens), 0
+        best = self._best(tokens, choices, fuzz.ratio, threshold, name)
+        return [choice if score >= threshold else None for choice, score in best], len(tokens)
+
+    def _match_brands(self, tokens, brand_rows=None):
+        matches = [None] * len(tokens)
+        if not tokens or not self.brands:
+            return matches, 0
+
+        # Only distinct tokens that actually need fuzzy scoring go to cdist:
+        # categories and exact brands are settled without it, and the loose
+        # scorers are skipped for tokens that are part of a category name.
+        strict, loose = {}, {}
+        for row, token in enumerate(tokens):
+            if brand_rows is not None and not brand_rows[row]:
+                continue
+            token = token.lower()
+            if token in self.category_set:
+                continue
+            if token in self.brand_lookup:
+                matches[row] = token
+                continue
+            strict.setdefault(token, []).append(row)
+            if not any(token in c for c in self.categories_lower):
+                loose.setdefault(token, []).append(row)
+
+        best_choice = {}
+        calls = 0
+        for scorer, is_loose in BRAND_SCORERS:
+            rows = loose if is_loose else strict
+            if not rows:
+                continue
+            threshold = BRAND_LOOSE_THRESHOLD if is_loose else BRAND_THRESHOLD
+            distinct = list(rows)
+            calls += len(distinct)
+            best = self._best(distinct, self.brands, scorer, threshold, "brands")
+            for token, (choice, score) in zip(distinct, best):
+                if score < threshold:
+                    continue
+                # max() in fuzzy_match_brand keeps the first of equal scores
+                current = best_choice.get(token)
+                if current is None or score > current[1]:
+                    best_choice[token] = (choice, score)
+
+        for token, (choice, _) in best_choice.items():
+            for row in strict[token]:
+                matches[row] = choice
+        return matches, calls
+
+    def match(self, category_tokens, tokens, brand_rows=None):
+        """
+        category_tokens are the lemmas checked against categories, tokens the
+        synonym-normalized tokens checked against brands, colors and genders.
+        brand_rows optionally marks which tokens can reach the brand check.
+        """
+        category, category_calls = self._match_simple(category_tokens, self.categories, "categories")
+        brand, brand_calls = self._match_brands(tokens, brand_rows)
+        color, color_calls = self._match_simple(tokens, self.colors, "colors")
+        gender, gender_calls = self._match_simple(tokens, self.genders, "genders")
+        return TokenMatches(
+            category=category,
+            brand=brand,
+            color=color,
+            gender=gender,
+            calls=category_calls + brand_calls + color_calls + gender_calls,
+        )
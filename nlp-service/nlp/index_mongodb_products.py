@@ -13,7 +13,7 @@ except ImportError:
     print("⚠️ python-dotenv not installed, skipping .env file loading")
     pass
 
-from data_loader import load_and_index_products_from_mongodb
+from nlp.data_loader import load_and_index_products_from_mongodb
 
 def main():
     """Main function to run the indexing process"""
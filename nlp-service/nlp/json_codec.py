@@ -0,0 +1,89 @@
+"""
+JSON encoding for Elasticsearch requests and responses and for API
+responses. Uses orjson when it is installed (JSON_BACKEND=auto or orjson)
+and the standard library otherwise, with the same compact UTF-8 output.
+
+RawJSON wraps bytes that are already JSON; dumps inserts them as they are,
+so a result list encoded once (e.g. a cached search page) is never decoded
+and encoded again per response.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+_requested = os.getenv("JSON_BACKEND", "auto").lower()
+if _requested == "orjson" and orjson is None:
+    print("⚠️ JSON_BACKEND=orjson but orjson is not installed, using json")
+BACKEND = "orjson" if orjson is not None and _requested in ("auto", "orjson") else "json"
+
+# Placeholder a RawJSON is encoded as before its bytes are put in its place
+_MARK = "\x1fraw-json:"
+_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+_FRAGMENT = getattr(orjson, "Fragment", None)  # orjson >= 3.9 splices natively
+
+
+class RawJSON:
+    """Already-encoded JSON (bytes or str), inserted as is by dumps."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data.encode("utf-8") if isinstance(data, str) else data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"RawJSON({self.data[:40]!r}{'...' if len(self.data) > 40 else ''})"
+
+
+def _stdlib_dumps(obj, default, sort_keys):
+    return json.dumps(obj, default=default, separators=(",", ":"), ensure_ascii=False,
+                      sort_keys=sort_keys).encode("utf-8")
+
+
+def dumps(obj, sort_keys=False) -> bytes:
+    """Compact UTF-8 JSON bytes for obj (keys sorted with sort_keys, e.g. for hashing)."""
+    fragments = []
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            if _FRAGMENT is not None and BACKEND == "orjson":
+                return _FRAGMENT(value.data)
+            fragments.append(value.data)
+            return f"{_MARK}{len(fragments) - 1}"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    if BACKEND == "orjson":
+        try:
+            data = orjson.dumps(obj, default=default,
+                                option=_OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _OPTIONS)
+        except TypeError:
+            # e.g. integers past 64 bits, which the standard library handles
+            fragments.clear()
+            data = _stdlib_dumps(obj, default, sort_keys)
+    else:
+        data = _stdlib_dumps(obj, default, sort_keys)
+    for number, fragment in enumerate(fragments):
+        data = data.replace(b'"\\u001fraw-json:%d"' % number, fragment, 1)
+    return data
+
+
+def loads(data):
+    """Decode JSON from bytes or str."""
+    if BACKEND == "orjson":
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # e.g. integers past 64 bits; the standard library says if it's invalid
+    return json.loads(data)
+
+
+def dumps_lines(objects) -> bytes:
+    """NDJSON: one encoded object per line, newline-terminated."""
+    return b"".join(dumps(obj) + b"\n" for obj in objects)
@@ -0,0 +1,76 @@
+import threading
+from functools import lru_cache
+
+
+class CachedLemmatizer:
+    """
+    Memoized single-word lemmatizer.
+
+    ``lemma(word)`` returns exactly what ``nlp(word)[0].lemma_`` would, but
+    vocabulary words are answered from a precomputed table and everything
+    else from a bounded LRU cache, so spaCy only runs on a cold word.
+    """
+
+    def __init__(self, nlp, maxsize=10000):
+        self.nlp = nlp
+        self.maxsize = maxsize
+        self._table = {}
+        self._table_lock = threading.Lock()
+        self._table_hits = 0
+        self._cached = lru_cache(maxsize=maxsize)(self._compute)
+
+    def _compute(self, word):
+        return self.nlp(word)[0].lemma_
+
+    def preload(self, words):
+        """Lemmatize words in one nlp.pipe pass and add them to the table."""
+        missing = [w for w in dict.fromkeys(words) if w and w not in self._table]
+        if not missing:
+            return
+        lemmas = {word: doc[0].lemma_ for word, doc in zip(missing, self.nlp.pipe(missing))}
+        with self._table_lock:
+            # Copy-on-write so concurrent readers never see a resizing dict
+            table = dict(self._table)
+            table.update(lemmas)
+            self._table = table
+
+    def table(self):
+        """Copy of the precomputed word -> lemma table."""
+        return dict(self._table)
+
+    def load_table(self, table):
+        """Seed the table with lemmas computed elsewhere (e.g. an artifact)."""
+        with self._table_lock:
+            merged = dict(table)
+            merged.update(self._table)
+            self._table = merged
+
+    def lemma(self, word):
+        lemma = self._table.get(word)
+        if lemma is not None:
+            self._table_hits += 1
+            return lemma
+        return self._cached(word)
+
+    def resize(self, maxsize):
+        """Change the LRU cap. The cached entries are dropped."""
+        self.maxsize = maxsize
+        self._cached = lru_cache(maxsize=maxsize)(self._compute)
+
+    def clear(self):
+        self._cached.cache_clear()
+        self._table_hits = 0
+
+    def stats(self):
+        info = self._cached.cache_info()
+        hits = self._table_hits + info.hits
+        total = hits + info.misses
+        return {
+            "table_size": len(self._table),
+            "table_hits": self._table_hits,
+            "cache_hits": info.hits,
+            "misses": info.misses,
+            "cache_size": info.currsize,
+            "cache_maxsize": info.maxsize,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
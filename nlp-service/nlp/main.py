@@ -1,6 +1,28 @@
 # main.py
-from es_query import create_index, index_sample_data, search_products, es, INDEX_NAME
-from query_parser import parse_query
+from nlp.es_query import create_index, index_sample_data, search_products, to_search_kwargs, es, INDEX_NAME
+from nlp.query_parser import parse_query
+
+
+def map_category(category):
+    if not category:
+        return None
+    mapping = {
+        "shoe": ["shoe", "shoes", "sneakers"],
+        "phone": ["smartphone", "phone"],
+        # add more mappings as needed
+    }
+    return mapping.get(category, [category])
+
+
+def map_brand(brand):
+    if not brand:
+        return None
+    mapping = {
+        "iphone": ["apple", "iphone"],
+        # add more mappings as needed
+    }
+    return mapping.get(brand, [brand])
+
 
 if __name__ == "__main__":
     # Clean up index for fresh run (development only)
@@ -25,52 +47,16 @@ if __name__ == "__main__":
         parsed = parse_query(q)
         print("Parsed:", parsed)
 
-        # Safely extract values
-        category = parsed.get("category")
-        color_list = parsed.get("color") or [None]
-        brand = parsed.get("brand")[0] if parsed.get("brand") else None
-        gender = parsed.get("gender")
-        price_filter = parsed.get("price_filter")
-
-        def map_category(category):
-            if not category:
-                return None
-            mapping = {
-                "shoe": ["shoe", "shoes", "sneakers"],
-                "phone": ["smartphone", "phone"],
-                # add more mappings as needed
-            }
-            return mapping.get(category, [category])
-
-        def map_brand(brand):
-            if not brand:
-                return None
-            mapping = {
-                "iphone": ["apple", "iphone"],
-                # add more mappings as needed
-            }
-            return mapping.get(brand, [brand])
-
-        category_list = map_category(category)
-        brand_list = map_brand(brand) if brand else [None]
-
-        results = []
-        for cat in category_list or [None]:
-            for br in brand_list or [None]:
-                for col in color_list or [None]:
-                    res = search_products(
-                        category=cat,
-                        color=col,
-                        brand=br,
-                        gender=gender,
-                        price_filter=price_filter,
-                        query_text=q
-                    )
-                    results.extend(res)
+        # Expand category/brand to the values products are stored under;
+        # every expansion goes into one terms query, so the whole query is
+        # a single round trip however many combinations it covers
+        search_kwargs = to_search_kwargs(parsed)
+        search_kwargs["category"] = map_category(search_kwargs["category"])
+        search_kwargs["brand"] = map_brand(search_kwargs["brand"])
+        search_kwargs["query_text"] = q
 
-        # Remove duplicates (optional)
-        unique_results = [dict(t) for t in {tuple(d.items()) for d in results}]
+        results = search_products(**search_kwargs)
         print("Search Results:")
-        for r in unique_results:
+        for r in results:
             print(r)
         print("-" * 40)
@@ -1,18 +1,36 @@
+import asyncio
 from fastapi import FastAPI, HTTPException, Query
 from dotenv import load_dotenv
 import os
-from nlp.query_parser import parse_query, update_lists_from_product, RAW_CATEGORIES, COLORS, BRANDS, GENDERS
-from nlp.es_query import search_products, INDEX_NAME, es
-from pydantic import BaseModel
+from nlp.query_parser import (
+    parse_query, parse_queries, normalize_query, update_lists_from_product, vocabulary_version,
+    PARSE_CACHE, LEMMATIZER, FAST_PATH, PARSE_METRICS, VOCABULARY
+)
+from nlp.es_query import (
+    INDEX_NAME, MAX_RESULT_WINDOW, REFRESH_POLICY, ES_BREAKER, ES_METRICS, RESULT_CACHE, SEARCH_FLIGHT,
+    decode_cursor, source_fields, to_search_kwargs
+)
+from nlp.es_async import (
+    async_es, search_page_async, search_products_batch_async, index_product_async, ASYNC_SEARCH_FLIGHT
+)
+from nlp.single_flight import AsyncSingleFlight
+from nlp.json_codec import dumps
+from nlp.resilience import CircuitOpenError, DeadlineExceeded, ElasticsearchUnavailable, deadline
+from nlp import config
+from nlp.metrics import render_stats
+from nlp.pipeline import load_pipeline
+from pydantic import BaseModel, Field
 from typing import Optional
-import spacy
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
 
 
 # Load config
 load_dotenv()
 
-nlp = spacy.load("en_core_web_sm")
+# Same pipeline instance as the query parser (see SPACY_PROFILE)
+nlp = load_pipeline()
 
 def lemmatize(text: str) -> str:
     return " ".join([token.lemma_ for token in nlp(text.lower()) if not token.is_punct and not token.is_space])
@@ -31,7 +49,36 @@ class Product(BaseModel):
     discount: Optional[int] = 0
     photo_links: Optional[list[str]] = []
 
-app = FastAPI()
+class BatchSearchRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1, max_length=1000)
+    read_your_writes: bool = False
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await async_es.close()
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with nlp.json_codec (orjson when installed); RawJSON passes through."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Concurrent /search requests for the same normalized query share one
+# parse and one Elasticsearch round trip
+SEARCH_HANDLER_FLIGHT = AsyncSingleFlight("search_handler", enabled=config.ELASTICSEARCH_CONFIG['single_flight'])
+
+# Time budget of a search request, from here through every Elasticsearch call
+SEARCH_DEADLINE = config.ELASTICSEARCH_CONFIG['search_deadline']
+
+def unavailable(error):
+    """HTTP error for Elasticsearch not answering: 504 past the deadline, else 503."""
+    if isinstance(error, DeadlineExceeded):
+        return HTTPException(status_code=504, detail=str(error))
+    headers = {"Retry-After": str(int(ES_BREAKER.reset_timeout))} if isinstance(error, CircuitOpenError) else None
+    return HTTPException(status_code=503, detail=str(error), headers=headers)
 
 # Allow all origins for now (for testing/development)
 app.add_middleware(
@@ -43,40 +90,99 @@ app.add_middleware(
 )
 
 @app.get("/search")
-async def search(q: str = Query(..., min_length=1)):
+async def search(
+    q: str = Query(..., min_length=1),
+    read_your_writes: bool = False,
+    size: int = Query(10, ge=0, le=config.ELASTICSEARCH_CONFIG['max_page_size']),
+    offset: int = Query(0, ge=0, alias="from"),
+    cursor: Optional[str] = None,
+    fields: str = "all",
+    track_total_hits: Optional[bool] = None,
+):
     """
     Search endpoint using query parser + Elasticsearch.
     Example: /search?q=blue%20nike%20shoes%20under%2050
-    """
-    filters = parse_query(q)
+    read_your_writes=true refreshes the index first, so products added just
+    before (by any worker or loader) are visible.
 
+    Pages: size/from for the first pages, then cursor=<next_cursor of the
+    previous page> to go deeper. fields=card returns only the listing card
+    fields (or pass a comma list), and track_total_hits=false skips counting
+    every match (total is then null).
+
+    The search has ES_SEARCH_DEADLINE seconds (504 after that). While
+    Elasticsearch is unavailable a cached page may be served with
+    "stale": true, else the answer is 503.
+    """
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Use either from or cursor, not both")
+    if offset + size > MAX_RESULT_WINDOW:
+        raise HTTPException(status_code=400, detail=f"from + size can't exceed {MAX_RESULT_WINDOW}; page on with cursor")
     try:
+        search_after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def run():
+        filters = parse_query(q)
         print(filters)
-        results = search_products(
-            category=filters.get("category"),
-            color=filters.get("color"),
-            brand=filters.get("brand"),
-            gender=filters.get("gender"),
-            price_filter={
-                "operator": "between",
-                "min": filters["price_min"],
-                "max": filters["price_max"]
-            } if filters["price_min"] is not None and filters["price_max"] is not None else (
-                {"operator": ">=", "value": filters["price_min"]} if filters["price_min"] is not None else (
-                    {"operator": "<=", "value": filters["price_max"]} if filters["price_max"] is not None else None
-                )
-            ),
-            query_text=" ".join(filters["keywords"]) if filters["keywords"] else None
+        page = await search_page_async(
+            **to_search_kwargs(filters), size=size, offset=offset, search_after=search_after,
+            source=source_fields(fields), track_total_hits=track_total_hits, read_your_writes=read_your_writes,
+            raw_results=True,  # encoded once per Elasticsearch round trip, not per response
         )
-        return {"total": len(results), "results": results}
+        response = {
+            "total": page["total"],
+            "total_relation": page["total_relation"],
+            "next_cursor": page["next_cursor"],
+            "results": page["results"],
+        }
+        if page.get("stale"):
+            response["stale"] = True
+        return response
+
+    try:
+        with deadline(SEARCH_DEADLINE):
+            if read_your_writes:
+                return FastJSONResponse(await run())
+            key = (normalize_query(q), size, offset, cursor, fields, track_total_hits)
+            # Returned as a response, so FastAPI doesn't walk the results with jsonable_encoder
+            return FastJSONResponse(await SEARCH_HANDLER_FLIGHT.do(key, run))
+    except ElasticsearchUnavailable as e:
+        raise unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """
+    Parse many queries in one nlp.pipe pass and run them in one _msearch.
+    Example body: {"queries": ["blue nike shoes", "phone under 3000"]}
+    """
+    with deadline(SEARCH_DEADLINE):
+        try:
+            # spaCy over up to 1000 queries: off the event loop
+            parsed = await asyncio.to_thread(lambda: list(parse_queries(request.queries)))
+            result_sets = await search_products_batch_async(
+                [to_search_kwargs(filters) for filters in parsed], read_your_writes=request.read_your_writes
+            )
+            return {
+                "results": [
+                    {"query": q, "filters": filters, "total": len(results), "results": results}
+                    for q, filters, results in zip(request.queries, parsed, result_sets)
+                ]
+            }
+        except ElasticsearchUnavailable as e:
+            raise unavailable(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/add-product")
-async def add_product(product: Product):
+async def add_product(product: Product, read_your_writes: bool = False):
     """
     Add a single product to Elasticsearch using lemmatized fields,
     but stored in the standard format (no *_lemma keys).
+    read_your_writes=true waits until the product is searchable.
     """
     try:
         # Load and lemmatize fields
@@ -107,19 +213,19 @@ async def add_product(product: Product):
         # Update vocab lists using lemmatized values
         update_lists_from_product(doc)
 
-        # Index in Elasticsearch
-        result = es.index_document(index=INDEX_NAME, body=doc)
-        es.refresh(index=INDEX_NAME)
+        # Index in Elasticsearch; REFRESH_POLICY decides when it becomes searchable
+        result = await index_product_async(doc, read_your_writes=read_your_writes)
 
+        vocab = VOCABULARY.snapshot
         return {
             "message": "Product added successfully",
             "product_id": result.get("_id"),
             "result": result.get("result"),
             "updated_lists": {
-                "categories": len(RAW_CATEGORIES),
-                "colors": len(COLORS),
-                "brands": len(BRANDS),
-                "genders": len(GENDERS)
+                "categories": len(vocab.raw_categories),
+                "colors": len(vocab.colors),
+                "brands": len(vocab.brands),
+                "genders": len(vocab.genders)
             }
         }
 
@@ -135,7 +241,7 @@ async def debug():
             "match_all": {}
         }
     }
-    res = es.search(index=INDEX_NAME, body=query)
+    res = await async_es.search(index=INDEX_NAME, body=query)
     return res["hits"]["hits"]
 
 @app.get("/lists")
@@ -143,9 +249,40 @@ async def get_lists():
     """
     Get current category, color, brand, and gender lists.
     """
+    vocab = VOCABULARY.snapshot
+    return {"version": vocab.version, **vocab.as_lists()}
+
+@app.get("/admin/cache-stats")
+async def cache_stats():
+    """
+    Hit/miss/eviction counters for the parse, lemma and search result
+    caches, and how often the spaCy-free fast path answered a parse.
+    """
     return {
-        "categories": RAW_CATEGORIES,
-        "colors": COLORS,
-        "brands": BRANDS,
-        "genders": GENDERS
+        "vocabulary_version": vocabulary_version(),
+        "parse_cache": PARSE_CACHE.stats(),
+        "lemma_cache": LEMMATIZER.stats(),
+        "fast_path": FAST_PATH.stats(),
+        "result_cache": RESULT_CACHE.stats()
     }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text exposition of the parser counters, Elasticsearch
+    round-trip histograms, refresh counts, coalesced searches, circuit
+    breaker state and hedged searches, plus
+    per-stage parse_query histograms when PARSE_STAGE_METRICS is on.
+    """
+    lines = PARSE_METRICS.render()
+    lines += render_stats("nlp_parse_cache", PARSE_CACHE.stats())
+    lines += render_stats("nlp_lemma_cache", LEMMATIZER.stats())
+    lines += render_stats("nlp_fast_path", FAST_PATH.stats())
+    lines += ES_METRICS.render("nlp_es")
+    lines += render_stats("nlp_es_refresh", REFRESH_POLICY.stats(), {"refreshes": "reason"})
+    lines += render_stats("nlp_result_cache", RESULT_CACHE.stats(), {"generations": "index"})
+    for flight in (SEARCH_HANDLER_FLIGHT, ASYNC_SEARCH_FLIGHT, SEARCH_FLIGHT):
+        lines += render_stats(f"nlp_single_flight_{flight.name}", flight.stats())
+    lines += render_stats("nlp_es_breaker", ES_BREAKER.stats())
+    lines += render_stats("nlp_es_hedge", async_es.stats())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
@@ -0,0 +1,121 @@
+import bisect
+import threading
+
+# Latency buckets (seconds) for parse stages: 50us .. 1s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Buckets for per-query counts such as fuzzy-match calls
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format(value):
+    return "+Inf" if value == float("inf") else repr(value)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def render(self, name, labels=None):
+        labels = labels or {}
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=_format(float(bound))))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_format(total)}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class StageMetrics:
+    """
+    Per-stage latency histograms (parser stages, Elasticsearch calls),
+    plus per-query count histograms (e.g. fuzzy-match calls).
+
+    Callers check ``enabled`` before reading the clock, so a disabled
+    instance costs one attribute lookup per stage.
+    """
+
+    def __init__(self, enabled=False, description="Time spent in each parse_query stage."):
+        self.enabled = enabled
+        self.description = description
+        self._stages = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _get(self, table, key, buckets):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, stage, seconds):
+        self._get(self._stages, stage, LATENCY_BUCKETS).observe(seconds)
+
+    def observe_count(self, name, value):
+        self._get(self._counts, name, COUNT_BUCKETS).observe(value)
+
+    def render(self, prefix="nlp_parse"):
+        lines = []
+        if self._stages:
+            name = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {name} {self.description}")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in sorted(self._stages.items()):
+                lines.extend(histogram.render(name, {"stage": stage}))
+        for count_name, histogram in sorted(self._counts.items()):
+            name = f"{prefix}_{count_name}"
+            lines.append(f"# HELP {name} Per-query {count_name.replace('_', ' ')}.")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(histogram.render(name))
+        return lines
+
+
+def render_stats(prefix, stats, label_names=None):
+    """
+    Numeric entries of a stats() dict as Prometheus gauges. A nested dict
+    (e.g. per index) is one gauge with a sample per entry, its key as a
+    label named by label_names (default "key"), so keys never end up in
+    metric names.
+    """
+    label_names = label_names or {}
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            label = label_names.get(key, "key")
+            samples = [(sub, int(v) if isinstance(v, bool) else v) for sub, v in value.items()
+                       if isinstance(v, (int, float))]
+            if samples:
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{_labels({label: sub})} {_format(v)}" for sub, v in samples)
+        elif isinstance(value, (int, float)):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format(int(value) if isinstance(value, bool) else value)}")
+    return lines
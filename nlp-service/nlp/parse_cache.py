@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ParseCache:
+    """
+    Bounded LRU + TTL cache of parse_query results.
+
+    Every entry remembers the vocabulary version it was parsed under. A
+    lookup with a newer version treats the entry as stale, so teaching the
+    parser a new term invalidates everything without walking the cache.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.stale = 0
+
+    @staticmethod
+    def _copy(result):
+        return dict(result, keywords=list(result["keywords"]))
+
+    def get(self, key, version):
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_version, expires_at, result = entry
+            if entry_version != version:
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._copy(result)
+
+    def put(self, key, version, result):
+        if self.maxsize <= 0:
+            return
+        entry = (version, time.monotonic() + self.ttl, self._copy(result))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
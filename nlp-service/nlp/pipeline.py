@@ -0,0 +1,31 @@
+import spacy
+from functools import lru_cache
+
+from nlp.config import PARSER_CONFIG
+
+# Components each profile leaves out of the spaCy pipeline.
+# Query parsing only reads lemma_, is_stop, is_punct and like_num: the
+# lemmatizer needs tok2vec, tagger and attribute_ruler, the rest is unused.
+PIPELINE_PROFILES = {
+    "full": [],
+    "slim": ["parser", "ner", "senter"],
+}
+
+
+def load_pipeline(model=None, profile=None):
+    """
+    Load (once per process) the spaCy pipeline for the given profile.
+
+    Defaults come from SPACY_MODEL / SPACY_PROFILE so the API and the parser
+    share one instance.
+    """
+    model = model or PARSER_CONFIG["spacy_model"]
+    profile = profile or PARSER_CONFIG["spacy_profile"]
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown spaCy profile '{profile}', expected one of {sorted(PIPELINE_PROFILES)}")
+    return _load(model, profile)
+
+
+@lru_cache(maxsize=None)
+def _load(model, profile):
+    return spacy.load(model, exclude=PIPELINE_PROFILES[profile])
@@ -0,0 +1,209 @@
+"""
+Compiles parsed queries into Elasticsearch search bodies.
+
+Exact attribute filters (category, color, brand, gender, price) go in the
+bool query's ``filter`` context: they are not scored and Elasticsearch can
+cache them. Only the two fuzzy ``multi_match`` clauses score. Every hit
+matches all filters, and on keyword fields (no norms, one value) a
+``term`` in ``must`` adds the same score to each of them, so moving the
+filters out of ``must`` changes no result and no ranking.
+
+The body shape is also available as a stored mustache search template
+(TEMPLATE_SOURCE, registered with register_template), so a search only
+sends its parameters to ``_search/template``.
+"""
+
+import hashlib
+import json
+import re
+from typing import Iterable, Optional, Union
+
+# Fuzzy matching for misspelled terms; the same for every query, only the
+# text differs
+TEXT_CLAUSES = (
+    {"fields": ["name^3", "description", "category"], "fuzziness": "AUTO",
+     "prefix_length": 2, "max_expansions": 50},
+    {"fields": ["brand^2", "name^3"], "fuzziness": "AUTO",
+     "prefix_length": 1, "max_expansions": 20},  # lower prefix for brand matching
+)
+
+SORT = [
+    {"_score": "desc"},
+    {"rating": "desc"},
+    {"discount": "desc"},
+    {"price": "asc"},
+    {"_doc": "asc"},  # tiebreaker, so search_after never skips or repeats ties
+]
+
+PRICE_OPERATORS = {">": "gt", "<": "lt", ">=": "gte", "<=": "lte"}
+
+KEYWORD_FIELDS = ("category", "color", "brand", "gender")
+
+# Elasticsearch's defaults for what the template always sends
+DEFAULT_SIZE = 10
+DEFAULT_FROM = 0
+
+
+def _values(value):
+    if isinstance(value, str):
+        value = [value]
+    return tuple(dict.fromkeys(v.lower() for v in value or () if v))
+
+
+class ParsedQuery:
+    """
+    Typed, normalized search request: the alternatives allowed for each
+    keyword attribute (lowercased, deduplicated; empty = any), a price
+    range as Elasticsearch range operators, and the free text to score.
+    """
+
+    __slots__ = ("category", "color", "brand", "gender", "price", "text")
+
+    def __init__(self, category: Iterable[str] = (), color: Iterable[str] = (), brand: Iterable[str] = (),
+                 gender: Iterable[str] = (), price: Optional[dict] = None, text: Optional[str] = None):
+        self.category = _values(category)
+        self.color = _values(color)
+        self.brand = _values(brand)
+        self.gender = _values(gender)
+        self.price = dict(sorted((price or {}).items()))
+        self.text = text or None
+
+    @classmethod
+    def from_search_kwargs(cls, category=None, color=None, brand=None, gender=None, price_filter=None,
+                           query_text=None):
+        """From search_products keyword arguments (price_filter with an operator)."""
+        price = {}
+        if price_filter:
+            op = price_filter.get("operator")
+            if op == "between":
+                price = {"gte": price_filter["min"], "lte": price_filter["max"]}
+            elif op in PRICE_OPERATORS:
+                price = {PRICE_OPERATORS[op]: price_filter["value"]}
+        return cls(category, color, brand, gender, price, query_text)
+
+    def filters(self):
+        """Non-scoring clauses: term (one value) or terms (alternatives), and range."""
+        clauses = []
+        for field in KEYWORD_FIELDS:
+            values = getattr(self, field)
+            if len(values) == 1:
+                clauses.append({"term": {field: values[0]}})
+            elif values:
+                clauses.append({"terms": {field: list(values)}})
+        if self.price:
+            clauses.append({"range": {"price": dict(self.price)}})
+        return clauses
+
+    def _key(self):
+        return (self.category, self.color, self.brand, self.gender, tuple(self.price.items()), self.text)
+
+    def __eq__(self, other):
+        return isinstance(other, ParsedQuery) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name))
+        return f"ParsedQuery({fields})"
+
+
+def text_clauses(text):
+    if not text:
+        return []
+    return [{"multi_match": dict(clause, query=text)} for clause in TEXT_CLAUSES]
+
+
+def compile_body(parsed: ParsedQuery, size: Optional[int] = None, offset: Optional[int] = None,
+                 search_after: Optional[list] = None, source: Optional[list] = None,
+                 track_total_hits: Union[bool, int, None] = None):
+    """Inline _search body for parsed; the page options are left out when unset."""
+    body = {
+        "query": {
+            "bool": {
+                "filter": parsed.filters(),
+                "should": text_clauses(parsed.text),
+                "minimum_should_match": 0,
+            }
+        },
+        "sort": SORT,
+    }
+    if size is not None:
+        body["size"] = size
+    if offset:
+        body["from"] = offset
+    if search_after is not None:
+        body["search_after"] = search_after
+    if source is not None:
+        body["_source"] = source
+    if track_total_hits is not None:
+        body["track_total_hits"] = track_total_hits
+    return body
+
+
+def _template_source():
+    text = ",".join(
+        '{"multi_match":' + json.dumps(dict(clause, query="@TEXT@"), separators=(",", ":")) + "}"
+        for clause in TEXT_CLAUSES
+    ).replace('"@TEXT@"', "{{#toJson}}text{{/toJson}}")
+    return (
+        '{"query":{"bool":{"filter":{{#toJson}}filters{{/toJson}},'
+        '"should":[{{#has_text}}' + text + '{{/has_text}}],"minimum_should_match":0}},'
+        '"sort":' + json.dumps(SORT, separators=(",", ":")) + ','
+        '{{#has_search_after}}"search_after":{{#toJson}}search_after{{/toJson}},{{/has_search_after}}'
+        '{{#has_source}}"_source":{{#toJson}}source{{/toJson}},{{/has_source}}'
+        '{{#has_track_total_hits}}"track_total_hits":{{#toJson}}track_total_hits{{/toJson}},{{/has_track_total_hits}}'
+        '"from":{{from}},"size":{{size}}}'
+    )
+
+
+# Mustache source of the stored template; its id changes with the source,
+# so a deploy with a new body shape never runs an old template
+TEMPLATE_SOURCE = _template_source()
+TEMPLATE_ID = "product-search-" + hashlib.sha1(TEMPLATE_SOURCE.encode("utf-8")).hexdigest()[:10]
+
+
+def template_params(parsed: ParsedQuery, size=None, offset=None, search_after=None, source=None,
+                    track_total_hits=None):
+    """
+    Parameters that render TEMPLATE_SOURCE into compile_body's body. Unset
+    options are left out (a missing flag renders as false).
+    """
+    params = {"filters": parsed.filters(), "from": offset or DEFAULT_FROM,
+              "size": DEFAULT_SIZE if size is None else size}
+    if parsed.text is not None:
+        params.update(has_text=True, text=parsed.text)
+    if search_after is not None:
+        params.update(has_search_after=True, search_after=search_after)
+    if source is not None:
+        params.update(has_source=True, source=source)
+    if track_total_hits is not None:
+        params.update(has_track_total_hits=True, track_total_hits=track_total_hits)
+    return params
+
+
+def template_body(parsed: ParsedQuery, **page):
+    """_search/template body: the stored template's id and its parameters."""
+    return {"id": TEMPLATE_ID, "params": template_params(parsed, **page)}
+
+
+_SECTION = re.compile(r"\{\{#(?!toJson)(\w+)\}\}(.*?)\{\{/\1\}\}", re.S)
+_TO_JSON = re.compile(r"\{\{#toJson\}\}(\w+)\{\{/toJson\}\}")
+_VARIABLE = re.compile(r"\{\{(\w+)\}\}")
+
+
+def render_template(params, source=TEMPLATE_SOURCE):
+    """
+    Render source the way Elasticsearch's mustache does, for the subset the
+    template uses (flag sections, toJson, plain variables). Lets the stub
+    serve _search/template and the compiler check its own template.
+    """
+    text = _SECTION.sub(lambda m: m.group(2) if params.get(m.group(1)) else "", source)
+    text = _TO_JSON.sub(lambda m: json.dumps(params[m.group(1)]), text)
+    text = _VARIABLE.sub(lambda m: str(params[m.group(1)]), text)
+    return json.loads(text)
+
+
+def register_template(client, template_id=TEMPLATE_ID, source=TEMPLATE_SOURCE):
+    """Store the template in the cluster (PUT _scripts/<id>)."""
+    return client.put_script(template_id, {"script": {"lang": "mustache", "source": source}})
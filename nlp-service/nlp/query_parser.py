@@ -1,52 +1,129 @@
-import spacy
 import re
-import json
-import os
-from rapidfuzz import process, fuzz
-
-nlp = spacy.load("en_core_web_sm")
-
-# Get absolute path to synonym.json
-base_dir = os.path.dirname(__file__)
-synonym_path = os.path.join(base_dir, "synonym.json")
-
-# Load synonyms from JSON safely
-with open(synonym_path, "r") as f:
-    synonym_data = json.load(f)
-
-SYNONYM_MAP = synonym_data  # expects 'categories', 'brands', etc.
-
-MULTIWORD_SYNONYM_PATTERNS = [
-    (r"smart phones?", "smartphone"),
-    (r"running shoes?", "sports shoes")
-]
+import time
+from nlp.config import PARSER_CONFIG
+from nlp.fast_path import FastPath
+from nlp.fuzzy_matcher import AttributeMatcher
+from nlp.lemmatizer import CachedLemmatizer
+from nlp.metrics import StageMetrics
+from nlp.parse_cache import ParseCache
+from nlp.pipeline import load_pipeline
+from nlp.symspell import DeletionIndex
+from nlp.synonym_index import ReloadingSynonymIndex
+from nlp.vocab_artifact import load_artifact
+from nlp.vocabulary import VocabularyRegistry
+
+nlp = load_pipeline()
+
+# Single-word lemmas for the category checks, answered without running spaCy
+LEMMATIZER = CachedLemmatizer(nlp, maxsize=PARSER_CONFIG["lemma_cache_size"])
+
+# Compiled synonym.json (reverse dict + multi-word trie), hot reloaded on change
+SYNONYMS = ReloadingSynonymIndex(
+    PARSER_CONFIG["synonym_path"],
+    interval=PARSER_CONFIG["synonym_reload_interval"],
+)
+SYNONYMS.start_watcher()
+
+# Parsed results for repeated queries, invalidated by vocabulary changes
+PARSE_CACHE = ParseCache(
+    maxsize=PARSER_CONFIG["parse_cache_size"],
+    ttl=PARSER_CONFIG["parse_cache_ttl"],
+)
+
+# Per-stage latency histograms, served by /metrics
+PARSE_METRICS = StageMetrics(enabled=PARSER_CONFIG["stage_metrics"])
+
+# Seed vocabulary; terms learned from products are added to VOCABULARY
+DEFAULT_CATEGORIES = ["shoes", "sandals", "boots", "heels", "flats", "slippers", "smartphone", "earphone","electronics"]
+DEFAULT_COLORS = ["red", "blue", "black", "white", "green", "yellow", "pink", "brown", "grey", "orange", "purple"]
+DEFAULT_GENDERS = ["men", "women", "boys", "girls", "unisex"]
+DEFAULT_BRANDS = ["nike", "adidas", "puma", "reebok", "skechers", "new balance", "fila", "converse", "vans", "woodland", "red tape", "bata", "h&m", "zara", "campus", "sparx", "crocs", "iphone", "samsung", "apple", "xiaomi", "oneplus", "oppo", "vivo"]
+
+def lemmatize_term(term):
+    return [token.lemma_ for token in nlp(term)]
+
+# Vocabulary, lemma table and fuzzy indexes precompiled offline, if configured
+ARTIFACT = load_artifact(PARSER_CONFIG["vocab_artifact_path"])
+
+VOCABULARY = VocabularyRegistry(
+    lemmatize_term,
+    categories=DEFAULT_CATEGORIES,
+    brands=DEFAULT_BRANDS,
+    colors=DEFAULT_COLORS,
+    genders=DEFAULT_GENDERS,
+    snapshot=ARTIFACT.snapshot if ARTIFACT else None,
+)
+
+def vocabulary_version():
+    """Version of everything a parse depends on: learned terms and synonyms."""
+    return (VOCABULARY.version, SYNONYMS.current.version)
+
+def build_fuzzy_index(terms):
+    return DeletionIndex(
+        terms,
+        max_distance=PARSER_CONFIG["fuzzy_index_distance"],
+        prefix_length=PARSER_CONFIG["fuzzy_index_prefix_length"],
+    )
+
+_vocab = VOCABULARY.snapshot
+
+# Typo-candidate indexes used by the matcher once a vocabulary gets large.
+# They only grow, so new terms are added in place.
+if ARTIFACT:
+    FUZZY_INDEXES = ARTIFACT.indexes
+    LEMMATIZER.load_table(ARTIFACT.lemma_table)
+else:
+    FUZZY_INDEXES = {
+        "categories": build_fuzzy_index(_vocab.categories),
+        "brands": build_fuzzy_index(_vocab.brands),
+        "colors": build_fuzzy_index(_vocab.colors),
+        "genders": build_fuzzy_index(_vocab.genders),
+    }
 
-# Global lists
-RAW_CATEGORIES = ["shoes", "sandals", "boots", "heels", "flats", "slippers", "smartphone", "earphone","electronics"]
-COLORS = ["red", "blue", "black", "white", "green", "yellow", "pink", "brown", "grey", "orange", "purple"]
-GENDERS = ["men", "women", "boys", "girls", "unisex"]
-BRANDS = ["nike", "adidas", "puma", "reebok", "skechers", "new balance", "fila", "converse", "vans", "woodland", "red tape", "bata", "h&m", "zara", "campus", "sparx", "crocs", "iphone", "samsung", "apple", "xiaomi", "oneplus", "oppo", "vivo"]
+# Precompute lemmas for every word the parser can normalize a token to
+# (with an artifact only words it does not cover, e.g. new synonyms, are left)
+LEMMATIZER.preload(
+    list(_vocab.raw_categories + _vocab.categories + _vocab.colors + _vocab.genders + _vocab.brands)
+    + sorted(SYNONYMS.current.canonical)
+)
+
+# Words PRICE_PATTERNS are made of
+PRICE_WORDS = ["between", "and", "under", "below", "less", "than", "above", "over", "greater", "upto", "up", "to"]
+
+# spaCy-free tokenization for queries made only of known words
+FAST_PATH = FastPath(nlp, max_combinations=PARSER_CONFIG["fast_path_max_combinations"])
+FAST_PATH.admit(
+    list(_vocab.raw_categories + _vocab.categories + _vocab.colors + _vocab.genders + _vocab.brands)
+    + sorted(nlp.Defaults.stop_words) + PRICE_WORDS
+)
+
+def _on_new_term(field, term, snapshot):
+    """Keep the lemma table, fuzzy indexes and fast path in step with the vocabulary."""
+    FAST_PATH.admit([term] + list(snapshot.categories if field == "categories" else ()))
+    if field == "categories":
+        LEMMATIZER.preload([term] + list(snapshot.categories))
+        for lemma in snapshot.categories:
+            FUZZY_INDEXES["categories"].add(lemma)
+    else:
+        LEMMATIZER.preload([term])
+        FUZZY_INDEXES[field].add(term)
+
+VOCABULARY.add_listener(_on_new_term)
 
 def add_to_categories(category):
-    if category and category.lower() not in [cat.lower() for cat in RAW_CATEGORIES]:
-        RAW_CATEGORIES.append(category.lower())
-        global CATEGORIES
-        CATEGORIES = lemmatize_list(RAW_CATEGORIES)
+    if VOCABULARY.add("categories", category):
         print(f"✅ Added category: {category}")
 
 def add_to_colors(color):
-    if color and color.lower() not in [col.lower() for col in COLORS]:
-        COLORS.append(color.lower())
+    if VOCABULARY.add("colors", color):
         print(f"✅ Added color: {color}")
 
 def add_to_brands(brand):
-    if brand and brand.lower() not in [br.lower() for br in BRANDS]:
-        BRANDS.append(brand.lower())
+    if VOCABULARY.add("brands", brand):
         print(f"✅ Added brand: {brand}")
 
 def add_to_genders(gender):
-    if gender and gender.lower() not in [gen.lower() for gen in GENDERS]:
-        GENDERS.append(gender.lower())
+    if VOCABULARY.add("genders", gender):
         print(f"✅ Added gender: {gender}")
 
 def update_lists_from_product(product):
@@ -59,11 +136,6 @@ def update_lists_from_product(product):
     if product.get("gender"):
         add_to_genders(product["gender"])
 
-def lemmatize_list(word_list):
-    return list(set([token.lemma_ for token in nlp(" ".join(word_list))]))
-
-CATEGORIES = lemmatize_list(RAW_CATEGORIES)
-
 PRICE_PATTERNS = [
     (r"between (\d+) and (\d+)", "between"),
     (r"(?:under|below|less than)\s*\$?(\d+)", "<"),
@@ -71,68 +143,114 @@ PRICE_PATTERNS = [
     (r"(?:upto|up to)\s*\$?(\d+)", "<="),
 ]
 
-def fuzzy_match(token, choices, threshold=60):
-    match, score, _ = process.extractOne(token, choices, scorer=fuzz.ratio)
-    return match if score >= threshold else None
+_matcher = (None, None)
+
+def get_matcher(vocab=None):
+    """AttributeMatcher over a vocabulary snapshot, rebuilt when it changes."""
+    global _matcher
+    vocab = vocab or VOCABULARY.snapshot
+    version, matcher = _matcher
+    if version != vocab.version:
+        version = vocab.version
+        matcher = AttributeMatcher(
+            vocab.categories, vocab.brands, vocab.colors, vocab.genders,
+            workers=PARSER_CONFIG["fuzzy_workers"],
+            indexes=FUZZY_INDEXES,
+            index_min_size=PARSER_CONFIG["fuzzy_index_min_size"],
+        )
+        _matcher = (version, matcher)
+    return matcher
+
+def normalize_token(token, synonyms=None):
+    return (synonyms or SYNONYMS.current).normalize(token)
+
+def apply_multiword_synonyms(query, synonyms=None):
+    return (synonyms or SYNONYMS.current).rewrite(query)
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace; also the parse cache key."""
+    return " ".join(query.lower().split())
+
+def prepare_query(query, synonyms=None):
+    """Normalize the query and rewrite multi-word synonyms before spaCy sees it."""
+    return apply_multiword_synonyms(normalize_query(query), synonyms)
 
-def fuzzy_match_brand(token, choices, threshold=80):
-    """Brand fuzzy matching with category safety and higher thresholds."""
-    token_lower = token.lower()
+def parse_query(query):
+    key = normalize_query(query)
+    # Pin one vocabulary snapshot and synonym index for the whole query so
+    # a concurrent /add-product or reload can't split it
+    vocab = VOCABULARY.snapshot
+    synonyms = SYNONYMS.current
+    version = (vocab.version, synonyms.version)
+    cached = PARSE_CACHE.get(key, version)
+    if cached is not None:
+        return cached
+
+    timed = PARSE_METRICS.enabled
+    if timed:
+        start = time.perf_counter()
+    query = prepare_query(key, synonyms)
+    if timed:
+        PARSE_METRICS.observe("synonyms", time.perf_counter() - start)
+
+    result = _parse_fast(query, synonyms, vocab)
+    if result is None:
+        spacy_start = time.perf_counter()
+        doc = nlp(query)
+        if timed:
+            PARSE_METRICS.observe("nlp", time.perf_counter() - spacy_start)
+        result = parse_doc(query, doc, synonyms, vocab)
+        FAST_PATH.record_spacy(time.perf_counter() - spacy_start)
+    if timed:
+        PARSE_METRICS.observe("total", time.perf_counter() - start)
+    PARSE_CACHE.put(key, version, result)
+    return result
 
-    # Block if token is a category
-    if token_lower in [c.lower() for c in CATEGORIES]:
+def _parse_fast(query, synonyms, vocab):
+    """
+    parse_doc over FAST_PATH tokens, or None when the query has an unknown
+    word or the possible lemmas of its words don't agree on one result.
+    """
+    if not PARSER_CONFIG["fast_path"] or not FAST_PATH.enabled:
         return None
+    start = time.perf_counter()
+    candidates = FAST_PATH.tokenize(query, synonyms)
+    if PARSE_METRICS.enabled:
+        PARSE_METRICS.observe("fast_tokenize", time.perf_counter() - start)
+    if isinstance(candidates, str):
+        FAST_PATH.record_fallback(candidates)
+        return None
+    result = parse_doc(query, candidates[0], synonyms, vocab)
+    for tokens in candidates[1:]:
+        if parse_doc(query, tokens, synonyms, vocab) != result:
+            FAST_PATH.record_fallback("ambiguous")
+            return None
+    FAST_PATH.record_fast(time.perf_counter() - start)
+    return result
 
-    if token_lower in [choice.lower() for choice in choices]:
-        return token_lower
-
-    results = []
-
-    # Ratio scoring
-    ratio_result = process.extractOne(token_lower, choices, scorer=fuzz.ratio)
-    if ratio_result[1] >= threshold:
-        results.append((ratio_result[0], ratio_result[1], 'ratio'))
-
-    # Partial ratio
-    partial_result = process.extractOne(token_lower, choices, scorer=fuzz.partial_ratio)
-    if partial_result[1] >= 70 and not any(token_lower in c.lower() for c in CATEGORIES):
-        results.append((partial_result[0], partial_result[1], 'partial'))
-
-    # Token sort ratio
-    token_sort_result = process.extractOne(token_lower, choices, scorer=fuzz.token_sort_ratio)
-    if token_sort_result[1] >= threshold:
-        results.append((token_sort_result[0], token_sort_result[1], 'token_sort'))
-
-    # Token set ratio
-    token_set_result = process.extractOne(token_lower, choices, scorer=fuzz.token_set_ratio)
-    if token_set_result[1] >= 70 and not any(token_lower in c.lower() for c in CATEGORIES):
-        results.append((token_set_result[0], token_set_result[1], 'token_set'))
-
-    if results:
-        best_match = max(results, key=lambda x: x[1])
-        return best_match[0]
-
-    return None
-
-def normalize_token(token):
-    token = token.lower()
-    for field in ["categories", "brands", "colors", "genders"]:
-        if field in SYNONYM_MAP:
-            for key, synonyms in SYNONYM_MAP[field].items():
-                if token in synonyms:
-                    return key
-    return token
-
-def apply_multiword_synonyms(query):
-    for pattern, replacement in MULTIWORD_SYNONYM_PATTERNS:
-        query = re.sub(pattern, replacement, query, flags=re.IGNORECASE)
-    return query
-
-def parse_query(query):
-    query = query.lower()
-    query = apply_multiword_synonyms(query)
-    doc = nlp(query)
-
+def parse_queries(queries, batch_size=None, n_process=None):
+    """
+    Parse many queries in one streaming nlp.pipe pass.
+
+    Yields one dict per query, in input order, with the same shape as
+    parse_query. Use for offline jobs over stored queries.
+    """
+    vocab = VOCABULARY.snapshot
+    synonyms = SYNONYMS.current
+    prepared = (prepare_query(q, synonyms) for q in queries)
+    docs = nlp.pipe(
+        prepared,
+        batch_size=batch_size or PARSER_CONFIG["batch_size"],
+        n_process=n_process or PARSER_CONFIG["n_process"],
+    )
+    for doc in docs:
+        yield parse_doc(doc.text, doc, synonyms, vocab)
+
+def parse_doc(query, doc, synonyms, vocab):
+    """
+    Extract filters and keywords from a prepared query and its spaCy doc
+    (or a list of FAST_PATH tokens).
+    """
     result = {
         "keywords": [],
         "category": None,
@@ -159,55 +277,76 @@ def parse_query(query):
             break
 
     seen_keywords = set()
-
-    for token in doc:
-        raw_text = token.text.lower()
-        lemma_text = token.lemma_.lower()
-
-        norm_token = normalize_token(raw_text)
-        norm_lemma = normalize_token(lemma_text)
+    timed = PARSE_METRICS.enabled
+
+    tokens = list(doc)
+    if timed:
+        start = time.perf_counter()
+    norm_tokens = [normalize_token(token.text.lower(), synonyms) for token in tokens]
+    norm_lemmas = [normalize_token(token.lemma_.lower(), synonyms) for token in tokens]
+    if timed:
+        PARSE_METRICS.observe("normalize", time.perf_counter() - start)
+        start = time.perf_counter()
+    cat_tokens = [LEMMATIZER.lemma(t) for t in norm_tokens]
+    cat_lemmas = [LEMMATIZER.lemma(l) for l in norm_lemmas]
+    if timed:
+        PARSE_METRICS.observe("lemma", time.perf_counter() - start)
+        start = time.perf_counter()
+
+    # Fuzzy candidates for every token and attribute in one vectorized pass.
+    # Tokens that are categories never reach the brand check, so skip them.
+    categories = vocab.category_set
+    brand_rows = [t not in categories and l not in categories for t, l in zip(norm_tokens, norm_lemmas)]
+    matches = get_matcher(vocab).match(cat_lemmas, norm_tokens, brand_rows)
+    if timed:
+        PARSE_METRICS.observe("fuzzy", time.perf_counter() - start)
+        PARSE_METRICS.observe_count("fuzzy_calls", matches.calls)
+
+    for i, token in enumerate(tokens):
+        norm_token = norm_tokens[i]
+        norm_lemma = norm_lemmas[i]
 
         # Category check first
         if result["category"] is None:
-            cat_token = nlp(norm_token)[0].lemma_
-            cat_lemma = nlp(norm_lemma)[0].lemma_
-            if cat_token in CATEGORIES:
+            cat_token = cat_tokens[i]
+            cat_lemma = cat_lemmas[i]
+            if cat_token in categories:
                 result["category"] = cat_token
                 continue
-            if cat_lemma in CATEGORIES:
+            if cat_lemma in categories:
                 result["category"] = cat_lemma
                 continue
-            cat = fuzzy_match(cat_lemma, CATEGORIES)
+            cat = matches.category[i]
             if cat:
                 result["category"] = cat
                 continue
 
         # Brand check only if not a category
-        if result["brand"] is None and norm_token not in CATEGORIES and norm_lemma not in CATEGORIES:
-            if norm_token in BRANDS:
+        if result["brand"] is None and norm_token not in categories and norm_lemma not in categories:
+            if norm_token in vocab.brand_set:
                 result["brand"] = norm_token
                 continue
-            br = fuzzy_match_brand(norm_token, BRANDS)
+            br = matches.brand[i]
             if br:
                 result["brand"] = br
                 continue
 
         # Color
         if result["color"] is None:
-            if norm_token in COLORS:
+            if norm_token in vocab.color_set:
                 result["color"] = norm_token
                 continue
-            col = fuzzy_match(norm_token, COLORS)
+            col = matches.color[i]
             if col:
                 result["color"] = col
                 continue
 
         # Gender
         if result["gender"] is None:
-            if norm_token in GENDERS:
+            if norm_token in vocab.gender_set:
                 result["gender"] = norm_token
                 continue
-            gen = fuzzy_match(norm_token, GENDERS)
+            gen = matches.gender[i]
             if gen:
                 result["gender"] = gen
                 continue
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+
+# none: writes become searchable on the index's own refresh_interval
+# wait_for: every write waits (refresh=wait_for) until it is searchable
+# debounce: writes mark the index dirty and one background refresh runs
+#           `delay` seconds after the first of them
+REFRESH_MODES = ("none", "wait_for", "debounce")
+
+
+class RefreshPolicy:
+    """
+    Decides when the product index is refreshed. Searches never refresh
+    unless the caller asks for read-your-writes, and then always do: the
+    write may come from another worker, main.py or the bulk loader, which
+    this process can't see.
+
+    Refreshes are coalesced: any number of writes inside the debounce
+    window cost one background refresh, and concurrent read-your-writes
+    searches share one synchronous refresh.
+
+    settled() tells the result cache when this process's writes may not be
+    searchable yet (a refresh is pending, or under none the index's own
+    refresh_interval, taken to be `delay`, hasn't passed); refresh_listeners
+    are called after every successful refresh.
+    """
+
+    def __init__(self, client, mode="debounce", delay=1.0):
+        if mode not in REFRESH_MODES:
+            raise ValueError(f"Unknown refresh policy '{mode}', expected one of {REFRESH_MODES}")
+        self.client = client
+        self.mode = mode
+        self.delay = delay
+        self._init_state()
+        self.writes = 0
+        self.refreshes = {"background": 0, "read_your_writes": 0, "explicit": 0}
+        self.skipped = 0
+        self.failures = 0
+        self.refresh_listeners = []
+        os.register_at_fork(after_in_child=self._init_state)
+
+    def _init_state(self):
+        # Pending timers don't survive a fork; a child starts clean
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._dirty = set()
+        self._timers = {}
+        # Per index: number of the last refresh started, and of the last
+        # one that succeeded
+        self._started = {}
+        self._succeeded = {}
+        # none: per index, when its last write is taken to be searchable
+        self._settle_at = {}
+
+    def write_refresh(self, read_your_writes=False):
+        """Value for a write's ``refresh`` parameter (None = don't send it)."""
+        if read_your_writes or self.mode == "wait_for":
+            return "wait_for"
+        return None
+
+    def after_write(self, index, refreshed=False):
+        """Record a write to index; refreshed=True if it used wait_for."""
+        self.writes += 1
+        if refreshed:
+            return
+        if self.mode == "none":
+            self._settle_at[index] = time.monotonic() + self.delay
+            return
+        if self.mode != "debounce":
+            return
+        self._schedule(index)
+
+    def _schedule(self, index):
+        """Mark index dirty and start its background refresh unless one is pending."""
+        with self._lock:
+            self._dirty.add(index)
+            if index in self._timers:
+                return
+            timer = threading.Timer(self.delay, self._flush, args=(index,))
+            timer.daemon = True
+            self._timers[index] = timer
+        timer.start()
+
+    def _flush(self, index):
+        with self._lock:
+            self._timers.pop(index, None)
+            if index not in self._dirty:
+                return
+            self._dirty.discard(index)
+        try:
+            self._refresh(index, "background")
+        except Exception:
+            pass  # _refresh scheduled another attempt
+
+    def _refresh(self, index, reason):
+        """
+        Refresh index. A failure is raised after scheduling a background
+        retry, so writes it should have made searchable aren't left behind.
+        """
+        with self._lock:
+            number = self._started[index] = self._started.get(index, 0) + 1
+        try:
+            self.client.refresh(index=index)
+            self.refreshes[reason] += 1
+            with self._lock:
+                self._succeeded[index] = max(self._succeeded.get(index, 0), number)
+            for listener in self.refresh_listeners:
+                listener(index)
+        except Exception as e:
+            self.failures += 1
+            print(f"⚠️ Refresh of {index} failed, retrying in {self.delay}s: {e}")
+            self._schedule(index)
+            raise
+
+    def ensure_visible(self, index):
+        """
+        Make every write to index acknowledged before this call searchable,
+        whichever process made it. Refreshes unless a refresh that started
+        after the call (a concurrent reader's, or the timer's) succeeded
+        meanwhile. Raises if the refresh fails.
+        """
+        with self._lock:
+            seen = self._started.get(index, 0)
+        with self._refresh_lock:
+            with self._lock:
+                if self._succeeded.get(index, 0) > seen:
+                    self.skipped += 1
+                    return
+                self._dirty.discard(index)
+            self._refresh(index, "read_your_writes")
+
+    def settled(self, index):
+        """False while a write to index made by this process may not be searchable yet."""
+        if index in self._dirty:
+            return False
+        return self._settle_at.get(index, 0) <= time.monotonic()
+
+    def refresh(self, index):
+        """Refresh index now (admin/bulk jobs), dropping any pending refresh; raises on failure."""
+        with self._lock:
+            self._dirty.discard(index)
+        self._refresh(index, "explicit")
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "delay": self.delay,
+            "writes": self.writes,
+            "refreshes": dict(self.refreshes),
+            "refreshes_skipped": self.skipped,
+            "refresh_failures": self.failures,
+            "pending": len(self._dirty),
+        }
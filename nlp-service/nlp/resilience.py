@@ -0,0 +1,233 @@
+"""
+Bounding Elasticsearch calls: request deadlines, a circuit breaker and
+hedged requests.
+
+A deadline is set once, where a request enters the API (``with
+deadline(2.0):``), and read by every Elasticsearch call made under it,
+including from tasks and threads started there (it lives in a
+contextvar). Each call's connect and read timeouts and the search
+``timeout`` Elasticsearch enforces on its shards are cut from what is left.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_DEADLINE = contextvars.ContextVar("es_deadline", default=None)
+
+# Share of the remaining time given to Elasticsearch's own search timeout,
+# so it answers with partial results before the client gives up
+SERVER_TIMEOUT_SHARE = 0.8
+
+
+class ElasticsearchUnavailable(Exception):
+    """Elasticsearch couldn't answer: connection error, timeout, 429 or 5xx."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class DeadlineExceeded(ElasticsearchUnavailable):
+    """The request's deadline passed before Elasticsearch answered."""
+
+
+class CircuitOpenError(ElasticsearchUnavailable):
+    """The circuit breaker is open: Elasticsearch is failing, calls fail fast."""
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Calls inside must finish within seconds (None or <= 0: no deadline). A
+    nested deadline never extends the one around it.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    expires_at = time.monotonic() + seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(expires_at if outer is None else min(outer, expires_at))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None without one."""
+    expires_at = _DEADLINE.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def call_timeouts(read, connect):
+    """
+    (connect, read) timeouts in seconds for one call, capped by what is left
+    of the current deadline (None: no limit). Raises DeadlineExceeded if it
+    has already passed.
+    """
+    left = remaining()
+    if left is None:
+        return connect, read
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded before calling Elasticsearch")
+    return (left if connect is None else min(connect, left)), (left if read is None else min(read, left))
+
+
+def server_timeout():
+    """Elasticsearch search ``timeout`` parameter for the current deadline ("850ms"), or None."""
+    left = remaining()
+    if left is None or left <= 0:
+        return None
+    return f"{max(1, int(left * SERVER_TIMEOUT_SHARE * 1000))}ms"
+
+
+def deadline_passed():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+class LatencyWindow:
+    """Latencies of the last ``size`` calls, for percentile thresholds."""
+
+    def __init__(self, size=1000, min_samples=50):
+        self.size = size
+        self.min_samples = min_samples
+        self._samples = []
+        self._next = 0
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            if len(self._samples) < self.size:
+                self._samples.append(seconds)
+            else:
+                self._samples[self._next] = seconds
+                self._next = (self._next + 1) % self.size
+            self._sorted = None
+
+    def percentile(self, p):
+        """p-th percentile in seconds, or None until min_samples are in."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            ordered = self._sorted
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class CircuitBreaker:
+    """
+    Closed while Elasticsearch answers. Opens when at least failure_ratio of
+    the last ``window`` calls (and min_calls of them) failed; while open,
+    calls fail at once with CircuitOpenError instead of each waiting out its
+    timeout. After reset_timeout seconds one probe call is let through
+    (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, enabled=True, window=20, failure_ratio=0.5, min_calls=10, reset_timeout=5.0):
+        self.enabled = enabled
+        self.window = window
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._outcomes = []
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go to Elasticsearch now."""
+        if not self.enabled or self.state == self.CLOSED:
+            return
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            if self.state == self.CLOSED:
+                return
+            self.rejected += 1
+        raise CircuitOpenError("Elasticsearch circuit breaker is open")
+
+    def record(self, success):
+        """Outcome of a call let through by before_call; None if it ended without one (cancelled)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if success is None:
+                self._probing = False
+                return
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    self._probing = False
+                    if success:
+                        self.state = self.CLOSED
+                        self._outcomes = []
+                    else:
+                        self._open()
+                return
+            if self.state == self.OPEN:
+                return  # a call started before the circuit opened
+            self._outcomes.append(success)
+            if len(self._outcomes) > self.window:
+                del self._outcomes[0]
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes = []
+        self.opened += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "open": self.state != self.CLOSED,
+            "half_open": self.state == self.HALF_OPEN,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+async def hedged(call, delay):
+    """
+    Await call(); if it hasn't finished after delay seconds, start it a
+    second time and take whichever succeeds first (the other is
+    cancelled). Returns (result, hedge): hedge is None when no second
+    attempt was needed, else whether it won. Raises if both attempts fail.
+    """
+    first = asyncio.ensure_future(call())
+    try:
+        return await asyncio.wait_for(asyncio.shield(first), delay), None
+    except asyncio.TimeoutError:
+        pass
+    except BaseException:
+        first.cancel()
+        raise
+    second = asyncio.ensure_future(call())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is second
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,157 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from nlp.json_codec import dumps
+
+
+def body_key(query_body):
+    """Stable hash of a search body (dict key order doesn't matter)."""
+    return hashlib.blake2b(dumps(query_body, sort_keys=True), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU + TTL cache of search results, bounded by their size in bytes.
+
+    Every index has a generation that writes and refreshes bump. Entries
+    remember the generation their search started under, and a lookup under
+    a newer one treats them as stale, so a product added or made visible
+    invalidates every cached result for its index without walking the cache.
+
+    Each entry also keeps the Elasticsearch round-trip time it cost, which a
+    hit adds to saved_seconds. Cached results are shared between callers,
+    who must copy before modifying them.
+
+    Stale and expired entries stay until they are replaced or evicted, so
+    get_stale can still answer while Elasticsearch is unavailable.
+
+    settled(index), if given, is False while a write to index may not be
+    searchable yet (e.g. RefreshPolicy.settled); a search started then
+    would store results from before the write, so it isn't cached.
+
+    Generations are per process: writes made by other workers or processes
+    reach this cache only through the TTL.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=30.0, settled=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.settled = settled
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.stale = 0
+        self.too_large = 0
+        self.unsettled = 0
+        self.served_stale = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def generation(self, index):
+        """Generation to store a search starting now under; None if it mustn't be cached."""
+        if self.settled is not None and not self.settled(index):
+            return None
+        return self._generations.get(index, 0)
+
+    def bump(self, index):
+        """A write or refresh touched index; its cached results are now stale."""
+        with self._lock:
+            self._generations[index] = self._generations.get(index, 0) + 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry[2]
+
+    def get(self, index, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((index, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            generation, expires_at, size, cost, result = entry
+            if generation != self._generations.get(index, 0):
+                self.stale += 1
+                self.misses += 1
+                return None
+            if expires_at < time.monotonic():
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end((index, key))
+            self.hits += 1
+            self.saved_seconds += cost
+        return result
+
+    def get_stale(self, index, key):
+        """The entry for key whatever its generation and age, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((index, key))
+            if entry is None:
+                return None
+            self.served_stale += 1
+        return entry[4]
+
+    def put(self, index, key, generation, result, cost=0.0):
+        """
+        Store result of a search that started under generation (so one
+        overtaken by a write is never stored as current); cost is its
+        round-trip time in seconds.
+        """
+        if not self.enabled:
+            return
+        if generation is None:
+            self.unsettled += 1
+            return
+        size = len(key) + len(dumps(result))
+        with self._lock:
+            if generation != self._generations.get(index, 0):
+                return
+            if size > self.max_bytes:
+                self.too_large += 1
+                return
+            if (index, key) in self._entries:
+                self._drop((index, key))
+            self._entries[(index, key)] = (generation, time.monotonic() + self.ttl, size, cost, result)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "stale": self.stale,
+            "too_large": self.too_large,
+            "unsettled": self.unsettled,
+            "served_stale": self.served_stale,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 6),
+            "generations": dict(self._generations),
+        }
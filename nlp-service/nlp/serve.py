@@ -0,0 +1,124 @@
+"""
+Pre-forking server for the search API.
+
+``uvicorn --workers N`` starts every worker as a fresh interpreter, so each
+one loads its own spaCy model, vocabulary and synonym index. This launcher
+imports the app once in a master process, freezes the loaded objects out
+of the garbage collector and forks the workers from it, so the model and
+vocabulary pages are shared copy-on-write between all of them.
+
+Run from nlp-service/:
+
+    python -m nlp.serve --workers 4 --port 8000
+
+Workers that die are restarted; SIGTERM / SIGINT stop the master and all
+workers.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def prepare_for_fork():
+    """
+    Move everything loaded so far out of the GC's reach. A collection in a
+    worker would otherwise touch (and so copy) every tracked object's page.
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, log_level):
+    import uvicorn
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, app, sock, workers, log_level="info"):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.children = set()
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.log_level)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self.children.add(pid)
+        print(f"👷 Started worker {pid}")
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.discard(pid)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            self.children.discard(pid)
+            if not self.stopping:
+                print(f"⚠️ Worker {pid} exited ({status}), restarting")
+                time.sleep(0.5)
+                self.spawn()
+        print("🛑 All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve nlp.main2:app from pre-forked workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    from nlp.main2 import app
+    print(f"✅ Loaded app in {time.perf_counter() - start:.1f}s, forking {args.workers} worker(s)")
+
+    sock = bind_socket(args.host, args.port)
+    prepare_for_fork()
+    Master(app, sock, args.workers, args.log_level).run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    (the leader) runs the function, callers arriving while it is in flight
+    wait and get its result, or its exception. Nothing is kept once the
+    call returns, so this never serves stale results; it only removes
+    duplicate work during bursts of identical requests.
+
+    SingleFlight is for threads; AsyncSingleFlight for coroutines on one
+    event loop.
+    """
+
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._init_state()
+        os.register_at_fork(after_in_child=self._init_state)
+
+    def _init_state(self):
+        # In-flight calls belong to the parent's threads; a child starts clean
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "executions": self.calls - self.coalesced,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "errors": self.errors,
+            "in_flight": len(self._calls),
+        }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    SingleFlight for coroutines. The leader's coroutine runs as a task that
+    every caller awaits through asyncio.shield, so a caller that goes away
+    (client disconnect) doesn't cancel the shared request for the others.
+    """
+
+    async def do(self, key, coro_fn):
+        if not self.enabled:
+            return await coro_fn()
+        # Tasks belong to one loop; keep flights of different loops apart
+        key = (id(asyncio.get_running_loop()), key)
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
@@ -0,0 +1,211 @@
+import threading
+
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+
+
+def _deletes(word, max_distance):
+    """All strings reachable from word by removing up to max_distance chars."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                next_frontier.add(w[:i] + w[i + 1:])
+        next_frontier -= results
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def _csr(lists):
+    """Offsets + flat int32 values for a list of int lists."""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(values) for values in lists])
+    flat = np.fromiter((v for values in lists for v in values), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, flat
+
+
+class DeletionIndex:
+    """
+    SymSpell-style symmetric-delete index over a vocabulary.
+
+    Every indexed key contributes the deletions of its first prefix_length
+    characters. A lookup generates the same deletions for the query token,
+    so finding all keys within max_distance edits is a handful of dict hits
+    instead of a scan over the vocabulary. Multi-word terms are also indexed
+    by each word so "balance" still finds "new balance".
+
+    Terms can be added at any time. Posting lists only ever grow by append,
+    which is atomic under the GIL, and a term is published in the id map
+    last, so readers never see a partially added term.
+
+    An index can also sit on a frozen base (see ``freeze``/``from_frozen``):
+    sorted numpy arrays that can be memory-mapped from a vocabulary
+    artifact. Terms added afterwards go to the regular dict overlay.
+    """
+
+    def __init__(self, terms=(), max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._lock = threading.Lock()
+        self._terms = []          # term id -> term
+        self._term_ids = {}       # term -> term id
+        self._keys = {}           # key -> list of term ids (overlay)
+        self._deletes = {}        # deletion -> list of keys (overlay)
+        self._base = None
+        self._base_key_ids = None
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, term):
+        return term.lower() in self._term_ids
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _in_base(self, key):
+        if self._base is None:
+            return False
+        if self._base_key_ids is None:
+            # Only needed by add(), so built on the first write after a load
+            self._base_key_ids = {k: i for i, k in enumerate(self._base["keys"])}
+        return key in self._base_key_ids
+
+    def add(self, term):
+        """Index a term. Returns False if it was already present."""
+        term = term.lower()
+        if not term or term in self._term_ids:
+            return False
+
+        with self._lock:
+            if term in self._term_ids:
+                return False
+            term_id = len(self._terms)
+            self._terms.append(term)
+
+            keys = [term] + [w for w in term.split() if w != term]
+            for key in dict.fromkeys(keys):
+                if key in self._keys:
+                    self._keys[key].append(term_id)
+                    continue
+                self._keys[key] = [term_id]
+                if self._in_base(key):
+                    # Deletions of a base key are already in the base arrays
+                    continue
+                for deletion in _deletes(key[:self.prefix_length], self.max_distance):
+                    postings = self._deletes.get(deletion)
+                    if postings is None:
+                        self._deletes[deletion] = [key]
+                    else:
+                        postings.append(key)
+
+            self._term_ids[term] = term_id
+        return True
+
+    def _base_lookup(self, deletions):
+        """Base key ids for every deletion present in the frozen arrays."""
+        base = self._base
+        table = base["deletions"]
+        if not len(table):
+            return {}
+        queries = np.array(deletions, dtype=table.dtype)
+        pos = np.searchsorted(table, queries)
+        pos[pos >= len(table)] = len(table) - 1
+        found = {}
+        offsets, flat = base["deletion_offsets"], base["deletion_keys"]
+        for i in np.nonzero(table[pos] == queries)[0]:
+            p = pos[i]
+            for key_id in flat[offsets[p]:offsets[p + 1]]:
+                found[base["keys"][key_id]] = int(key_id)
+        return found
+
+    def candidates(self, token, max_distance=None):
+        """
+        Terms with a key within max_distance edits of token, in the order the
+        terms were added.
+        """
+        token = token.lower()
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+
+        deletions = _deletes(token[:self.prefix_length], max_distance)
+        keys = set()
+        for deletion in deletions:
+            keys.update(self._deletes.get(deletion, ()))
+        base_keys = self._base_lookup(list(deletions)) if self._base is not None else {}
+        keys.update(base_keys)
+
+        term_ids = set()
+        for key in keys:
+            if Levenshtein.distance(token, key, score_cutoff=max_distance) <= max_distance:
+                term_ids.update(self._keys.get(key, ()))
+                key_id = base_keys.get(key)
+                if key_id is not None:
+                    offsets, flat = self._base["key_offsets"], self._base["key_terms"]
+                    term_ids.update(flat[offsets[key_id]:offsets[key_id + 1]].tolist())
+
+        # Ids of terms still being added are not published yet
+        count = len(self._term_ids)
+        return [self._terms[i] for i in sorted(term_ids) if i < count]
+
+    def freeze(self):
+        """
+        Flatten the whole index (base + overlay) into plain lists and numpy
+        arrays suitable for ``from_frozen``.
+        """
+        with self._lock:
+            key_terms = {}
+            if self._base is not None:
+                offsets, flat = self._base["key_offsets"], self._base["key_terms"]
+                for key_id, key in enumerate(self._base["keys"]):
+                    key_terms[key] = flat[offsets[key_id]:offsets[key_id + 1]].tolist()
+            for key, term_ids in self._keys.items():
+                key_terms.setdefault(key, []).extend(term_ids)
+
+            keys = list(key_terms)
+            key_ids = {key: i for i, key in enumerate(keys)}
+            deletions = {}
+            for key in keys:
+                for deletion in _deletes(key[:self.prefix_length], self.max_distance):
+                    deletions.setdefault(deletion, []).append(key_ids[key])
+
+            ordered = sorted(deletions)
+            key_offsets, key_flat = _csr([key_terms[key] for key in keys])
+            deletion_offsets, deletion_flat = _csr([deletions[d] for d in ordered])
+            return {
+                "max_distance": self.max_distance,
+                "prefix_length": self.prefix_length,
+                "terms": list(self._terms),
+                "keys": keys,
+                "arrays": {
+                    "deletions": np.array(ordered, dtype=f"<U{max(self.prefix_length, 1)}"),
+                    "deletion_offsets": deletion_offsets,
+                    "deletion_keys": deletion_flat,
+                    "key_offsets": key_offsets,
+                    "key_terms": key_flat,
+                },
+            }
+
+    @classmethod
+    def from_frozen(cls, frozen, arrays=None):
+        """
+        Rebuild an index from ``freeze`` output. arrays may be passed
+        separately, e.g. as zero-copy views of a memory-mapped file.
+        """
+        index = cls(max_distance=frozen["max_distance"], prefix_length=frozen["prefix_length"])
+        index._terms = list(frozen["terms"])
+        index._term_ids = {term: i for i, term in enumerate(index._terms)}
+        index._base = dict(arrays if arrays is not None else frozen["arrays"], keys=frozen["keys"])
+        return index
@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+
+# Order in which synonym.json sections are compiled. The first section that
+# claims a synonym wins, which mirrors the old linear scan in normalize_token.
+SYNONYM_FIELDS = ["categories", "brands", "colors", "genders"]
+
+# Phrase rewrites that used to be hard-coded regexes in query_parser. They are
+# applied before the field synonyms so existing behaviour is preserved.
+PHRASE_FIELD = "phrases"
+
+_END = object()
+
+
+def _is_boundary(text, pos):
+    """True when pos is at the edge of a word in text."""
+    return pos <= 0 or pos >= len(text) or not text[pos - 1].isalnum() or not text[pos].isalnum()
+
+
+class SynonymIndex:
+    """
+    Immutable, compiled view of synonym.json.
+
+    Single words are resolved through a reverse dict (synonym -> canonical key)
+    and the phrases section through a character trie that is walked once over
+    the query, always taking the longest phrase that starts at a word boundary.
+    """
+
+    def __init__(self, data, version=0):
+        self.version = version
+        self.reverse = {}
+        self.trie = {}
+        self.phrase_count = 0
+        self.canonical = set()
+
+        for key, phrases in data.get(PHRASE_FIELD, {}).items():
+            self.canonical.add(key)
+            for phrase in phrases:
+                phrase = phrase.lower().strip()
+                if phrase:
+                    self._add_phrase(phrase, key)
+
+        # Field synonyms are looked up one lowercased token at a time and
+        # compared as written, as before: multi-word entries ("hp laptops")
+        # and ones with capitals ("TVs") never match, so they are skipped
+        for field in SYNONYM_FIELDS:
+            for key, synonyms in data.get(field, {}).items():
+                self.canonical.add(key)
+                for synonym in synonyms:
+                    if synonym and " " not in synonym and synonym == synonym.lower():
+                        self.reverse.setdefault(synonym, key)
+
+    def _add_phrase(self, phrase, replacement):
+        node = self.trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        if _END not in node:
+            node[_END] = replacement
+            self.phrase_count += 1
+
+    def normalize(self, token):
+        """Map a single token to its canonical key, or return it lowercased."""
+        token = token.lower()
+        return self.reverse.get(token, token)
+
+    def rewrite(self, text):
+        """Replace every multi-word synonym in text with its canonical key."""
+        if not self.trie:
+            return text
+
+        lowered = text.lower()
+        out = []
+        i = 0
+        last = 0
+        n = len(lowered)
+        while i < n:
+            if lowered[i] in self.trie and _is_boundary(lowered, i):
+                node = self.trie
+                j = i
+                match_end = None
+                replacement = None
+                while j < n and lowered[j] in node:
+                    node = node[lowered[j]]
+                    j += 1
+                    if _END in node and _is_boundary(lowered, j):
+                        match_end = j
+                        replacement = node[_END]
+                if match_end is not None:
+                    out.append(text[last:i])
+                    out.append(replacement)
+                    i = last = match_end
+                    continue
+            i += 1
+
+        if last == 0:
+            return text
+        out.append(text[last:])
+        return "".join(out)
+
+
+class ReloadingSynonymIndex:
+    """
+    Holds the current SynonymIndex for a synonym file and swaps in a freshly
+    compiled one when the file changes on disk.
+
+    Readers only ever dereference ``current``; the rebuild happens off the
+    request path (in the watcher thread or an explicit ``reload_if_changed``)
+    and is published with a single attribute assignment, so in-flight queries
+    keep using the index they started with.
+    """
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._watcher = None
+        self.current = SynonymIndex({})
+        self.reload_if_changed(force=True)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The watcher thread doesn't survive a fork and may have held the lock
+        watching = self._watcher is not None
+        self._lock = threading.Lock()
+        self._watcher = None
+        if watching:
+            self.start_watcher()
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def reload_if_changed(self, force=False):
+        """Rebuild the index if the file's mtime moved. Returns True on swap."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                print(f"⚠️ Could not stat synonym file {self.path}: {e}")
+                return False
+            if not force and mtime == self._mtime:
+                return False
+
+            try:
+                index = SynonymIndex(self._load(), version=self.current.version + 1)
+            except (OSError, ValueError) as e:
+                # Keep serving the previous index while the file is mid-edit
+                print(f"⚠️ Failed to reload synonyms, keeping previous index: {e}")
+                return False
+
+            self._mtime = mtime
+            self.current = index
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            if self.reload_if_changed():
+                print(f"🔄 Reloaded synonyms from {self.path} (version {self.current.version})")
+
+    def start_watcher(self):
+        """Start a daemon thread that polls the file for changes."""
+        if self.interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._watcher = threading.Thread(target=self._watch, name="synonym-watcher", daemon=True)
+        self._watcher.start()
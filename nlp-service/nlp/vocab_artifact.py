@@ -0,0 +1,323 @@
+"""
+Precompiled vocabulary artifact.
+
+Building the parser vocabulary at startup means lemmatizing every term with
+spaCy and generating the deletion index for every brand, which takes
+seconds to minutes once the catalogue is large, and every worker pays it
+again. This module does that work once, offline, and writes the result to
+a single file that workers memory-map at import time.
+
+File layout (little endian)::
+
+    MAGIC | u32 header length | JSON header | pickled payload | aligned arrays
+
+The header carries the format version, the settings the artifact was built
+with and an offset table for the numpy arrays, so a worker can reject an
+incompatible file before touching the rest. The payload holds the
+vocabulary lists, the lemma table and the deletion index key lists; the
+arrays are the frozen deletion indexes, read back as zero-copy views.
+
+The synonym index is not stored: it compiles from synonym.json in well
+under a millisecond and is hot-reloaded, so a copy here would only be a
+second version of the file to keep in step. The lemma table does cover
+the canonical synonym keys known at build time.
+
+Build one from the product catalogue (run from nlp-service/)::
+
+    python -m nlp.vocab_artifact build --source mongo --output vocab.bin
+    python -m nlp.vocab_artifact build --source es --output vocab.bin
+    python -m nlp.vocab_artifact build --source json --input terms.json --output vocab.bin
+"""
+
+import argparse
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+
+import numpy as np
+import spacy
+
+from nlp.config import PARSER_CONFIG
+from nlp.symspell import DeletionIndex
+from nlp.vocabulary import PRODUCT_FIELDS, VOCABULARY_FIELDS, VocabularySnapshot
+
+MAGIC = b"NLPVOCAB"
+FORMAT_VERSION = 1
+
+# Array data starts on this boundary so views are properly aligned
+_ALIGN = 64
+
+
+def artifact_settings():
+    """Settings an artifact must have been built with to be usable here."""
+    return {
+        "format_version": FORMAT_VERSION,
+        "spacy_model": PARSER_CONFIG["spacy_model"],
+        "spacy_profile": PARSER_CONFIG["spacy_profile"],
+        "spacy_version": spacy.__version__,
+        "fuzzy_index_distance": PARSER_CONFIG["fuzzy_index_distance"],
+        "fuzzy_index_prefix_length": PARSER_CONFIG["fuzzy_index_prefix_length"],
+    }
+
+
+class VocabularyArtifact:
+    """Everything the parser needs to start without lemmatizing or indexing."""
+
+    def __init__(self, settings, snapshot, lemma_table, indexes):
+        self.settings = settings
+        self.snapshot = snapshot
+        self.lemma_table = lemma_table
+        self.indexes = indexes
+
+
+def _pad(size):
+    return (-size) % _ALIGN
+
+
+def save_artifact(path, snapshot, lemma_table, indexes, settings=None):
+    """
+    Write snapshot, lemma table and deletion indexes to path. The file is
+    written next to path and renamed into place, so a worker starting
+    mid-build never sees a partial artifact.
+    """
+    settings = dict(settings or artifact_settings())
+
+    payload = {
+        "vocabulary": {
+            "raw_categories": list(snapshot.raw_categories),
+            "categories": list(snapshot.categories),
+            "brands": list(snapshot.brands),
+            "colors": list(snapshot.colors),
+            "genders": list(snapshot.genders),
+        },
+        "lemma_table": dict(lemma_table),
+        "indexes": {},
+    }
+    arrays = []
+    for field, index in indexes.items():
+        frozen = index.freeze()
+        payload["indexes"][field] = {
+            "max_distance": frozen["max_distance"],
+            "prefix_length": frozen["prefix_length"],
+            "terms": frozen["terms"],
+            "keys": frozen["keys"],
+        }
+        for name, array in frozen["arrays"].items():
+            arrays.append((f"{field}/{name}", np.ascontiguousarray(array)))
+    payload_bytes = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Offsets in the table are relative to the start of the array region
+    table = {}
+    offset = 0
+    for name, array in arrays:
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes + _pad(array.nbytes)
+
+    header = dict(settings, payload_size=len(payload_bytes), arrays=table)
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload_bytes)
+        f.write(b"\0" * _pad(f.tell()))
+        for _, array in arrays:
+            f.write(array.tobytes())
+            f.write(b"\0" * _pad(array.nbytes))
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    """Header of an artifact, or raise ValueError if it is not one."""
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a vocabulary artifact")
+        (header_size,) = struct.unpack("<I", f.read(4))
+        return json.loads(f.read(header_size)), len(MAGIC) + 4 + header_size
+
+
+def load_artifact(path, expected=None):
+    """
+    Memory-map the artifact at path. Returns None (after saying why) when the
+    file is missing or was built with different settings, so the caller can
+    fall back to building the vocabulary itself.
+    """
+    if not path:
+        return None
+    expected = expected or artifact_settings()
+    try:
+        header, payload_start = read_header(path)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Vocabulary artifact not loaded, building vocabulary instead: {e}")
+        return None
+
+    mismatched = {k: (header.get(k), v) for k, v in expected.items() if header.get(k) != v}
+    if mismatched:
+        details = ", ".join(f"{k}={found!r} (want {want!r})" for k, (found, want) in mismatched.items())
+        print(f"⚠️ Vocabulary artifact {path} is incompatible ({details}), building vocabulary instead")
+        return None
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        payload_end = payload_start + header["payload_size"]
+        payload = pickle.loads(mapped[payload_start:payload_end])
+        array_start = payload_end + _pad(payload_end)
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            array = np.frombuffer(mapped, dtype=dtype, count=count, offset=array_start + spec["offset"])
+            field, array_name = name.split("/", 1)
+            arrays.setdefault(field, {})[array_name] = array.reshape(spec["shape"])
+
+        indexes = {
+            field: DeletionIndex.from_frozen(frozen, arrays.get(field, {}))
+            for field, frozen in payload["indexes"].items()
+        }
+        vocabulary = payload["vocabulary"]
+        snapshot = VocabularySnapshot(version=0, **vocabulary)
+    except Exception as e:
+        # Truncated or corrupt past the header (e.g. a copy cut short)
+        print(f"⚠️ Vocabulary artifact {path} is damaged, building vocabulary instead: {e!r}")
+        return None
+    settings = {k: header[k] for k in expected if k in header}
+    return VocabularyArtifact(settings, snapshot, payload["lemma_table"], indexes)
+
+
+def fetch_terms_from_mongo(uri, database, collection):
+    """Distinct category/brand/color/gender values in a product collection."""
+    from pymongo import MongoClient
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    try:
+        products = client[database][collection]
+        return {field: [v for v in products.distinct(product_field) if isinstance(v, str)]
+                for product_field, field in PRODUCT_FIELDS.items()}
+    finally:
+        client.close()
+
+
+def fetch_terms_from_es(index, page_size=1000):
+    """Distinct category/brand/color/gender values in the product index."""
+    from nlp.es_query import es
+
+    terms = {}
+    for product_field, field in PRODUCT_FIELDS.items():
+        values = []
+        after = None
+        while True:
+            composite = {"size": page_size, "sources": [{"term": {"terms": {"field": product_field}}}]}
+            if after:
+                composite["after"] = after
+            body = {"size": 0, "aggs": {"values": {"composite": composite}}}
+            result = es.search(index, body)["aggregations"]["values"]
+            values.extend(bucket["key"]["term"] for bucket in result["buckets"])
+            after = result.get("after_key")
+            if not after or not result["buckets"]:
+                break
+        terms[field] = values
+    return terms
+
+
+def build_artifact(terms, nlp=None):
+    """
+    Compile the default vocabulary plus terms ({field: [values]}) into a
+    VocabularyArtifact. Lemmatization runs in one nlp.pipe pass per field.
+    """
+    from nlp import query_parser
+    from nlp.lemmatizer import CachedLemmatizer
+    from nlp.synonym_index import ReloadingSynonymIndex
+    from nlp.vocabulary import VocabularyRegistry
+
+    nlp = nlp or query_parser.nlp
+
+    def lemmatize_all(values):
+        return [[token.lemma_ for token in doc] for doc in nlp.pipe(values)]
+
+    defaults = {
+        "categories": query_parser.DEFAULT_CATEGORIES,
+        "brands": query_parser.DEFAULT_BRANDS,
+        "colors": query_parser.DEFAULT_COLORS,
+        "genders": query_parser.DEFAULT_GENDERS,
+    }
+    merged = {field: list(defaults[field]) + list(terms.get(field, ())) for field in VOCABULARY_FIELDS}
+
+    raw_categories = list(dict.fromkeys(c.lower() for c in merged["categories"] if c))
+    category_lemmas = {c: lemmas for c, lemmas in zip(raw_categories, lemmatize_all(raw_categories))}
+    registry = VocabularyRegistry(lambda term: category_lemmas[term], categories=raw_categories,
+                                  brands=merged["brands"], colors=merged["colors"], genders=merged["genders"])
+    snapshot = registry.snapshot
+
+    lemmatizer = CachedLemmatizer(nlp)
+    synonyms = ReloadingSynonymIndex(PARSER_CONFIG["synonym_path"], interval=0).current
+    lemmatizer.preload(
+        list(snapshot.raw_categories + snapshot.categories + snapshot.colors + snapshot.genders + snapshot.brands)
+        + sorted(synonyms.canonical)
+    )
+
+    indexes = {
+        "categories": query_parser.build_fuzzy_index(snapshot.categories),
+        "brands": query_parser.build_fuzzy_index(snapshot.brands),
+        "colors": query_parser.build_fuzzy_index(snapshot.colors),
+        "genders": query_parser.build_fuzzy_index(snapshot.genders),
+    }
+    return VocabularyArtifact(artifact_settings(), snapshot, lemmatizer.table(), indexes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a precompiled parser vocabulary artifact")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="compile the vocabulary from the product catalogue")
+    build.add_argument("--source", choices=["mongo", "es", "json"], required=True)
+    build.add_argument("--output", default=PARSER_CONFIG["vocab_artifact_path"] or "vocab.bin")
+    build.add_argument("--input", help="JSON file of {field: [terms]} for --source json")
+    build.add_argument("--mongo-uri", default=os.getenv("MONGO_URI"))
+    build.add_argument("--mongo-db", default=os.getenv("MONGO_DB", "ecommerce"))
+    build.add_argument("--mongo-collection", default="products")
+    build.add_argument("--es-index", default=os.getenv("ELASTICSEARCH_INDEX", "products"))
+
+    info = sub.add_parser("info", help="print an artifact's header")
+    info.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "info":
+        header, _ = read_header(args.path)
+        arrays = header.pop("arrays")
+        print(json.dumps(header, indent=2))
+        print(f"{len(arrays)} arrays")
+        return
+
+    start = time.perf_counter()
+    if args.source == "mongo":
+        if not args.mongo_uri:
+            parser.error("--mongo-uri (or MONGO_URI) is required for --source mongo")
+        terms = fetch_terms_from_mongo(args.mongo_uri, args.mongo_db, args.mongo_collection)
+    elif args.source == "es":
+        terms = fetch_terms_from_es(args.es_index)
+    else:
+        if not args.input:
+            parser.error("--input is required for --source json")
+        with open(args.input, "r") as f:
+            terms = json.load(f)
+    print(f"📥 Fetched {sum(len(v) for v in terms.values())} terms from {args.source}")
+
+    artifact = build_artifact(terms)
+    save_artifact(args.output, artifact.snapshot, artifact.lemma_table, artifact.indexes, artifact.settings)
+    sizes = ", ".join(f"{len(artifact.snapshot.terms(f))} {f}" for f in VOCABULARY_FIELDS)
+    print(f"✅ Wrote {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB: {sizes}) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
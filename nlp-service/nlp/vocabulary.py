@@ -0,0 +1,151 @@
+import threading
+
+VOCABULARY_FIELDS = ("categories", "brands", "colors", "genders")
+
+# Product field that feeds each vocabulary
+PRODUCT_FIELDS = {
+    "category": "categories",
+    "brand": "brands",
+    "color": "colors",
+    "gender": "genders",
+}
+
+# Set checked by VocabularySnapshot.contains for each vocabulary
+_MEMBERSHIP_SETS = {
+    "categories": "raw_category_set",
+    "brands": "brand_set",
+    "colors": "color_set",
+    "genders": "gender_set",
+}
+
+
+class VocabularySnapshot:
+    """
+    Immutable view of the vocabulary at one version.
+
+    Terms are kept as tuples in insertion order (what fuzzy matching ranks
+    ties by) and as frozensets for O(1) membership. ``categories`` holds the
+    lemmas of ``raw_categories``, which is what the parser matches against.
+    """
+
+    __slots__ = (
+        "version", "raw_categories", "categories", "brands", "colors", "genders",
+        "raw_category_set", "category_set", "brand_set", "color_set", "gender_set",
+    )
+
+    def __init__(self, version, raw_categories, categories, brands, colors, genders):
+        self.version = version
+        self.raw_categories = tuple(raw_categories)
+        self.categories = tuple(categories)
+        self.brands = tuple(brands)
+        self.colors = tuple(colors)
+        self.genders = tuple(genders)
+        self.raw_category_set = frozenset(self.raw_categories)
+        self.category_set = frozenset(self.categories)
+        self.brand_set = frozenset(self.brands)
+        self.color_set = frozenset(self.colors)
+        self.gender_set = frozenset(self.genders)
+
+    def terms(self, field):
+        return self.raw_categories if field == "categories" else getattr(self, field)
+
+    def contains(self, field, term):
+        return term in getattr(self, _MEMBERSHIP_SETS[field])
+
+    def with_term(self, field, term, lemmas=()):
+        """New snapshot with term (and, for categories, its new lemmas) added."""
+        snapshot = VocabularySnapshot.__new__(VocabularySnapshot)
+        for slot in self.__slots__:
+            setattr(snapshot, slot, getattr(self, slot))
+        snapshot.version = self.version + 1
+
+        # Only the touched vocabulary is copied; the others are shared
+        terms_slot = "raw_categories" if field == "categories" else field
+        set_slot = _MEMBERSHIP_SETS[field]
+        setattr(snapshot, terms_slot, getattr(self, terms_slot) + (term,))
+        setattr(snapshot, set_slot, getattr(self, set_slot) | {term})
+        if lemmas:
+            snapshot.categories = self.categories + tuple(lemmas)
+            snapshot.category_set = self.category_set | set(lemmas)
+        return snapshot
+
+    def as_lists(self):
+        """Plain lists of the raw terms, as returned by /lists."""
+        return {field: list(self.terms(field)) for field in VOCABULARY_FIELDS}
+
+
+class VocabularyRegistry:
+    """
+    Copy-on-write registry of the parser vocabulary.
+
+    Writers serialize on a lock, build a new snapshot that shares nothing
+    mutable with the old one and publish it with a single assignment.
+    Readers take ``snapshot`` once and use it for the whole request, so a
+    concurrent /add-product can never show them a half-updated vocabulary.
+
+    ``lemmatize(term)`` returns the lemmas of a new category; only the new
+    term is lemmatized. Listeners are called as ``listener(field, term,
+    snapshot)`` with the new snapshot before it is published, so derived
+    structures (lemma table, fuzzy indexes) are ready when readers see it.
+
+    ``snapshot`` starts the registry from a prebuilt snapshot (e.g. one
+    loaded from a vocabulary artifact) instead of the given term lists.
+    """
+
+    def __init__(self, lemmatize, categories=(), brands=(), colors=(), genders=(), snapshot=None):
+        self._lemmatize = lemmatize
+        self._lock = threading.Lock()
+        self._listeners = []
+        if snapshot is not None:
+            self.snapshot = snapshot
+            return
+
+        raw_categories = list(dict.fromkeys(c.lower() for c in categories))
+        lemmas = [lemma for c in raw_categories for lemma in lemmatize(c)]
+        self.snapshot = VocabularySnapshot(
+            version=0,
+            raw_categories=raw_categories,
+            categories=dict.fromkeys(lemmas),
+            brands=dict.fromkeys(b.lower() for b in brands),
+            colors=dict.fromkeys(c.lower() for c in colors),
+            genders=dict.fromkeys(g.lower() for g in genders),
+        )
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add(self, field, term):
+        """Add term to a vocabulary. Returns True if it was new."""
+        if field not in VOCABULARY_FIELDS:
+            raise ValueError(f"Unknown vocabulary '{field}', expected one of {VOCABULARY_FIELDS}")
+        term = (term or "").strip().lower()
+        if not term or self.snapshot.contains(field, term):
+            return False
+
+        with self._lock:
+            current = self.snapshot
+            if current.contains(field, term):
+                return False
+
+            lemmas = ()
+            if field == "categories":
+                lemmas = [l for l in dict.fromkeys(self._lemmatize(term)) if l not in current.category_set]
+
+            snapshot = current.with_term(field, term, lemmas)
+            for listener in self._listeners:
+                listener(field, term, snapshot)
+            self.snapshot = snapshot
+        return True
+
+    def update_from_product(self, product):
+        """Learn category/brand/color/gender from a product dict."""
+        added = []
+        for product_field, field in PRODUCT_FIELDS.items():
+            value = product.get(product_field)
+            if value and self.add(field, value):
+                added.append((field, value))
+        return added